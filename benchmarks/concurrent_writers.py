@@ -0,0 +1,76 @@
+"""
+Stress benchmark: several processes writing metrics to the same local database.
+
+    python benchmarks/concurrent_writers.py --writers 8 --metrics 20000 --batch-size 100
+
+Each writer opens its own DBHandler, registers a session and inserts metrics as pytest-monitor
+would. The script reports the sustained insert throughput and checks that no metric was lost.
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from pytest_monitor.handler import DBHandler
+
+
+def write(db_path, writer, metrics, batch_size):
+    handler = DBHandler(db_path, batch_size=batch_size)
+    handler.insert_session(f"session_{writer}", time.time_ns(), "", "{}")
+    for i in range(metrics):
+        handler.insert_metric(
+            f"session_{writer}",
+            "env",
+            time.time_ns(),
+            f"test_{i % 500}",
+            "benchmarks",
+            f"test_{i % 500}",
+            "benchmarks/test_module.py",
+            "function",
+            "",
+            0.001,
+            0.001,
+            0.0,
+            1.0,
+            42.0,
+        )
+    handler.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8, help="Number of concurrent writer processes.")
+    parser.add_argument("--metrics", type=int, default=20000, help="Number of metrics inserted by each writer.")
+    parser.add_argument("--batch-size", type=int, default=100, help="Number of metrics written per transaction.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, ".pymon")
+        DBHandler(db_path).close()
+        with sqlite3.connect(db_path) as cnx:
+            cnx.execute("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')")
+
+        writers = [
+            multiprocessing.Process(target=write, args=(db_path, writer, args.metrics, args.batch_size))
+            for writer in range(args.writers)
+        ]
+        start = time.perf_counter()
+        for process in writers:
+            process.start()
+        for process in writers:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        failed = sum(process.exitcode != 0 for process in writers)
+        stored = sqlite3.connect(db_path).execute("SELECT COUNT(*) FROM ITEM_METRICS").fetchone()[0]
+        expected = args.writers * args.metrics
+        print(f"{args.writers} writers, batches of {args.batch_size}: {stored}/{expected} metrics stored")
+        print(f"{elapsed:.2f}s elapsed, {stored / elapsed:,.0f} inserts/s, {failed} writer(s) failed")
+        if failed or stored != expected:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Overhead benchmark: time spent by pytest-monitor on trivial tests.
+
+    python benchmarks/plugin_overhead.py --tests 10000
+
+Runs generated trivial tests without the plugin, then with it (storing metrics in a temporary
+database), and reports the overhead per test, for monitored tests and for tests marked with
+monitor_skip_test. Extra pytest arguments given after '--' are passed to the monitored runs,
+e.g. '-- --no-gc' or '-- --restrict-scope-to function,module'.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+TEST_MODULE = """
+import pytest
+
+
+@pytest.mark.parametrize("i", range({count}))
+def test_monitored(i):
+    assert True
+
+
+@pytest.mark.monitor_skip_test
+@pytest.mark.parametrize("i", range({count}))
+def test_skipped(i):
+    assert True
+"""
+
+
+def run(directory, *args):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", *args],
+        cwd=directory,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tests", type=int, default=10000, help="Number of trivial tests of each kind.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each configuration (best is kept).")
+    parser.add_argument("pytest_args", nargs="*", help="Extra arguments of the monitored run.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "test_overhead.py"), "w") as f:
+            f.write(TEST_MODULE.format(count=args.tests))
+        db = os.path.join(tmp, ".pymon")
+        for kind in ("monitored", "skipped"):
+            selection = ("-k", f"test_{kind}")
+            bare = min(run(tmp, *selection, "-p", "no:monitor") for _ in range(args.repeat))
+            monitored = min(run(tmp, *selection, "--db", db, *args.pytest_args) for _ in range(args.repeat))
+            print(
+                f"{args.tests} {kind} tests: {bare:.2f}s without pytest-monitor, {monitored:.2f}s with it,"
+                f" overhead {(monitored - bare) / args.tests * 1e6:.0f}us per test"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import os
+
+from pytest_monitor.export import export
+from pytest_monitor.handler import DBHandler
+from pytest_monitor.query import top_fixtures
+
+
+def open_db(db_path):
+    """Open an existing database: a mistyped path must not silently create a new one."""
+    if not os.path.exists(db_path):
+        raise SystemExit(f"pytest-monitor: no database found at {db_path}.")
+    return DBHandler(db_path)
+
+
+def retention(args):
+    if args.keep_sessions is None and args.keep_days is None:
+        raise SystemExit("pytest-monitor: retention requires --keep-sessions and/or --keep-days.")
+    db = open_db(args.db)
+    sessions, metrics = db.apply_retention(args.keep_sessions, args.keep_days, vacuum=False)
+    if not args.no_vacuum:
+        db.compact()
+    db.close()
+    print(f"{sessions} session(s) rolled up, {metrics} metric(s) deleted.")
+
+
+def compact(args):
+    db = open_db(args.db)
+    db.compact()
+    db.close()
+
+
+def upgrade(args):
+    db = open_db(args.db)
+    version = db.schema_version()
+    db.close()
+    print(f"Database at schema version {version}.")
+
+
+def export_db(args):
+    exported = export(args.db, args.output, chunk_size=args.chunk_size, full=args.full)
+    print(", ".join(f"{count} row(s) exported from {table}" for table, count in exported.items()) + ".")
+
+
+def fixtures(args):
+    rows = list(top_fixtures(args.db, n=args.n, by=args.by, session_h=args.session))
+    print(f"{'FIXTURE':<40} {'SCOPE':<8} {'SETUPS':>8} {'TIME (s)':>10} {'MEMORY (MB)':>12}")
+    for name, path, scope, count, total_time, mem_usage in rows:
+        print(f"{f'{path}.{name}' if path else name:<40} {scope:<8} {count:>8} {total_time:>10.3f} {mem_usage:>12.1f}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pytest-monitor", description="Maintenance of pytest-monitor databases.")
+    parser.add_argument("--db", default=".pymon", help="Path to the sqlite database (default: .pymon).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser("retention", help="Roll up and delete the raw metrics of old sessions.")
+    cmd.add_argument("--keep-sessions", type=int, help="Number of most recent sessions whose raw metrics are kept.")
+    cmd.add_argument("--keep-days", type=float, help="Number of days during which raw metrics are kept.")
+    cmd.add_argument("--no-vacuum", action="store_true", help="Do not reclaim the space freed by deleted metrics.")
+    cmd.set_defaults(func=retention)
+
+    cmd = commands.add_parser("compact", help="Reclaim the space freed by deleted metrics.")
+    cmd.set_defaults(func=compact)
+
+    cmd = commands.add_parser("upgrade", help="Upgrade the database to the schema of this release.")
+    cmd.set_defaults(func=upgrade)
+
+    cmd = commands.add_parser("export", help="Export the database to memory-mappable NumPy files.")
+    cmd.add_argument("output", help="Directory receiving the exported data.")
+    cmd.add_argument("--chunk-size", type=int, default=100000, help="Maximum number of rows per exported part.")
+    cmd.add_argument(
+        "--full", action="store_true", help="Export everything, not only the sessions added since the last export."
+    )
+    cmd.set_defaults(func=export_db)
+
+    cmd = commands.add_parser("fixtures", help="Report the fixtures costing the most (see --monitor-fixtures).")
+    cmd.add_argument("--by", choices=["time", "memory"], default="time", help="Ranking criterion (default: time).")
+    cmd.add_argument("-n", type=int, default=10, help="Number of fixtures reported (default: 10).")
+    cmd.add_argument("--session", help="Report the fixtures of the given session only (SESSION_H).")
+    cmd.set_defaults(func=fixtures)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
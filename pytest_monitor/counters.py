@@ -0,0 +1,69 @@
+"""
+Resource counters of the monitored items: I/O, context switches and page faults. Counters are read in
+a single batch: one getrusage call (context switches and page faults), plus the I/O counters of psutil,
+read within Process.oneshot() so that platforms exposing several of them at once are queried only once.
+Counters which are not available on the platform are None.
+"""
+import collections
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import psutil
+
+COUNTERS = (
+    "io_read_bytes",
+    "io_write_bytes",
+    "io_read_count",
+    "io_write_count",
+    "voluntary_ctx_switches",
+    "involuntary_ctx_switches",
+    "minor_page_faults",
+    "major_page_faults",
+)
+
+
+class Counters(collections.namedtuple("Counters", COUNTERS)):
+    """
+    Cumulated resource counters of a process: bytes read from and written to storage, read and write
+    operations, voluntary and involuntary context switches, minor and major page faults.
+    """
+
+    __slots__ = ()
+
+    def __sub__(self, other):
+        return Counters(*(None if None in (end, start) else end - start for end, start in zip(self, other)))
+
+
+def read_counters(process):
+    """:return: the Counters of the given psutil.Process, which must be the current process on POSIX."""
+    with process.oneshot():
+        try:
+            io = process.io_counters() if hasattr(process, "io_counters") else None
+        except psutil.Error:  # Denied access to /proc/<pid>/io in some containers
+            io = None
+        if resource is None:
+            ctx = process.num_ctx_switches()
+            usage = (ctx.voluntary, ctx.involuntary, None, None)
+    if resource is not None:
+        rusage = resource.getrusage(resource.RUSAGE_SELF)
+        usage = (rusage.ru_nvcsw, rusage.ru_nivcsw, rusage.ru_minflt, rusage.ru_majflt)
+    io = (io.read_bytes, io.write_bytes, io.read_count, io.write_count) if io else (None,) * 4
+    return Counters(*io, *usage)
+
+
+class CounterWatch:
+    """Measure the resource counters of a process between its creation (or last `restart`) and `stop`."""
+
+    def __init__(self, process):
+        self.__process = process
+        self.restart()
+
+    def restart(self):
+        self.__start = read_counters(self.__process)
+
+    def stop(self):
+        """:return: the Counters increments since the start."""
+        return read_counters(self.__process) - self.__start
@@ -0,0 +1,212 @@
+"""
+Columnar export of a pytest-monitor database.
+
+Each exported table is stored as a sequence of parts (directories), each part holding one NumPy
+``.npy`` file per column, two for text columns (see `StringColumn`). Such files can be memory-mapped
+(``numpy.load(path, mmap_mode="r")``). The type of each column is given by the database schema, so
+that it is the same in every part. A ``manifest.json`` file keeps track of what has already been
+exported so that subsequent exports only append the rows added in the meantime.
+"""
+import json
+import pathlib
+import shutil
+
+from pytest_monitor.handler import connect_readonly
+
+MANIFEST = "manifest.json"
+FORMAT = 2
+# Missing values of integer columns (as pandas' NaT), missing values of float columns being NaN.
+INT_NULL = -(2**63)
+
+SESSION_COLUMNS = ("SESSION_ID", "SESSION_H", "RUN_DATE", "SCM_ID", "RUN_DESCRIPTION")
+CONTEXT_COLUMNS = (
+    "ENV_ID",
+    "ENV_H",
+    "CPU_COUNT",
+    "CPU_FREQUENCY_MHZ",
+    "CPU_TYPE",
+    "CPU_VENDOR",
+    "RAM_TOTAL_MB",
+    "MACHINE_NODE",
+    "MACHINE_TYPE",
+    "MACHINE_ARCH",
+    "SYSTEM_INFO",
+    "PYTHON_INFO",
+)
+METRIC_COLUMNS = (
+    "METRIC_ID",
+    "SESSION_H",
+    "ENV_H",
+    "ITEM_START_TIME",
+    "ITEM_PATH",
+    "ITEM",
+    "ITEM_VARIANT",
+    "ITEM_FS_LOC",
+    "KIND",
+    "COMPONENT",
+    "TOTAL_TIME",
+    "USER_TIME",
+    "KERNEL_TIME",
+    "CPU_USAGE",
+    "MEM_USAGE",
+)
+
+# Exported tables: columns and query selecting the rows to export.
+# Queries are bound to the last exported and the last exportable identifiers.
+EXPORTED_TABLES = {
+    "TEST_SESSIONS": (
+        SESSION_COLUMNS,
+        f"SELECT {','.join(SESSION_COLUMNS)} FROM TEST_SESSIONS WHERE SESSION_ID > ? AND SESSION_ID <= ?"
+        " ORDER BY SESSION_ID",
+    ),
+    "EXECUTION_CONTEXTS": (
+        CONTEXT_COLUMNS,
+        f"SELECT {','.join(CONTEXT_COLUMNS)} FROM EXECUTION_CONTEXTS WHERE ENV_ID > ? AND ENV_ID <= ? ORDER BY ENV_ID",
+    ),
+    "TEST_METRICS": (
+        METRIC_COLUMNS,
+        f"SELECT {','.join(METRIC_COLUMNS)} FROM TEST_METRICS WHERE METRIC_ID > ? AND METRIC_ID <= ?"
+        " ORDER BY METRIC_ID",
+    ),
+}
+# Last exportable identifier of each table. Metrics are cut by their own identifier: metrics added
+# to an already exported session are exported by the next export.
+EXPORT_BOUNDS = {
+    "TEST_SESSIONS": "SELECT MAX(SESSION_ID) FROM TEST_SESSIONS",
+    "EXECUTION_CONTEXTS": "SELECT MAX(ENV_ID) FROM EXECUTION_CONTEXTS",
+    "TEST_METRICS": "SELECT MAX(METRIC_ID) FROM ITEM_METRICS",
+}
+
+
+def _column_kinds(cnx, table):
+    """Kind of each column of a table ('int', 'float' or 'text'), following the affinity of its declared type."""
+    kinds = {}
+    for _, column, declared, *_ in cnx.execute(f"PRAGMA table_info({table})"):
+        declared = declared.upper()
+        if "INT" in declared:
+            kinds[column] = "int"
+        elif any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+            kinds[column] = "float"
+        else:
+            kinds[column] = "text"
+    return kinds
+
+
+def _to_arrays(np, values, kind):
+    """
+    Convert a column fetched from sqlite into NumPy arrays which can be memory-mapped, by file suffix:
+    a single array for numeric columns, offsets and UTF-8 data for text columns (see StringColumn).
+    """
+    if kind == "int":  # Integer affinity keeps non integral reals (like CPU frequencies) as they are
+        return {"": np.array([INT_NULL if v is None else round(v) for v in values], dtype=np.int64)}
+    if kind == "float":
+        return {"": np.array([float("nan") if v is None else v for v in values], dtype=np.float64)}
+    encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in encoded], out=offsets[1:])
+    return {".offsets": offsets, ".data": np.frombuffer(b"".join(encoded), dtype=np.uint8)}
+
+
+class StringColumn:
+    """
+    Text column of an exported part: the UTF-8 encoded values are concatenated in `data`, the value
+    at index i being data[offsets[i]:offsets[i + 1]]. Missing values are exported as empty strings.
+    Values are decoded upon access.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return bytes(self.data[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def _read_manifest(out_dir):
+    path = out_dir / MANIFEST
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"format": FORMAT, "tables": {}}
+
+
+def export(db_path, out_dir, chunk_size=100000, full=False):
+    """
+    Export the content of a pytest-monitor database to a columnar format.
+    :param db_path: path to the sqlite database.
+    :param out_dir: directory receiving the exported data.
+    :param chunk_size: maximum number of rows per part.
+    :param full: ignore previous exports and export everything again.
+    :return: a dictionary giving the number of exported rows per table.
+    """
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise ImportError("pytest-monitor: exporting a database requires numpy to be installed.") from e
+
+    out_dir = pathlib.Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _read_manifest(out_dir)
+    if full or manifest["format"] != FORMAT:  # Parts in another format are exported again
+        manifest = {"format": FORMAT, "tables": {}}
+        full = True
+    cnx = connect_readonly(db_path)
+    exported = {}
+    try:
+        for table, (columns, what) in EXPORTED_TABLES.items():
+            if full:
+                shutil.rmtree(out_dir / table, ignore_errors=True)
+            kinds = _column_kinds(cnx, table)
+            state = manifest["tables"].setdefault(table, {"last_id": 0, "parts": 0})
+            last_id = cnx.execute(EXPORT_BOUNDS[table]).fetchone()[0] or 0
+            exported[table] = 0
+            cursor = cnx.execute(what, (state["last_id"], last_id))
+            rows = cursor.fetchmany(chunk_size)
+            while rows:
+                part = out_dir / table / f"part-{state['parts']:05d}"
+                part.mkdir(parents=True, exist_ok=True)
+                for column, values in zip(columns, zip(*rows)):
+                    for suffix, array in _to_arrays(np, values, kinds[column]).items():
+                        np.save(part / f"{column}{suffix}.npy", array)
+                state["parts"] += 1
+                exported[table] += len(rows)
+                rows = cursor.fetchmany(chunk_size)
+            state["last_id"] = max(state["last_id"], last_id)
+    finally:
+        cnx.close()
+    with open(out_dir / MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return exported
+
+
+def iter_parts(out_dir, table, mmap=True):
+    """
+    Iterate over the exported parts of a table.
+    :return: an iterator of dictionaries mapping column names to (memory-mapped) NumPy arrays,
+             or to StringColumn for text columns.
+    """
+    import numpy as np
+
+    for part in sorted((pathlib.Path(out_dir) / table).glob("part-*")):
+        arrays = {path.stem: np.load(path, mmap_mode="r" if mmap else None) for path in part.glob("*.npy")}
+        columns = {}
+        for name, array in arrays.items():
+            column, _, suffix = name.partition(".")
+            if not suffix:
+                columns[column] = array
+            elif suffix == "offsets":
+                columns[column] = StringColumn(array, arrays[f"{column}.data"])
+        yield columns
@@ -0,0 +1,119 @@
+"""
+Garbage collection of the monitored items: collection run before each test (see CollectionPolicy), and
+collections run while a test runs, observed through gc.callbacks.
+"""
+import collections
+import gc
+import time
+
+
+class Collections(
+    collections.namedtuple(
+        "Collections",
+        ("generations", "collected", "uncollectable", "total_pause", "max_pause"),
+    )
+):
+    """
+    Garbage collections run during an item: number of collections of each generation, objects collected and
+    found uncollectable, total and longest pause (in nanoseconds).
+    """
+
+    __slots__ = ()
+
+    @property
+    def count(self):
+        return sum(self.generations)
+
+
+class CollectionWatch:
+    """Observe the garbage collections run between its creation and `stop`, from any thread."""
+
+    def __init__(self):
+        self.__generations = [0, 0, 0]
+        self.__collected = 0
+        self.__uncollectable = 0
+        self.__total_pause = 0
+        self.__max_pause = 0
+        self.__start = None
+        gc.callbacks.append(self.__callback)
+
+    def __callback(self, phase, info):
+        if phase == "start":
+            self.__start = time.perf_counter_ns()
+            return
+        if self.__start is None:  # Collection started before the watch
+            return
+        pause = time.perf_counter_ns() - self.__start
+        self.__start = None
+        self.__generations[info["generation"]] += 1
+        self.__collected += info["collected"]
+        self.__uncollectable += info["uncollectable"]
+        self.__total_pause += pause
+        self.__max_pause = max(self.__max_pause, pause)
+
+    def stop(self):
+        """:return: the Collections observed since the creation of the watch."""
+        gc.callbacks.remove(self.__callback)
+        return Collections(
+            tuple(self.__generations), self.__collected, self.__uncollectable, self.__total_pause, self.__max_pause
+        )
+
+
+class CollectionPolicy:
+    """
+    Garbage collection run before each test, so that the garbage of previous tests neither weighs on the memory
+    usage of the test nor gets collected while it runs:
+
+    * full: full collection (the default), which costs time proportional to the number of live objects,
+    * young: collection of the two youngest generations only,
+    * adaptive: full collection when the number of collections of the middle generation triggered by the
+      interpreter since the last full one (gc.get_count()[2], less the young collections run by the policy)
+      reaches `gen2_threshold`, or when the resident memory grew by `rss_threshold` MiB since the last full
+      collection run by the policy, young collection otherwise,
+    * off: no collection.
+    """
+
+    POLICIES = ("full", "young", "adaptive", "off")
+
+    def __init__(self, name="full", gen2_threshold=5, rss_threshold=32.0, memory_backend=None):
+        """:param memory_backend: memory backend measuring the resident memory, required by the adaptive policy."""
+        if name not in self.POLICIES:
+            raise ValueError(f"pytest-monitor: unknown garbage collection policy '{name}'.")
+        self.__name = name
+        self.__gen2_threshold = gen2_threshold
+        self.__rss_threshold = rss_threshold
+        self.__memory = memory_backend
+        self.__rss = None
+        self.__young = 0  # Young collections run by the policy since the last full collection
+        self.__full = None  # Number of full collections (gc.get_stats) when the policy last ran one
+
+    @property
+    def name(self):
+        return self.__name
+
+    def collect(self):
+        """
+        Run the collection required by the policy.
+        :return: the collection applied ('full', 'young' or 'off'), prefixed by 'adaptive/' for the adaptive policy.
+        """
+        if self.__name == "off":
+            return "off"
+        if self.__name == "full":
+            gc.collect()
+            return "full"
+        if self.__name == "young":
+            gc.collect(1)
+            return "young"
+        if gc.get_stats()[2]["collections"] != self.__full:  # The interpreter ran a full collection meanwhile
+            self.__young = 0
+        rss = self.__memory.current()
+        triggered = gc.get_count()[2] - self.__young
+        if self.__rss is None or rss - self.__rss >= self.__rss_threshold or triggered >= self.__gen2_threshold:
+            gc.collect()
+            self.__rss = self.__memory.current()
+            self.__young = 0
+            self.__full = gc.get_stats()[2]["collections"]
+            return "adaptive/full"
+        gc.collect(1)
+        self.__young += 1
+        return "adaptive/young"
@@ -1,17 +1,952 @@
+import datetime
+import functools
+import os
+import queue
+import random
 import sqlite3
+import threading
+import time
+import warnings
+
+from pytest_monitor.stats import RunningStats
+
+ITEM_COLUMNS = ("ITEM_PATH", "ITEM", "ITEM_VARIANT", "ITEM_FS_LOC", "KIND", "COMPONENT")
+
+
+def _item_identity(alias=""):
+    """
+    Expressions identifying a test in TEST_ITEMS. SQLite considers NULLs distinct from each other in unique
+    constraints: NULL and '' are considered the same value, through a unique index on these expressions.
+    """
+    return tuple(f"COALESCE({alias}{column},'')" for column in ITEM_COLUMNS)
+
+
+ITEM_INSERT = f"insert or ignore into TEST_ITEMS({','.join(ITEM_COLUMNS)}) values (?,?,?,?,?,?)"
+ITEM_SELECT = "select ITEM_ID from TEST_ITEMS where " + " and ".join(
+    f"{expression} = COALESCE(?,'')" for expression in _item_identity()
+)
+
+STAT_COLUMNS = (
+    "RUN_COUNT",
+    "TOTAL_TIME_MEAN",
+    "TOTAL_TIME_M2",
+    "TOTAL_TIME_MIN",
+    "TOTAL_TIME_MAX",
+    "TOTAL_TIME_SKETCH",
+    "MEM_USAGE_MEAN",
+    "MEM_USAGE_M2",
+    "MEM_USAGE_MIN",
+    "MEM_USAGE_MAX",
+    "MEM_USAGE_SKETCH",
+)
+STAT_SELECT = f"select {','.join(STAT_COLUMNS)} from TEST_STATS where ITEM_ID = ? and ENV_ID = ?"
+
+ROLLUP_COLUMNS = (
+    "FIRST_START_TIME",
+    "LAST_START_TIME",
+    "SESSION_COUNT",
+    "RUN_COUNT",
+    "TOTAL_TIME_MEAN",
+    "TOTAL_TIME_M2",
+    "TOTAL_TIME_MIN",
+    "TOTAL_TIME_MAX",
+    "TOTAL_TIME_SKETCH",
+    "MEM_USAGE_MEAN",
+    "MEM_USAGE_M2",
+    "MEM_USAGE_MIN",
+    "MEM_USAGE_MAX",
+    "MEM_USAGE_SKETCH",
+)
+ROLLUP_SELECT = f"select {','.join(ROLLUP_COLUMNS)} from ITEM_ROLLUPS where ITEM_ID = ? and ENV_ID = ?"
+
+# Concurrent writers (several pytest processes sharing a database) wait on each other's locks
+# for up to BUSY_TIMEOUT seconds, then retry with a jittered exponential backoff.
+BUSY_TIMEOUT = 30.0
+BUSY_RETRIES = 5
+BUSY_DELAY = 0.05
+
+SESSION_SELECT = "select SESSION_ID from TEST_SESSIONS where SESSION_H = ?"
+ENV_SELECT = "select ENV_ID from EXECUTION_CONTEXTS where ENV_H = ?"
+
+# I/O, context switch and page fault counters of a metric (see pytest_monitor.counters).
+COUNTER_COLUMNS = (
+    "IO_READ_BYTES",
+    "IO_WRITE_BYTES",
+    "IO_READ_COUNT",
+    "IO_WRITE_COUNT",
+    "VOLUNTARY_CTX_SWITCHES",
+    "INVOLUNTARY_CTX_SWITCHES",
+    "MINOR_PAGE_FAULTS",
+    "MAJOR_PAGE_FAULTS",
+)
+# Spread of the CPU time of a metric across threads (see pytest_monitor.threads).
+THREAD_COLUMNS = ("THREAD_COUNT", "BUSIEST_THREAD_SHARE", "EFFECTIVE_PARALLELISM")
+METRIC_INSERT = (
+    "insert into ITEM_METRICS(METRIC_ID,SESSION_ID,ENV_ID,ITEM_ID,ITEM_START_TIME,TOTAL_TIME,"
+    "USER_TIME,KERNEL_TIME,CPU_USAGE,MEM_USAGE,TOTAL_TIME_NS,USER_TIME_NS,KERNEL_TIME_NS,"
+    f"{','.join(COUNTER_COLUMNS + THREAD_COLUMNS)},GC_POLICY) "
+    f"values ({','.join('?' * (14 + len(COUNTER_COLUMNS) + len(THREAD_COLUMNS)))})"
+)
+
+FIXTURE_COLUMNS = (
+    "FIXTURE_NAME",
+    "FIXTURE_PATH",
+    "SCOPE",
+    "PARAM",
+    "SETUP_START_TIME",
+    "SETUP_TIME_NS",
+    "TEARDOWN_TIME_NS",
+    "MEM_USAGE",
+)
+FIXTURE_INSERT = (
+    f"insert into FIXTURE_METRICS(SESSION_ID,ENV_ID,{','.join(FIXTURE_COLUMNS)})"
+    f" values ({','.join('?' * (len(FIXTURE_COLUMNS) + 2))})"
+)
+
+# Optional details of a metric, stored in side tables linked to ITEM_METRICS by METRIC_ID.
+METRIC_DETAILS = {
+    "TEST_TRACEMALLOC": ("TRACED_PEAK", "TRACED_SIZE", "FRAME_DEPTH"),
+    "TEST_ALLOCATIONS": ("SITE_RANK", "TRACEBACK", "SIZE", "BLOCK_COUNT"),
+    "TEST_MEMORY_SERIES": ("STRIDE", "SAMPLE_COUNT", "SAMPLES"),
+    "TEST_BENCHMARKS": (
+        "ROUNDS",
+        "WARMUP",
+        "TOTAL_TIME_MIN",
+        "TOTAL_TIME_MEDIAN",
+        "TOTAL_TIME_MEAN",
+        "TOTAL_TIME_STDDEV",
+        "TOTAL_TIME_IQR",
+        "MEM_USAGE_MIN",
+        "MEM_USAGE_MEDIAN",
+        "MEM_USAGE_MEAN",
+        "MEM_USAGE_STDDEV",
+        "MEM_USAGE_IQR",
+    ),
+    "BENCHMARK_ROUNDS": ("ROUND", "TOTAL_TIME", "USER_TIME", "KERNEL_TIME", "MEM_USAGE"),
+    "MONITOR_OVERHEAD": ("TEST_COUNT", "TEST_TIME_NS", "OVERHEAD_TIME_NS"),
+    "TEST_PHASE_METRICS": ("PHASE", "PHASE_START_TIME", "TOTAL_TIME_NS", "USER_TIME_NS", "KERNEL_TIME_NS", "MEM_USAGE"),
+    "TEST_GARBAGE_COLLECTIONS": (
+        "GEN0_COLLECTIONS",
+        "GEN1_COLLECTIONS",
+        "GEN2_COLLECTIONS",
+        "COLLECTED",
+        "UNCOLLECTABLE",
+        "TOTAL_PAUSE_NS",
+        "MAX_PAUSE_NS",
+    ),
+    "TEST_PROCESS_TREE": (
+        "PROCESS_COUNT",
+        "USER_TIME_NS",
+        "KERNEL_TIME_NS",
+        "CPU_USAGE",
+        "MEM_USAGE",
+        "MAX_PROCESS_MEM_USAGE",
+    ),
+}
+
+# Test identities are looked up through the unique index of TEST_ITEMS,
+# whose leading expressions cover ITEM_PATH, ITEM and ITEM_VARIANT.
+METRIC_INDEXES = {
+    "ITEM_METRICS_ITEM_IDX": "ITEM_ID",
+    "ITEM_METRICS_SESSION_IDX": "SESSION_ID",
+    "ITEM_METRICS_ENV_IDX": "ENV_ID",
+    "ITEM_METRICS_START_IDX": "ITEM_START_TIME",
+}
+
+
+def _create_initial_schema(cursor):
+    cursor.execute(
+        """
+CREATE TABLE IF NOT EXISTS TEST_SESSIONS(
+    SESSION_H varchar(64) primary key not null unique, -- Session identifier
+    RUN_DATE varchar(64), -- Date of test run
+    SCM_ID varchar(128), -- SCM change id
+    RUN_DESCRIPTION json
+);"""
+    )
+    cursor.execute(
+        """
+CREATE TABLE IF NOT EXISTS TEST_METRICS (
+    SESSION_H varchar(64), -- Session identifier
+    ENV_H varchar(64), -- Environment description identifier
+    ITEM_START_TIME varchar(64), -- Effective start time of the test
+    ITEM_PATH varchar(4096), -- Path of the item, following Python import specification
+    ITEM varchar(2048), -- Name of the item
+    ITEM_VARIANT varchar(2048), -- Optional parametrization of an item.
+    ITEM_FS_LOC varchar(2048), -- Relative path from pytest invocation directory to the item's module.
+    KIND varchar(64), -- Package, Module or function
+    COMPONENT varchar(512) NULL, -- Tested component if any
+    TOTAL_TIME float, -- Total time spent running the item
+    USER_TIME float, -- time spent in user space
+    KERNEL_TIME float, -- time spent in kernel space
+    CPU_USAGE float, -- cpu usage
+    MEM_USAGE float, -- Max resident memory used.
+    FOREIGN KEY (ENV_H) REFERENCES EXECUTION_CONTEXTS(ENV_H),
+    FOREIGN KEY (SESSION_H) REFERENCES TEST_SESSIONS(SESSION_H)
+);"""
+    )
+    cursor.execute(
+        """
+CREATE TABLE IF NOT EXISTS EXECUTION_CONTEXTS (
+   ENV_H varchar(64) primary key not null unique,
+   CPU_COUNT integer,
+   CPU_FREQUENCY_MHZ integer,
+   CPU_TYPE varchar(64),
+   CPU_VENDOR varchar(256),
+   RAM_TOTAL_MB integer,
+   MACHINE_NODE varchar(512),
+   MACHINE_TYPE varchar(32),
+   MACHINE_ARCH varchar(16),
+   SYSTEM_INFO varchar(256),
+   PYTHON_INFO varchar(512)
+);
+"""
+    )
+
+
+def _store_timestamps_as_ns(cursor):
+    cursor.execute(
+        """
+CREATE TABLE TEST_SESSIONS_V2(
+    SESSION_H varchar(64) primary key not null unique, -- Session identifier
+    RUN_DATE integer, -- Date of test run, in nanoseconds since epoch
+    SCM_ID varchar(128), -- SCM change id
+    RUN_DESCRIPTION json
+);"""
+    )
+    cursor.execute(
+        "INSERT INTO TEST_SESSIONS_V2 SELECT SESSION_H, PYMON_ISO_TO_NS(RUN_DATE), SCM_ID, RUN_DESCRIPTION"
+        " FROM TEST_SESSIONS"
+    )
+    cursor.execute(
+        """
+CREATE TABLE TEST_METRICS_V2 (
+    SESSION_H varchar(64), -- Session identifier
+    ENV_H varchar(64), -- Environment description identifier
+    ITEM_START_TIME integer, -- Effective start time of the test, in nanoseconds since epoch
+    ITEM_PATH varchar(4096), -- Path of the item, following Python import specification
+    ITEM varchar(2048), -- Name of the item
+    ITEM_VARIANT varchar(2048), -- Optional parametrization of an item.
+    ITEM_FS_LOC varchar(2048), -- Relative path from pytest invocation directory to the item's module.
+    KIND varchar(64), -- Package, Module or function
+    COMPONENT varchar(512) NULL, -- Tested component if any
+    TOTAL_TIME float, -- Total time spent running the item
+    USER_TIME float, -- time spent in user space
+    KERNEL_TIME float, -- time spent in kernel space
+    CPU_USAGE float, -- cpu usage
+    MEM_USAGE float, -- Max resident memory used.
+    FOREIGN KEY (ENV_H) REFERENCES EXECUTION_CONTEXTS(ENV_H),
+    FOREIGN KEY (SESSION_H) REFERENCES TEST_SESSIONS(SESSION_H)
+);"""
+    )
+    cursor.execute(
+        "INSERT INTO TEST_METRICS_V2 SELECT SESSION_H, ENV_H, PYMON_ISO_TO_NS(ITEM_START_TIME), ITEM_PATH, ITEM,"
+        " ITEM_VARIANT, ITEM_FS_LOC, KIND, COMPONENT, TOTAL_TIME, USER_TIME, KERNEL_TIME, CPU_USAGE, MEM_USAGE"
+        " FROM TEST_METRICS"
+    )
+    for table in ("TEST_METRICS", "TEST_SESSIONS"):
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_V2 RENAME TO {table}")
+
+
+def _normalize_metrics(cursor):
+    cursor.execute(
+        """
+CREATE TABLE TEST_SESSIONS_V3(
+    SESSION_ID integer primary key, -- Compact session identifier
+    SESSION_H varchar(64) not null unique, -- Session identifier
+    RUN_DATE integer, -- Date of test run, in nanoseconds since epoch
+    SCM_ID varchar(128), -- SCM change id
+    RUN_DESCRIPTION json
+);"""
+    )
+    cursor.execute(
+        """
+CREATE TABLE EXECUTION_CONTEXTS_V3 (
+   ENV_ID integer primary key,
+   ENV_H varchar(64) not null unique,
+   CPU_COUNT integer,
+   CPU_FREQUENCY_MHZ integer,
+   CPU_TYPE varchar(64),
+   CPU_VENDOR varchar(256),
+   RAM_TOTAL_MB integer,
+   MACHINE_NODE varchar(512),
+   MACHINE_TYPE varchar(32),
+   MACHINE_ARCH varchar(16),
+   SYSTEM_INFO varchar(256),
+   PYTHON_INFO varchar(512)
+);"""
+    )
+    cursor.execute(
+        """
+CREATE TABLE TEST_ITEMS (
+    ITEM_ID integer primary key, -- Test identity
+    ITEM_PATH varchar(4096), -- Path of the item, following Python import specification
+    ITEM varchar(2048), -- Name of the item
+    ITEM_VARIANT varchar(2048), -- Optional parametrization of an item.
+    ITEM_FS_LOC varchar(2048), -- Relative path from pytest invocation directory to the item's module.
+    KIND varchar(64), -- Package, Module or function
+    COMPONENT varchar(512) NULL -- Tested component if any
+);"""
+    )
+    cursor.execute(f"CREATE UNIQUE INDEX TEST_ITEMS_IDENTITY_IDX ON TEST_ITEMS({','.join(_item_identity())})")
+    cursor.execute(
+        """
+CREATE TABLE ITEM_METRICS (
+    METRIC_ID integer primary key autoincrement, -- Metric identifier, never reused once deleted
+    SESSION_ID integer, -- Session identifier
+    ENV_ID integer, -- Environment description identifier
+    ITEM_ID integer, -- Test identity
+    ITEM_START_TIME integer, -- Effective start time of the test, in nanoseconds since epoch
+    TOTAL_TIME float, -- Total time spent running the item
+    USER_TIME float, -- time spent in user space
+    KERNEL_TIME float, -- time spent in kernel space
+    CPU_USAGE float, -- cpu usage
+    MEM_USAGE float, -- Max resident memory used.
+    FOREIGN KEY (ENV_ID) REFERENCES EXECUTION_CONTEXTS(ENV_ID),
+    FOREIGN KEY (SESSION_ID) REFERENCES TEST_SESSIONS(SESSION_ID),
+    FOREIGN KEY (ITEM_ID) REFERENCES TEST_ITEMS(ITEM_ID)
+);"""
+    )
+    cursor.execute(
+        "INSERT INTO TEST_SESSIONS_V3(SESSION_H, RUN_DATE, SCM_ID, RUN_DESCRIPTION)"
+        " SELECT SESSION_H, RUN_DATE, SCM_ID, RUN_DESCRIPTION FROM TEST_SESSIONS ORDER BY RUN_DATE"
+    )
+    cursor.execute(
+        "INSERT INTO EXECUTION_CONTEXTS_V3(ENV_H, CPU_COUNT, CPU_FREQUENCY_MHZ, CPU_TYPE, CPU_VENDOR, RAM_TOTAL_MB,"
+        " MACHINE_NODE, MACHINE_TYPE, MACHINE_ARCH, SYSTEM_INFO, PYTHON_INFO)"
+        " SELECT ENV_H, CPU_COUNT, CPU_FREQUENCY_MHZ, CPU_TYPE, CPU_VENDOR, RAM_TOTAL_MB, MACHINE_NODE, MACHINE_TYPE,"
+        " MACHINE_ARCH, SYSTEM_INFO, PYTHON_INFO FROM EXECUTION_CONTEXTS ORDER BY rowid"
+    )
+    # Metrics referencing an unknown session or context are kept: a placeholder is created for them.
+    cursor.execute("INSERT OR IGNORE INTO TEST_SESSIONS_V3(SESSION_H) SELECT SESSION_H FROM TEST_METRICS")
+    cursor.execute("INSERT OR IGNORE INTO EXECUTION_CONTEXTS_V3(ENV_H) SELECT ENV_H FROM TEST_METRICS")
+    cursor.execute(
+        "INSERT OR IGNORE INTO TEST_ITEMS(ITEM_PATH, ITEM, ITEM_VARIANT, ITEM_FS_LOC, KIND, COMPONENT)"
+        " SELECT ITEM_PATH, ITEM, ITEM_VARIANT, ITEM_FS_LOC, KIND, COMPONENT FROM TEST_METRICS ORDER BY rowid"
+    )
+    cursor.execute(
+        "INSERT INTO ITEM_METRICS(SESSION_ID, ENV_ID, ITEM_ID, ITEM_START_TIME, TOTAL_TIME, USER_TIME, KERNEL_TIME,"
+        " CPU_USAGE, MEM_USAGE) SELECT S.SESSION_ID, E.ENV_ID, I.ITEM_ID, M.ITEM_START_TIME, M.TOTAL_TIME,"
+        " M.USER_TIME, M.KERNEL_TIME, M.CPU_USAGE, M.MEM_USAGE FROM TEST_METRICS M"
+        " JOIN TEST_SESSIONS_V3 S ON S.SESSION_H = M.SESSION_H"
+        " JOIN EXECUTION_CONTEXTS_V3 E ON E.ENV_H = M.ENV_H"
+        " JOIN TEST_ITEMS I ON "
+        + " AND ".join(f"{m} = {i}" for m, i in zip(_item_identity("M."), _item_identity("I.")))
+        + " ORDER BY M.rowid"
+    )
+    cursor.execute("DROP TABLE TEST_METRICS")
+    for table in ("TEST_SESSIONS", "EXECUTION_CONTEXTS"):
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_V3 RENAME TO {table}")
+
+
+def _create_rollups(cursor):
+    cursor.execute(
+        """
+CREATE TABLE ITEM_ROLLUPS (
+    ITEM_ID integer, -- Test identity
+    ENV_ID integer, -- Environment description identifier
+    FIRST_START_TIME integer, -- Start time of the first rolled up run, in nanoseconds since epoch
+    LAST_START_TIME integer, -- Start time of the last rolled up run, in nanoseconds since epoch
+    SESSION_COUNT integer, -- Number of sessions rolled up
+    RUN_COUNT integer, -- Number of runs rolled up
+    TOTAL_TIME_MEAN float,
+    TOTAL_TIME_M2 float, -- Sum of squared differences to the mean (variance is M2 / (RUN_COUNT - 1))
+    TOTAL_TIME_MIN float,
+    TOTAL_TIME_MAX float,
+    TOTAL_TIME_SKETCH json, -- Quantile sketch (see pytest_monitor.stats.QuantileSketch)
+    TOTAL_TIME_P50 float, -- Estimated from the sketch
+    TOTAL_TIME_P95 float,
+    MEM_USAGE_MEAN float,
+    MEM_USAGE_M2 float,
+    MEM_USAGE_MIN float,
+    MEM_USAGE_MAX float,
+    MEM_USAGE_SKETCH json,
+    MEM_USAGE_P50 float,
+    MEM_USAGE_P95 float,
+    PRIMARY KEY (ITEM_ID, ENV_ID),
+    FOREIGN KEY (ENV_ID) REFERENCES EXECUTION_CONTEXTS(ENV_ID),
+    FOREIGN KEY (ITEM_ID) REFERENCES TEST_ITEMS(ITEM_ID)
+);"""
+    )
+
+
+def _create_stats(cursor):
+    cursor.execute(
+        """
+CREATE TABLE TEST_STATS (
+    ITEM_ID integer, -- Test identity
+    ENV_ID integer, -- Environment description identifier
+    RUN_COUNT integer, -- Number of runs accounted for
+    TOTAL_TIME_MEAN float,
+    TOTAL_TIME_M2 float, -- Sum of squared differences to the mean (variance is M2 / (RUN_COUNT - 1))
+    TOTAL_TIME_MIN float,
+    TOTAL_TIME_MAX float,
+    TOTAL_TIME_SKETCH json, -- Quantile sketch (see pytest_monitor.stats.QuantileSketch)
+    MEM_USAGE_MEAN float,
+    MEM_USAGE_M2 float,
+    MEM_USAGE_MIN float,
+    MEM_USAGE_MAX float,
+    MEM_USAGE_SKETCH json,
+    PRIMARY KEY (ITEM_ID, ENV_ID),
+    FOREIGN KEY (ENV_ID) REFERENCES EXECUTION_CONTEXTS(ENV_ID),
+    FOREIGN KEY (ITEM_ID) REFERENCES TEST_ITEMS(ITEM_ID)
+);"""
+    )
+    cursor.execute(
+        """
+CREATE TABLE STATS_SESSIONS (
+    SESSION_ID integer primary key, -- Session whose metrics are accounted for in TEST_STATS
+    FOREIGN KEY (SESSION_ID) REFERENCES TEST_SESSIONS(SESSION_ID)
+);"""
+    )
+    cursor.execute("INSERT INTO STATS_SESSIONS SELECT DISTINCT SESSION_ID FROM ITEM_METRICS")
+    # Metrics are streamed from their own cursor: only the statistics are held in memory.
+    runs = cursor.connection.execute(
+        "SELECT ITEM_ID, ENV_ID, TOTAL_TIME, MEM_USAGE FROM ITEM_METRICS ORDER BY METRIC_ID"
+    )
+    _fold_into_stats(cursor, runs)
+
+
+def _create_tracemalloc(cursor):
+    cursor.execute(
+        """
+CREATE TABLE TEST_TRACEMALLOC (
+    METRIC_ID integer primary key, -- Metric of the traced test
+    TRACED_PEAK integer, -- Peak size of the memory blocks traced during the test, in bytes
+    TRACED_SIZE integer, -- Size of the traced memory blocks still allocated when the test returned, in bytes
+    FRAME_DEPTH integer, -- Number of frames stored in allocation tracebacks
+    FOREIGN KEY (METRIC_ID) REFERENCES ITEM_METRICS(METRIC_ID)
+);"""
+    )
+    cursor.execute(
+        """
+CREATE TABLE TEST_ALLOCATIONS (
+    METRIC_ID integer, -- Metric of the traced test
+    SITE_RANK integer, -- Rank of the allocation site, by decreasing size
+    TRACEBACK varchar(4096), -- Allocation site, as 'file:line' frames separated by newlines (most recent first)
+    SIZE integer, -- Size of the memory blocks allocated from this site, in bytes
+    BLOCK_COUNT integer, -- Number of memory blocks allocated from this site
+    FOREIGN KEY (METRIC_ID) REFERENCES ITEM_METRICS(METRIC_ID)
+);"""
+    )
+    cursor.execute("CREATE INDEX TEST_ALLOCATIONS_METRIC_IDX ON TEST_ALLOCATIONS(METRIC_ID)")
+
+
+def _create_memory_series(cursor):
+    cursor.execute(
+        """
+CREATE TABLE TEST_MEMORY_SERIES (
+    METRIC_ID integer primary key, -- Metric of the sampled test
+    STRIDE integer, -- Number of raw samples merged (keeping the largest) into each stored sample
+    SAMPLE_COUNT integer, -- Number of stored samples
+    SAMPLES blob, -- Samples, delta-encoded and compressed (see pytest_monitor.memory.decode_series)
+    FOREIGN KEY (METRIC_ID) REFERENCES ITEM_METRICS(METRIC_ID)
+);"""
+    )
+
+
+def _create_benchmarks(cursor):
+    cursor.execute(
+        """
+CREATE TABLE TEST_BENCHMARKS (
+    METRIC_ID integer primary key, -- Metric of the benchmarked test
+    ROUNDS integer, -- Number of measured rounds
+    WARMUP integer, -- Number of unmeasured runs preceding the rounds
+    TOTAL_TIME_MIN float, -- Statistics of the time spent in each round (in seconds)
+    TOTAL_TIME_MEDIAN float, -- Interpolated between the two middle rounds if their number is even
+    TOTAL_TIME_MEAN float,
+    TOTAL_TIME_STDDEV float,
+    TOTAL_TIME_IQR float, -- Interquartile range
+    MEM_USAGE_MIN float, -- Statistics of the memory used by each round (in megabytes)
+    MEM_USAGE_MEDIAN float,
+    MEM_USAGE_MEAN float,
+    MEM_USAGE_STDDEV float,
+    MEM_USAGE_IQR float,
+    FOREIGN KEY (METRIC_ID) REFERENCES ITEM_METRICS(METRIC_ID)
+);"""
+    )
+    cursor.execute(
+        """
+CREATE TABLE BENCHMARK_ROUNDS (
+    METRIC_ID integer, -- Metric of the benchmarked test
+    ROUND integer, -- Round number, starting at 1
+    TOTAL_TIME float, -- Time spent in the round (in seconds)
+    USER_TIME float, -- Time spent in User mode (in seconds)
+    KERNEL_TIME float, -- Time spent in Kernel mode (in seconds)
+    MEM_USAGE float, -- Maximum resident memory used during the round (in megabytes)
+    FOREIGN KEY (METRIC_ID) REFERENCES ITEM_METRICS(METRIC_ID)
+);"""
+    )
+    cursor.execute("CREATE INDEX BENCHMARK_ROUNDS_METRIC_IDX ON BENCHMARK_ROUNDS(METRIC_ID)")
+
+
+def _store_durations_as_ns(cursor):
+    for column in ("TOTAL_TIME", "USER_TIME", "KERNEL_TIME"):
+        cursor.execute(f"ALTER TABLE ITEM_METRICS ADD COLUMN {column}_NS integer")
+        cursor.execute(f"UPDATE ITEM_METRICS SET {column}_NS = CAST(ROUND({column} * 1e9) AS integer)")
+
+
+def _create_phase_metrics(cursor):
+    cursor.execute(
+        """
+CREATE TABLE TEST_PHASE_METRICS (
+    METRIC_ID integer, -- Metric of the test
+    PHASE varchar(16), -- setup, call or teardown
+    PHASE_START_TIME integer, -- Start time of the phase, in nanoseconds since epoch
+    TOTAL_TIME_NS integer, -- Time spent in the phase (in nanoseconds)
+    USER_TIME_NS integer, -- Time spent in User mode (in nanoseconds)
+    KERNEL_TIME_NS integer, -- Time spent in Kernel mode (in nanoseconds)
+    MEM_USAGE float, -- Maximum resident memory used during the phase (in megabytes)
+    FOREIGN KEY (METRIC_ID) REFERENCES ITEM_METRICS(METRIC_ID)
+);"""
+    )
+    cursor.execute("CREATE INDEX TEST_PHASE_METRICS_METRIC_IDX ON TEST_PHASE_METRICS(METRIC_ID)")
+
+
+def _create_fixture_metrics(cursor):
+    cursor.execute(
+        """
+CREATE TABLE FIXTURE_METRICS (
+    FIXTURE_METRIC_ID integer primary key, -- Identifier of the fixture instantiation
+    SESSION_ID integer, -- Session identifier
+    ENV_ID integer, -- Environment description identifier
+    FIXTURE_NAME varchar(2048), -- Name of the fixture
+    FIXTURE_PATH varchar(4096), -- Module defining the fixture, following Python import specification
+    SCOPE varchar(16), -- function, class, module, package or session
+    PARAM varchar(2048) NULL, -- Parameter of the fixture instance, if parametrized
+    SETUP_START_TIME integer, -- Start time of the setup, in nanoseconds since epoch
+    SETUP_TIME_NS integer, -- Time spent setting the fixture up (in nanoseconds)
+    TEARDOWN_TIME_NS integer NULL, -- Time spent tearing the fixture down (in nanoseconds), if torn down
+    MEM_USAGE float, -- Growth of the resident memory during the setup (in megabytes)
+    FOREIGN KEY (ENV_ID) REFERENCES EXECUTION_CONTEXTS(ENV_ID),
+    FOREIGN KEY (SESSION_ID) REFERENCES TEST_SESSIONS(SESSION_ID)
+);"""
+    )
+    cursor.execute("CREATE INDEX FIXTURE_METRICS_SESSION_IDX ON FIXTURE_METRICS(SESSION_ID)")
+
+
+def _create_monitor_overhead(cursor):
+    cursor.execute(
+        """
+CREATE TABLE MONITOR_OVERHEAD (
+    METRIC_ID integer primary key, -- Metric of the session
+    TEST_COUNT integer, -- Number of monitored tests
+    TEST_TIME_NS integer, -- Time spent in monitored tests (in nanoseconds)
+    OVERHEAD_TIME_NS integer, -- Time spent by pytest-monitor itself (in nanoseconds)
+    FOREIGN KEY (METRIC_ID) REFERENCES ITEM_METRICS(METRIC_ID)
+);"""
+    )
+
+
+def _add_resource_counters(cursor):
+    for column in (
+        "IO_READ_BYTES",
+        "IO_WRITE_BYTES",
+        "IO_READ_COUNT",
+        "IO_WRITE_COUNT",
+        "VOLUNTARY_CTX_SWITCHES",
+        "INVOLUNTARY_CTX_SWITCHES",
+        "MINOR_PAGE_FAULTS",
+        "MAJOR_PAGE_FAULTS",
+    ):
+        cursor.execute(f"ALTER TABLE ITEM_METRICS ADD COLUMN {column} integer NULL")
+
+
+def _create_process_tree(cursor):
+    cursor.execute(
+        """
+CREATE TABLE TEST_PROCESS_TREE (
+    METRIC_ID integer primary key, -- Metric of the test
+    PROCESS_COUNT integer, -- Number of descendant processes seen while the test ran
+    USER_TIME_NS integer, -- Time spent in User mode by the test and its descendants (in nanoseconds)
+    KERNEL_TIME_NS integer, -- Time spent in Kernel mode by the test and its descendants (in nanoseconds)
+    CPU_USAGE float, -- CPU time of the test and its descendants over the test elapsed time
+    MEM_USAGE float, -- Peak of the resident memory summed over the process tree (in megabytes)
+    MAX_PROCESS_MEM_USAGE float, -- Peak resident memory of a single descendant (in megabytes)
+    FOREIGN KEY (METRIC_ID) REFERENCES ITEM_METRICS(METRIC_ID)
+);"""
+    )
+
+
+def _add_thread_usage(cursor):
+    cursor.execute("ALTER TABLE ITEM_METRICS ADD COLUMN THREAD_COUNT integer NULL")
+    cursor.execute("ALTER TABLE ITEM_METRICS ADD COLUMN BUSIEST_THREAD_SHARE float NULL")
+    cursor.execute("ALTER TABLE ITEM_METRICS ADD COLUMN EFFECTIVE_PARALLELISM float NULL")
+
+
+def _create_garbage_collections(cursor):
+    cursor.execute(
+        """
+CREATE TABLE TEST_GARBAGE_COLLECTIONS (
+    METRIC_ID integer primary key, -- Metric of the test
+    GEN0_COLLECTIONS integer, -- Number of collections of the youngest generation
+    GEN1_COLLECTIONS integer, -- Number of collections of the middle generation
+    GEN2_COLLECTIONS integer, -- Number of full collections
+    COLLECTED integer, -- Number of unreachable objects collected
+    UNCOLLECTABLE integer, -- Number of unreachable objects which could not be collected
+    TOTAL_PAUSE_NS integer, -- Time spent in collections (in nanoseconds)
+    MAX_PAUSE_NS integer, -- Longest collection (in nanoseconds)
+    FOREIGN KEY (METRIC_ID) REFERENCES ITEM_METRICS(METRIC_ID)
+);"""
+    )
+
+
+def _add_gc_policy(cursor):
+    cursor.execute("ALTER TABLE ITEM_METRICS ADD COLUMN GC_POLICY varchar(16) NULL")
+
+
+# Each migration brings the schema to the associated version. Migrations are run in order,
+# in a single transaction, and must never be modified once released.
+MIGRATIONS = [
+    (1, _create_initial_schema),
+    (2, _store_timestamps_as_ns),
+    (3, _normalize_metrics),
+    (4, _create_rollups),
+    (5, _create_stats),
+    (6, _create_tracemalloc),
+    (7, _create_memory_series),
+    (8, _create_benchmarks),
+    (9, _store_durations_as_ns),
+    (10, _create_phase_metrics),
+    (11, _create_fixture_metrics),
+    (12, _create_monitor_overhead),
+    (13, _add_resource_counters),
+    (14, _create_process_tree),
+    (15, _add_thread_usage),
+    (16, _create_garbage_collections),
+    (17, _add_gc_policy),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _ns_to_iso(column):
+    return (
+        f"strftime('%Y-%m-%dT%H:%M:%S', {column} / 1000000000, 'unixepoch', 'localtime')"
+        f" || printf('.%06d', ({column} / 1000) % 1000000)"
+    )
+
+
+# Views exposing the latest schema with the legacy layout. They are rebuilt after each migration.
+COMPATIBILITY_VIEWS = {
+    "TEST_METRICS": "SELECT M.METRIC_ID, S.SESSION_H, E.ENV_H, M.ITEM_START_TIME, I.ITEM_PATH, I.ITEM, I.ITEM_VARIANT,"
+    " I.ITEM_FS_LOC, I.KIND, I.COMPONENT, M.TOTAL_TIME, M.USER_TIME, M.KERNEL_TIME, M.CPU_USAGE, M.MEM_USAGE,"
+    " M.TOTAL_TIME_NS, M.USER_TIME_NS, M.KERNEL_TIME_NS,"
+    f" {', '.join(f'M.{column}' for column in COUNTER_COLUMNS + THREAD_COLUMNS)}, M.GC_POLICY"
+    " FROM ITEM_METRICS M JOIN TEST_ITEMS I ON I.ITEM_ID = M.ITEM_ID"
+    " JOIN TEST_SESSIONS S ON S.SESSION_ID = M.SESSION_ID JOIN EXECUTION_CONTEXTS E ON E.ENV_ID = M.ENV_ID",
+    "TEST_SESSIONS_V1": f"SELECT SESSION_H, {_ns_to_iso('RUN_DATE')} AS RUN_DATE, SCM_ID, RUN_DESCRIPTION"
+    " FROM TEST_SESSIONS",
+    "TEST_METRICS_V1": f"SELECT SESSION_H, ENV_H, {_ns_to_iso('ITEM_START_TIME')} AS ITEM_START_TIME, ITEM_PATH,"
+    " ITEM, ITEM_VARIANT, ITEM_FS_LOC, KIND, COMPONENT, TOTAL_TIME, USER_TIME, KERNEL_TIME, CPU_USAGE, MEM_USAGE"
+    " FROM TEST_METRICS",
+}
+
+
+def iso_to_ns(value):
+    """Convert a naive ISO 8601 local date, as stored before schema version 2, to nanoseconds since epoch."""
+    if value is None:
+        return None
+    dt = datetime.datetime.fromisoformat(value)
+    return int(dt.replace(microsecond=0).timestamp()) * 1_000_000_000 + dt.microsecond * 1000
+
+
+def _fold_into_rollups(cursor, runs):
+    """
+    Merge the given runs into ITEM_ROLLUPS, which holds a single row per test and execution context.
+    :param runs: iterable of (ITEM_ID, ENV_ID, ITEM_START_TIME, SESSION_ID, TOTAL_TIME, MEM_USAGE) tuples.
+    """
+    rollups = {}
+    for item_id, env_id, start_time, session_id, total_time, mem_usage in runs:
+        key = item_id, env_id
+        if key not in rollups:
+            cursor.execute(ROLLUP_SELECT, key)
+            row = cursor.fetchone()
+            if row:
+                first, last, session_count, count = row[:4]
+                times, memory = RunningStats(count, *row[4:9]), RunningStats(count, *row[9:])
+            else:
+                first, last, session_count, times, memory = None, None, 0, RunningStats(), RunningStats()
+            rollups[key] = [first, last, session_count, set(), times, memory]
+        rollup = rollups[key]
+        if start_time is not None:
+            rollup[0] = start_time if rollup[0] is None else min(rollup[0], start_time)
+            rollup[1] = start_time if rollup[1] is None else max(rollup[1], start_time)
+        rollup[3].add(session_id)
+        if total_time is not None and mem_usage is not None:
+            rollup[4].add(total_time)
+            rollup[5].add(mem_usage)
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO ITEM_ROLLUPS(ITEM_ID,ENV_ID,{','.join(ROLLUP_COLUMNS)},TOTAL_TIME_P50,TOTAL_TIME_P95,"
+        f"MEM_USAGE_P50,MEM_USAGE_P95) VALUES ({','.join('?' * (len(ROLLUP_COLUMNS) + 6))})",
+        [
+            (
+                *key,
+                first,
+                last,
+                session_count + len(sessions),
+                times.count,
+                *times.to_row(),
+                *memory.to_row(),
+                times.quantile(0.5),
+                times.quantile(0.95),
+                memory.quantile(0.5),
+                memory.quantile(0.95),
+            )
+            for key, (first, last, session_count, sessions, times, memory) in rollups.items()
+        ],
+    )
+
+
+def _fold_into_stats(cursor, runs):
+    """
+    Update TEST_STATS with the given runs.
+    :param runs: iterable of (ITEM_ID, ENV_ID, TOTAL_TIME, MEM_USAGE) tuples.
+    """
+    stats = {}
+    for item_id, env_id, total_time, mem_usage in runs:
+        key = item_id, env_id
+        if key not in stats:
+            cursor.execute(STAT_SELECT, key)
+            row = cursor.fetchone()
+            if row:
+                stats[key] = RunningStats(row[0], *row[1:6]), RunningStats(row[0], *row[6:])
+            else:
+                stats[key] = RunningStats(), RunningStats()
+        if total_time is not None and mem_usage is not None:
+            stats[key][0].add(total_time)
+            stats[key][1].add(mem_usage)
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO TEST_STATS(ITEM_ID,ENV_ID,{','.join(STAT_COLUMNS)})"
+        f" VALUES ({','.join('?' * (len(STAT_COLUMNS) + 2))})",
+        [(*key, times.count, *times.to_row(), *memory.to_row()) for key, (times, memory) in stats.items()],
+    )
+
+
+def connect(db_path, busy_timeout=BUSY_TIMEOUT):
+    """
+    Open a connection suited to concurrent writers: WAL journaling lets readers and a writer work
+    side by side, and waiting writers block for up to `busy_timeout` seconds instead of failing.
+    """
+    cnx = sqlite3.connect(db_path, timeout=busy_timeout)
+    # Only effective on new databases (and before switching to WAL), existing ones switch when compacted from the CLI.
+    cnx.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    cnx.execute("PRAGMA journal_mode=WAL")
+    cnx.execute("PRAGMA synchronous=NORMAL")
+    return cnx
+
+
+def connect_readonly(db_path):
+    """
+    Open a read-only connection to a database: neither migrations nor pragmas are applied to it.
+    :raise FileNotFoundError: if there is no database at `db_path`.
+    :raise sqlite3.DatabaseError: if the database was written by an older release, and must be upgraded first.
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"pytest-monitor: no database found at {db_path}")
+    cnx = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    row = cnx.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'SCHEMA_VERSION'").fetchone()
+    version = cnx.execute("SELECT MAX(VERSION) FROM SCHEMA_VERSION").fetchone()[0] if row else None
+    if version is None or version < SCHEMA_VERSION:
+        cnx.close()
+        raise sqlite3.DatabaseError(
+            f"pytest-monitor: {db_path} was written by an older release,"
+            f" upgrade it first with 'pytest-monitor --db {db_path} upgrade'."
+        )
+    return cnx
+
+
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+
+def retry_on_busy(operation):
+    """
+    Run `operation` again, after a random delay growing exponentially, as long as it fails because
+    the database is locked by another writer (at most BUSY_RETRIES times).
+    The operation must roll its transaction back on failure so that it can be safely run again.
+    """
+
+    @functools.wraps(operation)
+    def wrapper(*args, **kwargs):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return operation(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if attempt == BUSY_RETRIES or not is_busy(e):
+                    raise
+                time.sleep(random.uniform(0, BUSY_DELAY * 2**attempt))
+
+    return wrapper
+
+
+@retry_on_busy
+def write_metrics(cnx, rows, ids):
+    """
+    Write the given metric rows, and their details, using a single, short, transaction.
+    :param cnx: connection to the database.
+    :param rows: list of (test identity, metric values, details) tuples, as built by DBHandler.insert_metric.
+    :param ids: cache of the integer ids of sessions, contexts and test identities, updated once committed.
+    """
+    known = {}
+    cursor = cnx.cursor()
+    # Take the write lock upfront: upgrading a read transaction fails at once when another writer committed.
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+
+        def resolve(key, select, insert=None):
+            if key in ids:
+                return ids[key]
+            if key not in known:
+                if insert:
+                    cursor.execute(insert, key[1])
+                known[key] = cursor.execute(select, key[1]).fetchone()[0]
+            return known[key]
+
+        # Metric ids are allocated upfront (the write lock is held) so that details can refer to them. They
+        # follow the last id ever allocated, not the largest remaining one: ids of deleted metrics are not reused.
+        metric_id = cursor.execute(
+            "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'ITEM_METRICS'), 0)"
+        ).fetchone()[0]
+        values = []
+        details = {}
+        for identity, (session_h, env_h, *measures), metric_details in rows:
+            metric_id += 1
+            values.append(
+                (
+                    metric_id,
+                    resolve(("SESSION", (session_h,)), SESSION_SELECT),
+                    resolve(("ENV", (env_h,)), ENV_SELECT),
+                    resolve(("ITEM", identity), ITEM_SELECT, ITEM_INSERT),
+                    *measures,
+                )
+            )
+            for table, detail_rows in metric_details.items():
+                details.setdefault(table, []).extend((metric_id, *row) for row in detail_rows)
+        cursor.executemany(METRIC_INSERT, values)
+        for table, detail_rows in details.items():
+            columns = ("METRIC_ID", *METRIC_DETAILS[table])
+            cursor.executemany(
+                f"insert into {table}({','.join(columns)}) values ({','.join('?' * len(columns))})", detail_rows
+            )
+        cnx.commit()
+    except BaseException:
+        cnx.rollback()
+        raise
+    ids.update(known)
+
+
+class MetricWriter(threading.Thread):
+    """
+    Dedicated thread owning its own connection to the database. Metrics are pushed
+    to a bounded queue which is drained by batches, so that producers never wait on disk:
+    metrics pushed while the queue is full are dropped, and counted.
+    """
+
+    def __init__(self, db_path, queue_size=10000, busy_timeout=BUSY_TIMEOUT):
+        super().__init__(name="pytest-monitor-writer", daemon=True)
+        self.__db = db_path
+        self.__busy_timeout = busy_timeout
+        self.__queue = queue.Queue(maxsize=max(int(queue_size or 0), 0))
+        self.__ids = {}
+        self.__dropped = 0
+
+    @property
+    def dropped(self):
+        """Number of metrics dropped because the queue was full."""
+        return self.__dropped
+
+    def put(self, row):
+        try:
+            self.__queue.put_nowait(row)
+        except queue.Full:
+            self.__dropped += 1
+
+    def flush(self):
+        """Wait until every queued metric has been written."""
+        self.__queue.join()
+
+    def stop(self):
+        self.__queue.put(None)
+        self.join()
+        if self.__dropped:
+            warnings.warn(
+                f"pytest-monitor: {self.__dropped} metrics dropped, the writer thread queue was full"
+                " (see --db-queue-size)."
+            )
+
+    def run(self):
+        try:
+            cnx = connect(self.__db, self.__busy_timeout)
+        except sqlite3.Error as e:
+            # Keep draining the queue: producers waiting on flush or stop must not hang.
+            warnings.warn(f"pytest-monitor: unable to open {self.__db} ({e}), metrics will not be written.")
+            cnx = None
+        running = True
+        while running:
+            rows = [self.__queue.get()]
+            while True:
+                try:
+                    rows.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            running = None not in rows
+            batch = [row for row in rows if row is not None]
+            try:
+                if batch and cnx is not None:
+                    write_metrics(cnx, batch, self.__ids)
+            except sqlite3.Error as e:
+                warnings.warn(f"pytest-monitor: unable to write {len(batch)} metrics ({e}).")
+            finally:
+                for _ in rows:
+                    self.__queue.task_done()
+        if cnx is not None:
+            cnx.close()
 
 
 class DBHandler:
-    def __init__(self, db_path):
+    def __init__(
+        self, db_path, batch_size=1, flush_interval=None, background=False, queue_size=10000, busy_timeout=BUSY_TIMEOUT
+    ):
+        """
+        :param db_path: path to the sqlite database.
+        :param batch_size: number of metrics kept in memory before being written in a single transaction.
+        :param flush_interval: delay (in seconds) after which buffered metrics are written, checked when the
+                               next metric is inserted: metrics wait in memory as long as no other metric comes.
+        :param background: delegate metric writes to a dedicated thread (see MetricWriter).
+        :param queue_size: maximum number of metrics waiting to be written by the background thread,
+                           further metrics being dropped.
+        :param busy_timeout: maximum delay (in seconds) to wait for other processes writing to the same database.
+        """
         self.__db = db_path
-        self.__cnx = sqlite3.connect(self.__db) if db_path else None
+        self.__cnx = connect(self.__db, busy_timeout) if db_path else None
+        self.__batch_size = max(int(batch_size or 1), 1)
+        self.__flush_interval = flush_interval
+        self.__pending = []
+        self.__ids = {}
+        self.__oldest_pending = None
+        self.__writer = None
         self.prepare()
+        if background:
+            self.__writer = MetricWriter(self.__db, queue_size, busy_timeout)
+            self.__writer.start()
 
     def query(self, what, bind_to, many=False):
         cursor = self.__cnx.cursor()
         cursor.execute(what, bind_to)
         return cursor.fetchall() if many else cursor.fetchone()
 
+    def query_chunks(self, what, bind_to, size):
+        """Iterate over the result of a query by lists of at most `size` rows."""
+        cursor = self.__cnx.cursor()
+        cursor.execute(what, bind_to)
+        rows = cursor.fetchmany(size)
+        while rows:
+            yield rows
+            rows = cursor.fetchmany(size)
+
+    @retry_on_busy
     def insert_session(self, h, run_date, scm_id, description):
         with self.__cnx:
             self.__cnx.execute(
@@ -19,6 +954,19 @@ class DBHandler:
                 (h, run_date, scm_id, description),
             )
 
+    @retry_on_busy
+    def insert_fixture_metrics(self, session_h, env_h, rows):
+        """
+        Record fixture instantiations of a session, using a single transaction.
+        :param rows: values of FIXTURE_COLUMNS.
+        """
+        if not rows:
+            return
+        with self.__cnx:
+            session_id = self.__cnx.execute(SESSION_SELECT, (session_h,)).fetchone()[0]
+            env_id = self.__cnx.execute(ENV_SELECT, (env_h,)).fetchone()[0]
+            self.__cnx.executemany(FIXTURE_INSERT, [(session_id, env_id, *row) for row in rows])
+
     def insert_metric(
         self,
         session_id,
@@ -35,35 +983,190 @@ class DBHandler:
         kernel_time,
         cpu_usage,
         mem_usage,
+        details=None,
+        timings_ns=None,
+        counters=None,
+        threads=None,
+        gc_policy=None,
     ):
-        with self.__cnx:
-            self.__cnx.execute(
-                "insert into TEST_METRICS(SESSION_H,ENV_H,ITEM_START_TIME,ITEM,"
-                "ITEM_PATH,ITEM_VARIANT,ITEM_FS_LOC,KIND,COMPONENT,TOTAL_TIME,"
-                "USER_TIME,KERNEL_TIME,CPU_USAGE,MEM_USAGE) "
-                "values (?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
-                (
-                    session_id,
-                    env_id,
-                    item_start_date,
-                    item,
-                    item_path,
-                    item_variant,
-                    item_loc,
-                    kind,
-                    component,
-                    total_time,
-                    user_time,
-                    kernel_time,
-                    cpu_usage,
-                    mem_usage,
-                ),
+        """
+        Record the metrics of a test item.
+        :param details: optional rows of side tables (see METRIC_DETAILS) describing the metric, by table name.
+        :param timings_ns: exact total, user and kernel times in nanoseconds, derived from the times in seconds
+                           when not given.
+        :param counters: optional resource counters of the item, in the order of COUNTER_COLUMNS.
+        :param threads: optional spread of the CPU time of the item across threads, in the order of THREAD_COLUMNS.
+        :param gc_policy: optional garbage collection run before the item.
+        """
+        if timings_ns is None:
+            timings_ns = tuple(round(duration * 1e9) for duration in (total_time, user_time, kernel_time))
+        if counters is None:
+            counters = (None,) * len(COUNTER_COLUMNS)
+        if threads is None:
+            threads = (None,) * len(THREAD_COLUMNS)
+        row = (
+            (item_path, item, item_variant, item_loc, kind, component),
+            (
+                session_id,
+                env_id,
+                item_start_date,
+                total_time,
+                user_time,
+                kernel_time,
+                cpu_usage,
+                mem_usage,
+                *timings_ns,
+                *counters,
+                *threads,
+                gc_policy,
+            ),
+            details or {},
+        )
+        if self.__writer:
+            self.__writer.put(row)
+            return
+        if not self.__pending:
+            self.__oldest_pending = time.monotonic()
+        self.__pending.append(row)
+        if len(self.__pending) >= self.__batch_size or self._flush_due():
+            self.flush()
+
+    def _flush_due(self):
+        """Whether the oldest buffered metric has been waiting for more than the flush interval."""
+        if self.__flush_interval is None:
+            return False
+        return time.monotonic() - self.__oldest_pending >= self.__flush_interval
+
+    def flush(self):
+        """Write all buffered metrics using a single transaction."""
+        if self.__writer:
+            self.__writer.flush()
+        elif self.__pending and self.__cnx:
+            write_metrics(self.__cnx, self.__pending, self.__ids)
+        self.__pending = []
+        self.__oldest_pending = None
+
+    def close(self):
+        """Flush buffered metrics and release the underlying connection."""
+        if self.__cnx is None:
+            return
+        if self.__writer:
+            self.__writer.stop()
+            self.__writer = None
+        self.flush()
+        self.__cnx.close()
+        self.__cnx = None
+
+    @retry_on_busy
+    def apply_retention(self, keep_sessions=None, keep_days=None, vacuum=True):
+        """
+        Roll up then delete the raw metrics of the sessions which are neither among the `keep_sessions`
+        most recent sessions nor younger than `keep_days` days. Rolled up metrics are merged into a single
+        summary per test and execution context, in table ITEM_ROLLUPS.
+        :param keep_sessions: number of most recent sessions whose raw metrics are kept.
+        :param keep_days: number of days during which raw metrics are kept.
+        :param vacuum: reclaim the space freed by the deleted metrics, if the database is in incremental
+                       auto vacuum mode (see compact).
+        :return: a tuple (number of sessions whose metrics were rolled up, number of metrics deleted)
+        """
+        if keep_sessions is None and keep_days is None:
+            return 0, 0
+        self.flush()
+        sessions = self.query("SELECT SESSION_ID, RUN_DATE FROM TEST_SESSIONS ORDER BY RUN_DATE DESC", (), many=True)
+        oldest = time.time_ns() - int(keep_days * 86400 * 1e9) if keep_days is not None else None
+        expired = [
+            (session_id,)
+            for rank, (session_id, run_date) in enumerate(sessions)
+            if (keep_sessions is None or rank >= keep_sessions) and (oldest is None or (run_date or 0) < oldest)
+        ]
+        if not expired:
+            return 0, 0
+        cursor = self.__cnx.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS EXPIRED_SESSIONS(SESSION_ID integer primary key)")
+            cursor.execute("DELETE FROM temp.EXPIRED_SESSIONS")
+            cursor.executemany("INSERT INTO temp.EXPIRED_SESSIONS VALUES (?)", expired)
+            # Expired sessions are kept in TEST_SESSIONS: only those which still have metrics are counted.
+            cursor.execute(
+                "SELECT COUNT(DISTINCT SESSION_ID) FROM ITEM_METRICS"
+                " WHERE SESSION_ID IN (SELECT SESSION_ID FROM temp.EXPIRED_SESSIONS)"
+            )
+            rolled_up = cursor.fetchone()[0]
+            # Metrics are streamed from their own cursor: only the roll ups are held in memory.
+            runs = self.__cnx.execute(
+                "SELECT ITEM_ID, ENV_ID, ITEM_START_TIME, SESSION_ID, TOTAL_TIME, MEM_USAGE FROM ITEM_METRICS"
+                " WHERE SESSION_ID IN (SELECT SESSION_ID FROM temp.EXPIRED_SESSIONS) ORDER BY METRIC_ID"
             )
+            _fold_into_rollups(cursor, runs)
+            for table in METRIC_DETAILS:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE METRIC_ID IN (SELECT METRIC_ID FROM ITEM_METRICS"
+                    " WHERE SESSION_ID IN (SELECT SESSION_ID FROM temp.EXPIRED_SESSIONS))"
+                )
+            cursor.execute(
+                "DELETE FROM FIXTURE_METRICS WHERE SESSION_ID IN (SELECT SESSION_ID FROM temp.EXPIRED_SESSIONS)"
+            )
+            cursor.execute(
+                "DELETE FROM ITEM_METRICS WHERE SESSION_ID IN (SELECT SESSION_ID FROM temp.EXPIRED_SESSIONS)"
+            )
+            deleted = cursor.rowcount
+            self.__cnx.commit()
+        except BaseException:
+            self.__cnx.rollback()
+            raise
+        if vacuum:
+            self.compact(switch=False)
+        return rolled_up, deleted
+
+    @retry_on_busy
+    def update_stats(self, session_h):
+        """
+        Account for the metrics of the given session in TEST_STATS. This is done once per session,
+        at a cost proportional to the number of metrics of the session.
+        """
+        self.flush()
+        row = self.query(SESSION_SELECT, (session_h,))
+        if row is None:
+            return
+        cursor = self.__cnx.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("INSERT OR IGNORE INTO STATS_SESSIONS VALUES (?)", row)
+            if cursor.rowcount:
+                cursor.execute(
+                    "SELECT ITEM_ID, ENV_ID, TOTAL_TIME, MEM_USAGE FROM ITEM_METRICS WHERE SESSION_ID = ?"
+                    " ORDER BY METRIC_ID",
+                    row,
+                )
+                _fold_into_stats(cursor, cursor.fetchall())
+            self.__cnx.commit()
+        except BaseException:
+            self.__cnx.rollback()
+            raise
 
+    @retry_on_busy
+    def compact(self, switch=True):
+        """
+        Give the pages freed by deleted rows back to the file system.
+        :param switch: switch databases created before incremental auto vacuum to it, which requires
+                       a full VACUUM (done once, but rewriting the whole database). Nothing is reclaimed
+                       from such databases otherwise.
+        """
+        if self.query("PRAGMA auto_vacuum", ())[0] != 2:
+            if not switch:
+                return
+            self.__cnx.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.__cnx.execute("VACUUM")
+        else:
+            self.__cnx.execute("PRAGMA incremental_vacuum")
+
+    @retry_on_busy
     def insert_execution_context(self, exc_context):
+        # Another process sharing the database may have just registered the same context.
         with self.__cnx:
             self.__cnx.execute(
-                "insert into EXECUTION_CONTEXTS(CPU_COUNT,CPU_FREQUENCY_MHZ,CPU_TYPE,CPU_VENDOR,"
+                "insert or ignore into EXECUTION_CONTEXTS(CPU_COUNT,CPU_FREQUENCY_MHZ,CPU_TYPE,CPU_VENDOR,"
                 "RAM_TOTAL_MB,MACHINE_NODE,MACHINE_TYPE,MACHINE_ARCH,SYSTEM_INFO,"
                 "PYTHON_INFO,ENV_H) values (?,?,?,?,?,?,?,?,?,?,?)",
                 (
@@ -81,53 +1184,57 @@ class DBHandler:
                 ),
             )
 
+    def schema_version(self):
+        """
+        Version of the schema used by the database: 0 for an empty database, 1 for databases created
+        before schema versioning was introduced.
+        """
+        row = self.query("SELECT MAX(VERSION) FROM SCHEMA_VERSION", ())
+        if row[0] is not None:
+            return row[0]
+        row = self.query("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'TEST_METRICS'", ())
+        return 1 if row else 0
+
+    def migrate(self):
+        """Upgrade the database in place to the latest schema version."""
+        if self.schema_version() >= SCHEMA_VERSION:
+            return
+        # Take the write lock before reading the version again: another process may be migrating too.
+        cursor = self.__cnx.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            current = self.schema_version()
+            if current < SCHEMA_VERSION:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'view'")
+                for (view,) in cursor.fetchall():
+                    if view in COMPATIBILITY_VIEWS:
+                        cursor.execute(f"DROP VIEW {view}")
+                for version, migration in MIGRATIONS:
+                    if version > current:
+                        migration(cursor)
+                        cursor.execute(
+                            "INSERT INTO SCHEMA_VERSION(VERSION, APPLIED_AT) VALUES (?,?)", (version, time.time_ns())
+                        )
+                for view, definition in COMPATIBILITY_VIEWS.items():
+                    cursor.execute(f"CREATE VIEW {view} AS {definition}")
+            self.__cnx.commit()
+        except BaseException:
+            self.__cnx.rollback()
+            raise
+
+    @retry_on_busy
     def prepare(self):
+        self.__cnx.create_function("PYMON_ISO_TO_NS", 1, iso_to_ns, deterministic=True)
         cursor = self.__cnx.cursor()
         cursor.execute(
             """
-CREATE TABLE IF NOT EXISTS TEST_SESSIONS(
-    SESSION_H varchar(64) primary key not null unique, -- Session identifier
-    RUN_DATE varchar(64), -- Date of test run
-    SCM_ID varchar(128), -- SCM change id
-    RUN_DESCRIPTION json
-);"""
-        )
-        cursor.execute(
-            """
-CREATE TABLE IF NOT EXISTS TEST_METRICS (
-    SESSION_H varchar(64), -- Session identifier
-    ENV_H varchar(64), -- Environment description identifier
-    ITEM_START_TIME varchar(64), -- Effective start time of the test
-    ITEM_PATH varchar(4096), -- Path of the item, following Python import specification
-    ITEM varchar(2048), -- Name of the item
-    ITEM_VARIANT varchar(2048), -- Optional parametrization of an item.
-    ITEM_FS_LOC varchar(2048), -- Relative path from pytest invocation directory to the item's module.
-    KIND varchar(64), -- Package, Module or function
-    COMPONENT varchar(512) NULL, -- Tested component if any
-    TOTAL_TIME float, -- Total time spent running the item
-    USER_TIME float, -- time spent in user space
-    KERNEL_TIME float, -- time spent in kernel space
-    CPU_USAGE float, -- cpu usage
-    MEM_USAGE float, -- Max resident memory used.
-    FOREIGN KEY (ENV_H) REFERENCES EXECUTION_CONTEXTS(ENV_H),
-    FOREIGN KEY (SESSION_H) REFERENCES TEST_SESSIONS(SESSION_H)
+CREATE TABLE IF NOT EXISTS SCHEMA_VERSION (
+    VERSION integer not null, -- Schema version reached
+    APPLIED_AT integer -- Time at which the version was reached, in nanoseconds since epoch
 );"""
         )
-        cursor.execute(
-            """
-CREATE TABLE IF NOT EXISTS EXECUTION_CONTEXTS (
-   ENV_H varchar(64) primary key not null unique,
-   CPU_COUNT integer,
-   CPU_FREQUENCY_MHZ integer,
-   CPU_TYPE varchar(64),
-   CPU_VENDOR varchar(256),
-   RAM_TOTAL_MB integer,
-   MACHINE_NODE varchar(512),
-   MACHINE_TYPE varchar(32),
-   MACHINE_ARCH varchar(16),
-   SYSTEM_INFO varchar(256),
-   PYTHON_INFO varchar(512)
-);
-"""
-        )
+        self.__cnx.commit()
+        self.migrate()
+        for index, columns in METRIC_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index} ON ITEM_METRICS({columns});")
         self.__cnx.commit()
@@ -0,0 +1,381 @@
+"""
+Memory backends measuring the peak memory usage (resident set size, in MiB) of the current
+process while a test runs.
+"""
+import abc
+import array
+import os
+import sys
+import time
+import tracemalloc
+import zlib
+
+import psutil
+
+from pytest_monitor.sampling import WindowSampler
+
+MIB = 1024**2
+
+
+class MemoryBackend(abc.ABC):
+    """
+    Base class of memory backends. A measure is a window opened by `start` and closed by `stop`,
+    which returns the peak memory usage observed in the window.
+    """
+
+    name = None
+
+    def __init__(self):
+        # On Linux, /proc/self/statm is kept open and read again in place, which is much cheaper than psutil.
+        try:
+            self.__statm = os.open("/proc/self/statm", os.O_RDONLY)
+        except OSError:
+            self.__statm = None
+        self.__process = psutil.Process()
+        self.__page_size = os.sysconf("SC_PAGE_SIZE") if self.__statm is not None else None
+
+    def _rss(self):
+        """Resident set size of the current process, in bytes."""
+        if self.__statm is None:
+            return self.__process.memory_info().rss
+        return int(os.pread(self.__statm, 256, 0).split()[1]) * self.__page_size
+
+    def current(self):
+        """Memory currently used by the process, in MiB."""
+        return self._rss() / MIB
+
+    @abc.abstractmethod
+    def start(self):
+        """Open a measure window."""
+
+    @abc.abstractmethod
+    def stop(self):
+        """
+        Close the measure window.
+        :return: the peak memory usage observed in the window, in MiB.
+        """
+
+    def profile(self, function):
+        """
+        Run the given function and measure its peak memory usage.
+        :return: a tuple (peak memory usage in MiB, value returned by the function).
+        """
+        self.start()
+        try:
+            result = function()
+        finally:
+            peak = self.stop()
+        return peak, result
+
+    def details(self):
+        """Rows of side tables (see handler.METRIC_DETAILS) describing the last measure, by table name."""
+        return {}
+
+    def close(self):
+        """Release the resources held by the backend."""
+        if self.__statm is not None:
+            os.close(self.__statm)
+            self.__statm = None
+
+
+class MemoryProfilerBackend(MemoryBackend):
+    """
+    Measure each test with memory_profiler, which starts a new monitoring process for each measure.
+    memory_profiler is only imported by this backend: it imports IPython when available, whose objects
+    would otherwise slow down every garbage collection of the session.
+    """
+
+    name = "memory_profiler"
+
+    def start(self):
+        pass
+
+    def stop(self):
+        """memory_profiler only measures the peak memory usage of functions: this is the current usage."""
+        return self.current()
+
+    def profile(self, function):
+        import memory_profiler
+
+        m = memory_profiler.memory_usage((function, ()), max_iterations=1, max_usage=True, retval=True)
+        return m[0][0] if type(m[0]) is list else m[0], m[1]
+
+    def current(self):
+        import memory_profiler
+
+        memuse = memory_profiler.memory_usage(-1, max_iterations=1, max_usage=True)
+        return memuse[0] if type(memuse) is list else memuse
+
+
+def encode_series(samples):
+    """
+    Encode a series of (time offset in microseconds, memory in KiB) integer samples: the differences
+    between consecutive values, as little endian 64 bits integers (time and memory interleaved),
+    compressed with zlib.
+    """
+    deltas = array.array("q")
+    previous_time, previous_memory = 0, 0
+    for offset, memory in samples:
+        deltas.extend((offset - previous_time, memory - previous_memory))
+        previous_time, previous_memory = offset, memory
+    if sys.byteorder == "big":
+        deltas.byteswap()
+    return zlib.compress(deltas.tobytes())
+
+
+def decode_series(blob):
+    """
+    Decode a series encoded by `encode_series`.
+    :return: a list of (time offset in seconds, memory in MiB) samples.
+    """
+    deltas = array.array("q", zlib.decompress(blob))
+    if sys.byteorder == "big":
+        deltas.byteswap()
+    samples = []
+    offset, memory = 0, 0
+    for i in range(0, len(deltas), 2):
+        offset += deltas[i]
+        memory += deltas[i + 1]
+        samples.append((offset / 1e6, memory / 1024))
+    return samples
+
+
+class MemoryTimeline:
+    """
+    Series of memory samples of a window. Once `max_samples` samples are held, consecutive samples are
+    merged by pairs (keeping the time of the first one and the largest memory value) and each following
+    sample is the maximum of twice as many raw samples: long windows are downsampled without missing peaks.
+    """
+
+    def __init__(self, max_samples=1000):
+        self.__max_samples = max(int(max_samples), 2)
+        self.reset(0)
+
+    def reset(self, rss):
+        self.__start = time.perf_counter_ns()
+        self.__samples = []
+        self.__stride = 1
+        self.__pending = None
+        self.__pending_count = 0
+        self.add(rss)
+
+    def add(self, rss, last=False):
+        """Add a sample (RSS in bytes) taken now. The last sample of a window is always kept."""
+        offset = (time.perf_counter_ns() - self.__start) // 1000
+        if self.__pending is None:
+            self.__pending = (offset, rss)
+        else:
+            self.__pending = (self.__pending[0], max(self.__pending[1], rss))
+        self.__pending_count += 1
+        if self.__pending_count < self.__stride and not last:
+            return
+        self.__samples.append((self.__pending[0], self.__pending[1] // 1024))
+        self.__pending, self.__pending_count = None, 0
+        if len(self.__samples) >= self.__max_samples and not last:
+            pairs = zip(self.__samples[::2], self.__samples[1::2])
+            merged = [(first[0], max(first[1], second[1])) for first, second in pairs]
+            if len(self.__samples) % 2:
+                merged.append(self.__samples[-1])
+            self.__samples = merged
+            self.__stride *= 2
+
+    def to_row(self):
+        """Row of the TEST_MEMORY_SERIES table: downsampling stride, number of samples and encoded series."""
+        return self.__stride, len(self.__samples), encode_series(self.__samples)
+
+
+class SamplerBackend(WindowSampler, MemoryBackend):
+    """
+    A single long-lived thread samples the RSS of the process every `interval` seconds while a window
+    is open, and sleeps otherwise (see WindowSampler). Opening and closing a window costs two reads of the RSS.
+    Short spikes happening between two samples are missed, and the thread competes for the GIL
+    with the test: CPU bound tests are sampled at most every sys.getswitchinterval() seconds.
+    """
+
+    name = "sampler"
+
+    def __init__(self, interval=0.001, timeline=False, max_samples=1000):
+        """
+        :param interval: sampling interval, in seconds.
+        :param timeline: keep the whole series of samples of each window (see MemoryTimeline).
+        :param max_samples: maximum number of samples kept per window, beyond which the series is downsampled.
+        """
+        MemoryBackend.__init__(self)
+        WindowSampler.__init__(self, interval, "pytest-monitor-sampler")
+        self.__peak = 0
+        self.__timeline = MemoryTimeline(max_samples) if timeline else None
+
+    def _open(self):
+        self.__peak = self._rss()
+        if self.__timeline:
+            self.__timeline.reset(self.__peak)
+
+    def _sample(self):
+        rss = self._rss()
+        self.__peak = max(self.__peak, rss)
+        if self.__timeline:
+            self.__timeline.add(rss)
+
+    def _close(self):
+        rss = self._rss()
+        if self.__timeline:
+            self.__timeline.add(rss, last=True)
+        return max(self.__peak, rss) / MIB
+
+    def details(self):
+        if not self.__timeline:
+            return {}
+        return {"TEST_MEMORY_SERIES": [self.__timeline.to_row()]}
+
+    def close(self):
+        WindowSampler.close(self)
+        MemoryBackend.close(self)
+
+
+class HighWaterMarkBackend(MemoryBackend):
+    """
+    Exact peak memory usage, without sampling, using the RSS high-water mark maintained by the Linux kernel:
+    it is reset to the current RSS (by writing 5 to /proc/self/clear_refs) when a window opens, and read
+    from /proc/self/status (VmHWM) when it closes.
+    This also resets the maximum RSS reported by getrusage for the process.
+    """
+
+    name = "hwm"
+
+    def __init__(self):
+        super().__init__()
+        self.__status = self.__clear_refs = None
+        try:
+            self.__status = os.open("/proc/self/status", os.O_RDONLY)
+            self.__clear_refs = os.open("/proc/self/clear_refs", os.O_WRONLY)
+        except OSError:
+            self.close()
+            raise
+
+    @classmethod
+    def available(cls):
+        """Whether the kernel lets the current process reset and read its RSS high-water mark."""
+        try:
+            backend = cls()
+        except OSError:
+            return False
+        try:
+            backend.start()
+            return backend.stop() > 0
+        except (OSError, ValueError):
+            return False
+        finally:
+            backend.close()
+
+    def start(self):
+        os.pwrite(self.__clear_refs, b"5", 0)
+
+    def stop(self):
+        status = os.pread(self.__status, 4096, 0)
+        return int(status.split(b"VmHWM:", 1)[1].split(b"kB", 1)[0]) * 1024 / MIB
+
+    def close(self):
+        for fd in (self.__status, self.__clear_refs):
+            if fd is not None:
+                os.close(fd)
+        self.__status = self.__clear_refs = None
+        super().close()
+
+
+MEMORY_BACKENDS = {backend.name: backend for backend in (HighWaterMarkBackend, SamplerBackend, MemoryProfilerBackend)}
+
+
+def make_memory_backend(name="auto", interval=0.001, timeline=False, max_samples=1000):
+    """
+    Instantiate the memory backend of the given name. The 'auto' backend is the kernel high-water
+    mark when available, the sampler otherwise.
+    :param interval: sampling interval (in seconds) of the sampler backend.
+    :param timeline: keep the series of memory samples of each test, which requires the sampler backend.
+    :param max_samples: maximum number of samples kept per test, beyond which the series is downsampled.
+    :raise ValueError: if the requested backend cannot be used.
+    """
+    if name == "auto":
+        use_hwm = not timeline and HighWaterMarkBackend.available()
+        name = HighWaterMarkBackend.name if use_hwm else SamplerBackend.name
+    if name == SamplerBackend.name:
+        return SamplerBackend(interval, timeline, max_samples)
+    if timeline:
+        raise ValueError(f"pytest-monitor: memory timelines require the {SamplerBackend.name} memory backend.")
+    if name == HighWaterMarkBackend.name and not HighWaterMarkBackend.available():
+        raise ValueError(
+            f"pytest-monitor: the {name} memory backend is not available, the kernel does not let this process"
+            f" reset its RSS high-water mark (use '--memory-backend {SamplerBackend.name}' or 'auto')."
+        )
+    return MEMORY_BACKENDS[name]()
+
+
+def _on_return(code, callback):
+    """
+    Call `callback` right before the given code object returns, through an event local to it (sys.monitoring,
+    Python >= 3.12): the other functions run by the test are not slowed down.
+    :return: a function removing the hook, None if it could not be installed.
+    """
+    monitoring = getattr(sys, "monitoring", None)
+    if code is None or monitoring is None or monitoring.get_tool(monitoring.PROFILER_ID) is not None:
+        return None
+    tool, event = monitoring.PROFILER_ID, monitoring.events.PY_RETURN
+    monitoring.use_tool_id(tool, "pytest-monitor")
+    monitoring.register_callback(tool, event, lambda *_: callback())
+    monitoring.set_local_events(tool, code, event)
+
+    def remove():
+        monitoring.set_local_events(tool, code, 0)
+        monitoring.register_callback(tool, event, None)
+        monitoring.free_tool_id(tool)
+
+    return remove
+
+
+class AllocationTracer:
+    """
+    Trace the Python memory allocations of a test with tracemalloc: peak traced memory and top
+    allocation sites. Sites are those of the memory blocks still allocated when the test function
+    returns (its local variables included on Python >= 3.12); only `depth` frames are stored per allocation.
+    """
+
+    def __init__(self, depth=1, top=10):
+        self.__depth = max(int(depth), 1)
+        self.__top = top
+
+    def __sites(self, snapshot):
+        snapshot = snapshot.filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        )
+        key = "traceback" if self.__depth > 1 else "lineno"
+        return [
+            (rank, "\n".join(f"{f.filename}:{f.lineno}" for f in reversed(stat.traceback)), stat.size, stat.count)
+            for rank, stat in enumerate(snapshot.statistics(key)[: self.__top], start=1)
+        ]
+
+    def profile(self, function, code=None):
+        """
+        Run the given function while tracing memory allocations.
+        :param code: code object of the test function. On Python >= 3.12, the allocation sites are collected right
+                     before it returns, provided no other tool (profiler...) uses the same sys.monitoring tool id.
+                     They are collected once it returned otherwise, its local variables being released.
+        :return: a tuple (details rows by table, see handler.METRIC_DETAILS, value returned by the function),
+                 details being empty if tracemalloc was already in use.
+        """
+        if tracemalloc.is_tracing():
+            return {}, function()
+        snapshots = []
+        tracemalloc.start(self.__depth)
+        remove = _on_return(code, lambda: snapshots.append(tracemalloc.take_snapshot()))
+        try:
+            result = function()
+        finally:
+            if remove:
+                remove()
+            size, peak = tracemalloc.get_traced_memory()
+            snapshot = snapshots[-1] if snapshots else tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        details = {
+            "TEST_TRACEMALLOC": [(peak, size, self.__depth)],
+            "TEST_ALLOCATIONS": self.__sites(snapshot),
+        }
+        return details, result
@@ -0,0 +1,117 @@
+"""
+Accounting of the processes started by tests: subprocesses, multiprocessing pools...
+A single long-lived thread samples the descendants of the current process while a window is open: their
+CPU times and resident memory. Descendants which are gone by the end of the window are accounted from the
+resource usage of the waited-for children of the process (RUSAGE_CHILDREN), which includes the one of their
+own waited-for descendants.
+"""
+import collections
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import psutil
+
+from pytest_monitor.memory import MIB
+from pytest_monitor.sampling import WindowSampler
+from pytest_monitor.timing import NS
+
+
+class ProcessTree(
+    collections.namedtuple("ProcessTree", ("process_count", "user", "kernel", "mem_usage", "max_process_mem_usage"))
+):
+    """
+    Resources used by the descendants of a process during a window: number of descendants seen, their user and
+    kernel times (in nanoseconds), peak of the summed RSS of the process and its descendants, and peak RSS of a
+    single descendant (in MiB).
+    """
+
+    __slots__ = ()
+
+
+def children_usage():
+    """User and kernel times (in nanoseconds) and maximum RSS (in bytes) of the waited-for descendants."""
+    if resource is None:
+        return 0, 0, 0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    maxrss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024  # Kilobytes on Linux
+    return round(usage.ru_utime * NS), round(usage.ru_stime * NS), maxrss
+
+
+def cpu_times(process):
+    """User and kernel times of a process, and of its waited-for children, in nanoseconds."""
+    times = process.cpu_times()
+    user = times.user + getattr(times, "children_user", 0)
+    kernel = times.system + getattr(times, "children_system", 0)
+    return round(user * NS), round(kernel * NS)
+
+
+class ProcessTreeTracer(WindowSampler):
+    """
+    Measure the descendants of the current process between `start` and `stop`, sampled from a single long-lived
+    thread (see WindowSampler). Descendants living shorter than the sampling interval are not counted, but their
+    CPU time is once they have been waited for. Descendants running when the window opens, or outliving it, are
+    only accounted for the CPU time they used during the window (up to their last sample if they outlive it).
+    The CPU time used outside of any window is not accounted.
+    """
+
+    def __init__(self, interval=0.01):
+        """:param interval: sampling interval, in seconds."""
+        super().__init__(interval, "pytest-monitor-process-tree")
+        self.__process = psutil.Process()
+        self.__descendants = {}
+        self.__alive = set()
+        self.__starting = False
+        self.__usage = (0, 0, 0)
+        self.__peak = 0
+
+    def _sample(self):
+        """Sample the RSS and CPU times of the tree."""
+        try:
+            total = self.__process.memory_info().rss
+            children = self.__process.children(recursive=True)
+        except psutil.Error:
+            return
+        alive = set()
+        for child in children:
+            try:
+                with child.oneshot():
+                    times, rss = cpu_times(child), child.memory_info().rss
+            except psutil.Error:  # Exited meanwhile
+                continue
+            alive.add(child)
+            # Descendants already running when the window opened are only accounted from then on
+            baseline, _, peak = self.__descendants.get(child, (times if self.__starting else (0, 0), None, 0))
+            self.__descendants[child] = (baseline, times, max(peak, rss))
+            total += rss
+        self.__alive = alive
+        self.__peak = max(self.__peak, total)
+
+    def _open(self):
+        self.__descendants = {}
+        self.__peak = 0
+        self.__starting = True
+        self._sample()
+        self.__starting = False
+        self.__usage = children_usage()
+
+    def _close(self):
+        """:return: the ProcessTree measured since `start`."""
+        self._sample()
+        user, kernel, maxrss = (end - start for end, start in zip(children_usage(), self.__usage))
+        max_rss = max((peak for _, _, peak in self.__descendants.values()), default=0)
+        if maxrss > 0:  # A waited-for descendant used more memory than all the previous ones
+            max_rss = max(max_rss, self.__usage[2] + maxrss)
+        for child, ((start_user, start_kernel), end, _) in self.__descendants.items():
+            if child in self.__alive:
+                user += end[0] - start_user
+                kernel += end[1] - start_kernel
+            elif resource is not None:
+                # The usage of waited-for descendants covers their whole life, including the part
+                # preceding the window (if they were already running when it opened).
+                user -= start_user
+                kernel -= start_kernel
+        return ProcessTree(len(self.__descendants), user, kernel, self.__peak / MIB, max_rss / MIB)
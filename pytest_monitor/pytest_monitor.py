@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
-import gc
+import contextlib
 import time
 import warnings
 
-import memory_profiler
 import pytest
 
+from pytest_monitor.counters import CounterWatch
+from pytest_monitor.garbage import CollectionPolicy, CollectionWatch
+from pytest_monitor.memory import MEMORY_BACKENDS, AllocationTracer, make_memory_backend
+from pytest_monitor.process_tree import ProcessTreeTracer
 from pytest_monitor.session import PyTestMonitorSession
+from pytest_monitor.stats import describe
+from pytest_monitor.threads import ThreadTracer
+from pytest_monitor.timing import Stopwatch
 
 # These dictionaries are used to compute members set on each items.
 # KEY is the marker set on a test function
@@ -20,12 +26,18 @@ PYTEST_MONITOR_VALID_MARKERS = {
     "monitor_skip_test_if": (True, "monitor_skip_test", lambda x: bool(x), False),
     "monitor_test": (False, "monitor_force_test", lambda x: True, False),
     "monitor_test_if": (True, "monitor_force_test", lambda x: bool(x), False),
+    "monitor_tracemalloc": (False, "monitor_tracemalloc", lambda x: True, False),
+    "monitor_benchmark": (False, "monitor_benchmark", lambda x: True, False),
 }
 PYTEST_MONITOR_DEPRECATED_MARKERS = {}
 PYTEST_MONITOR_ITEM_LOC_MEMBER = "_location" if tuple(pytest.__version__.split(".")) < ("5", "3") else "location"
 
 PYTEST_MONITORING_ENABLED = True
 
+BENCHMARK_DEFAULT_ROUNDS = 5
+# Scopes measured around the tests they contain, from the outermost to the innermost.
+MONITORED_SCOPE_NODES = (("module", pytest.Module), ("class", pytest.Class))
+
 
 def pytest_addoption(parser):
     group = parser.getgroup("monitor")
@@ -64,6 +76,167 @@ def pytest_addoption(parser):
         dest="mtr_no_db",
         help="Do not store results in local db.",
     )
+    group.addoption(
+        "--db-batch-size",
+        action="store",
+        type=int,
+        dest="mtr_db_batch_size",
+        default=1,
+        help="Number of metrics buffered in memory before being written to the local db in a single transaction."
+        " Buffered metrics are always written at the end of the session.",
+    )
+    group.addoption(
+        "--db-flush-interval",
+        action="store",
+        type=float,
+        dest="mtr_db_flush_interval",
+        default=None,
+        help="Delay (in seconds) after which buffered metrics are written to the local db. It is checked when the"
+        " next test ends: metrics are not written while no other test ends.",
+    )
+    group.addoption(
+        "--db-writer-thread",
+        action="store_true",
+        dest="mtr_db_writer_thread",
+        help="Write metrics to the local db from a dedicated thread.",
+    )
+    group.addoption(
+        "--db-queue-size",
+        action="store",
+        type=int,
+        dest="mtr_db_queue_size",
+        default=10000,
+        help="Maximum number of metrics waiting to be written by the writer thread. Further metrics are dropped.",
+    )
+    group.addoption(
+        "--db-busy-timeout",
+        action="store",
+        type=float,
+        dest="mtr_db_busy_timeout",
+        default=30.0,
+        help="Maximum delay (in seconds) to wait for other processes writing to the same local db.",
+    )
+    group.addoption(
+        "--db-keep-sessions",
+        action="store",
+        type=int,
+        dest="mtr_db_keep_sessions",
+        default=None,
+        help="At the end of the session, roll up the raw metrics of all sessions but the given number of most"
+        " recent ones.",
+    )
+    group.addoption(
+        "--db-keep-days",
+        action="store",
+        type=float,
+        dest="mtr_db_keep_days",
+        default=None,
+        help="At the end of the session, roll up the raw metrics of sessions older than the given number of days.",
+    )
+    group.addoption(
+        "--memory-backend",
+        action="store",
+        dest="mtr_memory_backend",
+        default="auto",
+        choices=["auto", *sorted(MEMORY_BACKENDS)],
+        help="How peak memory usage of tests is measured: 'hwm' reads the high-water mark of the process maintained"
+        " by the Linux kernel, 'sampler' samples the memory of the process from a single thread shared by all tests,"
+        " 'memory_profiler' starts a new monitoring process for each test. 'auto' (the default) uses 'hwm' when"
+        " available, 'sampler' otherwise.",
+    )
+    group.addoption(
+        "--memory-interval",
+        action="store",
+        type=float,
+        dest="mtr_memory_interval",
+        default=0.001,
+        help="Interval (in seconds) between two memory samples of the 'sampler' memory backend.",
+    )
+    group.addoption(
+        "--monitor-benchmark-rounds",
+        action="store",
+        type=int,
+        dest="mtr_benchmark_rounds",
+        default=None,
+        help="Run each test the given number of times, recording the distribution of its time and memory usage."
+        " Use the monitor_benchmark marker to benchmark selected tests only.",
+    )
+    group.addoption(
+        "--monitor-benchmark-warmup",
+        action="store",
+        type=int,
+        dest="mtr_benchmark_warmup",
+        default=1,
+        help="Number of unmeasured runs of benchmarked tests before their measured rounds.",
+    )
+    group.addoption(
+        "--memory-timeline",
+        action="store_true",
+        dest="mtr_memory_timeline",
+        help="Keep the whole series of memory samples of each test (requires the 'sampler' memory backend).",
+    )
+    group.addoption(
+        "--memory-timeline-max-samples",
+        action="store",
+        type=int,
+        dest="mtr_memory_timeline_max_samples",
+        default=1000,
+        help="Maximum number of memory samples kept per test: longer series are downsampled, keeping peaks.",
+    )
+    group.addoption(
+        "--monitor-tracemalloc",
+        action="store_true",
+        dest="mtr_tracemalloc",
+        help="Trace Python memory allocations of each test with tracemalloc, recording the peak traced memory and"
+        " the top allocation sites. Allocation-heavy code runs up to about ten times slower (more with"
+        " --tracemalloc-depth), no trace function is installed otherwise. Use the monitor_tracemalloc marker to trace"
+        " selected tests only.",
+    )
+    group.addoption(
+        "--tracemalloc-depth",
+        action="store",
+        type=int,
+        dest="mtr_tracemalloc_depth",
+        default=1,
+        help="Number of frames stored for each traced allocation (the larger, the slower).",
+    )
+    group.addoption(
+        "--tracemalloc-top",
+        action="store",
+        type=int,
+        dest="mtr_tracemalloc_top",
+        default=10,
+        help="Number of allocation sites recorded for each traced test.",
+    )
+    group.addoption(
+        "--monitor-fixtures",
+        action="store_true",
+        dest="mtr_fixtures",
+        help="Measure the setup and teardown time and the memory growth of each fixture instantiation"
+        " (see the 'pytest-monitor fixtures' command).",
+    )
+    group.addoption(
+        "--monitor-process-tree",
+        action="store_true",
+        dest="mtr_process_tree",
+        help="Also account the processes started by each test (subprocesses, multiprocessing pools...):"
+        " their CPU time, and the peak memory usage of the whole process tree (table TEST_PROCESS_TREE).",
+    )
+    group.addoption(
+        "--monitor-process-tree-interval",
+        action="store",
+        type=float,
+        dest="mtr_process_tree_interval",
+        default=0.01,
+        help="Interval (in seconds) between two samples of the process tree (see --monitor-process-tree).",
+    )
+    group.addoption(
+        "--monitor-threads",
+        action="store_true",
+        dest="mtr_threads",
+        help="Measure how the CPU time of each test is spread across its threads: number of threads, share of the"
+        " busiest one and effective parallelism.",
+    )
     group.addoption(
         "--force-component",
         action="store",
@@ -80,7 +253,36 @@ def pytest_addoption(parser):
         "--no-gc",
         action="store_true",
         dest="mtr_disable_gc",
-        help="Disable garbage collection between tests (may leads to non reliable measures)",
+        help="Disable garbage collection between tests (may leads to non reliable measures)."
+        " Same as --monitor-gc off.",
+    )
+    group.addoption(
+        "--monitor-gc",
+        action="store",
+        dest="mtr_gc_policy",
+        default="full",
+        choices=CollectionPolicy.POLICIES,
+        help="Garbage collection run before each test: 'full' (the default), 'young' (two youngest generations"
+        " only), 'adaptive' (full collection only when --monitor-gc-gen2-threshold or --monitor-gc-rss-threshold"
+        " is reached, young collection otherwise) or 'off'.",
+    )
+    group.addoption(
+        "--monitor-gc-gen2-threshold",
+        action="store",
+        type=int,
+        dest="mtr_gc_gen2_threshold",
+        default=5,
+        help="Adaptive garbage collection: number of collections of the middle generation since the last full"
+        " collection triggering a full collection.",
+    )
+    group.addoption(
+        "--monitor-gc-rss-threshold",
+        action="store",
+        type=float,
+        dest="mtr_gc_rss_threshold",
+        default=32.0,
+        help="Adaptive garbage collection: growth of the resident memory (in MiB) since the last full collection"
+        " triggering a full collection.",
     )
     group.addoption(
         "--description",
@@ -116,16 +318,24 @@ def pytest_configure(config):
         " is verified. This can help you in whitelisting tests to be monitored"
         " depending on some external conditions.",
     )
+    config.addinivalue_line(
+        "markers",
+        "monitor_tracemalloc: trace Python memory allocations of the test with tracemalloc"
+        " (see --monitor-tracemalloc).",
+    )
+    config.addinivalue_line(
+        "markers",
+        "monitor_benchmark(rounds=5, warmup=1): run the test function warmup times, then measure it rounds times"
+        " (see --monitor-benchmark-rounds).",
+    )
 
 
-def pytest_runtest_setup(item):
+def setup_markers(item):
     """
     Validate marker setup and print warnings if usage of deprecated marker is identified.
     Setting marker attribute to the discovered item is done after the above described verification.
     :param item: Test item
     """
-    if not PYTEST_MONITORING_ENABLED:
-        return
     item_markers = {mark.name: mark for mark in item.iter_markers() if mark and mark.name.startswith("monitor_")}
     mark_to_del = []
     for set_marker in item_markers.keys():
@@ -158,23 +368,101 @@ def pytest_runtest_setup(item):
         item.monitor_skip_test = False
 
 
-@pytest.hookimpl(tryfirst=True, hookwrapper=True)
-def pytest_runtest_makereport(item, call):
+@contextlib.contextmanager
+def monitor_phase(item, phase):
     """
-    Used to identify the current call to add times.
-    :param item: Test item
-    :param call: call instance associated to the given item
+    Measure a phase (setup, call or teardown) of a monitored test: its timings and peak memory usage
+    are kept in item.monitor_phases. The peak memory usage of the call phase is the one of the test function.
     """
-    outcome = yield
-    rep = outcome.get_result()
+    # Items whose setup was not seen by the plugin are not monitored either
+    if getattr(item, "monitor_skip_test", True):
+        yield
+        return
+    start = time.perf_counter_ns()
+    monitor = item.session.pytest_monitor
+    if phase != "call":
+        monitor.memory_backend.start()
+    stopwatch = Stopwatch()
+    monitor.add_overhead(time.perf_counter_ns() - start)
+    try:
+        yield
+    finally:
+        timings = stopwatch.stop()
+        start = time.perf_counter_ns()
+        memuse = getattr(item, "mem_usage", None) if phase == "call" else monitor.memory_backend.stop()
+        if memuse is not None:
+            monitor.observe_memory(memuse)
+        item.monitor_phases = [*getattr(item, "monitor_phases", []), (phase, stopwatch.start_time_ns, timings, memuse)]
+        monitor.add_overhead(time.perf_counter_ns() - start)
+
+
+def monitored_scopes(item):
+    """Module and class nodes of an item, whose scopes are monitored."""
+    monitor = item.session.pytest_monitor
+    for kind, node_type in MONITORED_SCOPE_NODES:
+        node = item.getparent(node_type) if monitor.monitors_scope(kind) else None
+        if node is not None:
+            yield kind, node_type, node
+
+
+def open_scopes(item):
+    """Start measuring the modules and classes entered by an item."""
+    start = time.perf_counter_ns()
+    monitor = item.session.pytest_monitor
+    for kind, _, node in monitored_scopes(item):
+        if node not in item.session.monitor_scopes:
+            item.session.monitor_scopes[node] = (kind, monitor.track_memory_peak(), Stopwatch())
+    monitor.add_overhead(time.perf_counter_ns() - start)
+
+
+def close_scope(session, node):
+    """Record the metrics of a module or class once all of its tests are over."""
+    kind, peak, stopwatch = session.monitor_scopes.pop(node)
+    timings = stopwatch.stop()
+    start = time.perf_counter_ns()
+    monitor = session.pytest_monitor
+    if kind == "module":
+        item = node.name[:-3]
+        module, name, pypath = node.obj, item, node.obj.__name__[: -len(item) - 1]
+    else:
+        module = node.getparent(pytest.Module).obj
+        name, pypath = node.obj.__name__, module.__name__
+    monitor.add_test_info(
+        name,
+        pypath,
+        "",
+        node.nodeid,
+        kind,
+        getattr(module, "pytest_monitor_component", ""),
+        stopwatch.start_time_ns,
+        timings,
+        monitor.memory_peak(peak),
+    )
+    monitor.add_overhead(time.perf_counter_ns() - start)
+
+
+def close_scopes(item, nextitem):
+    """Record the modules and classes left by an item: the ones that nextitem does not share."""
+    for _, node_type, node in monitored_scopes(item):
+        if node in item.session.monitor_scopes and (nextitem is None or nextitem.getparent(node_type) is not node):
+            close_scope(item.session, node)
 
-    if rep.when == "call":
-        setattr(item, "test_run_duration", call.stop - call.start)
-        setattr(item, "test_effective_start_time", call.start)
+
+@pytest.hookimpl(hookwrapper=True, tryfirst=True)
+def pytest_runtest_setup(item):
+    if not PYTEST_MONITORING_ENABLED:
+        yield
+        return
+    setup_markers(item)
+    open_scopes(item)
+    with monitor_phase(item, "setup"):
+        yield
 
 
+@pytest.hookimpl(hookwrapper=True)
 def pytest_runtest_call(item):
     if not PYTEST_MONITORING_ENABLED:
+        yield
         return
     setattr(item, "monitor_results", False)
     if hasattr(item, "module"):
@@ -185,16 +473,81 @@ def pytest_runtest_call(item):
         )
     else:
         setattr(item, "monitor_skip_test", True)
+    with monitor_phase(item, "call"):
+        yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(item, nextitem):
+    """
+    Record the metrics of the test once all of its phases are over, and the ones of the modules and
+    classes torn down along with it.
+    """
+    if not PYTEST_MONITORING_ENABLED:
+        yield
+        return
+    with monitor_phase(item, "teardown"):
+        yield
+    close_scopes(item, nextitem)
+    if getattr(item, "monitor_skip_test", True) or not getattr(item, "monitor_results", False):
+        return
+    start = time.perf_counter_ns()
+    monitor = item.session.pytest_monitor
+    item_name = item.originalname or item.name
+    item_loc = getattr(item, PYTEST_MONITOR_ITEM_LOC_MEMBER)[0]
+    # Benchmarked tests report the timings of their median round.
+    timings = getattr(item, "monitor_timings", None) or item.test_timings
+    phases = [
+        (phase, start_ns, *phase_timings, memuse - monitor.mem_usage_base)
+        for phase, start_ns, phase_timings, memuse in item.monitor_phases
+    ]
+    monitor.add_test_info(
+        item_name,
+        item.module.__name__,
+        item.name,
+        item_loc,
+        "function",
+        item.monitor_component,
+        item.test_effective_start_time,
+        timings,
+        item.mem_usage,
+        details={**getattr(item, "monitor_details", {}), "TEST_PHASE_METRICS": phases},
+        counters=item.monitor_counters,
+        threads=item.monitor_threads,
+        gc_policy=item.monitor_gc_policy,
+    )
+    monitor.add_overhead(time.perf_counter_ns() - start)
+
+
+def benchmark_settings(item):
+    """
+    Number of measured rounds and of unmeasured warmup runs of a test, given the monitor_benchmark
+    marker and the command line options. No round means that the test is not benchmarked.
+    """
+    option = item.config.option
+    marker = item.get_closest_marker("monitor_benchmark")
+    if marker is None and not option.mtr_benchmark_rounds:
+        return 0, 0
+    kwargs = marker.kwargs if marker else {}
+    rounds = kwargs.get("rounds", option.mtr_benchmark_rounds or BENCHMARK_DEFAULT_ROUNDS)
+    warmup = kwargs.get("warmup", option.mtr_benchmark_warmup)
+    return max(int(rounds), 1), max(int(warmup), 0)
 
 
 @pytest.hookimpl
 def pytest_pyfunc_call(pyfuncitem):
     """
     Core sniffer logic. We encapsulate the test function in a sniffer function to collect
-    memory results.
+    memory results. Tests which are not monitored are left to pytest.
     """
+    if not PYTEST_MONITORING_ENABLED or getattr(pyfuncitem, "monitor_skip_test", True):
+        return None
+
+    function_ns = 0
 
     def wrapped_function():
+        nonlocal function_ns
+        start = time.perf_counter_ns()
         try:
             funcargs = pyfuncitem.funcargs
             testargs = {arg: funcargs[arg] for arg in pyfuncitem._fixtureinfo.argnames}
@@ -203,24 +556,167 @@ def pytest_pyfunc_call(pyfuncitem):
             raise
         except BaseException as e:
             return e
+        finally:
+            function_ns += time.perf_counter_ns() - start
+
+    def traced_function():
+        option = pyfuncitem.session.config.option
+        tracer = AllocationTracer(option.mtr_tracemalloc_depth, option.mtr_tracemalloc_top)
+        details, outcome = tracer.profile(wrapped_function, getattr(pyfuncitem.obj, "__code__", None))
+        setattr(pyfuncitem, "monitor_details", details)
+        return outcome
+
+    def measure(function):
+        memory_backend = pyfuncitem.session.pytest_monitor.memory_backend
+        memuse, outcome = memory_backend.profile(function)
+        if isinstance(outcome, BaseException):  # Do we have any outcome?
+            raise outcome
+        setattr(
+            pyfuncitem, "monitor_details", {**getattr(pyfuncitem, "monitor_details", {}), **memory_backend.details()}
+        )
+        return memuse
+
+    def measure_round(function):
+        """
+        Measure a run of the test function: start time, timings, memory usage, counters, process tree,
+        thread usage and garbage collections.
+        """
+        monitor = pyfuncitem.session.pytest_monitor
+        counters = CounterWatch(monitor.process)
+        for tracer in (monitor.process_tree, monitor.thread_tracer):
+            if tracer:
+                tracer.start()
+        collections = CollectionWatch()
+        stopwatch = Stopwatch()
+        try:
+            memuse = measure(function)
+        finally:
+            timings = stopwatch.stop()
+            collections = collections.stop()
+            tree = monitor.process_tree.stop() if monitor.process_tree else None
+            threads = monitor.thread_tracer.stop(timings.total) if monitor.thread_tracer else None
+        return stopwatch.start_time_ns, timings, memuse, counters.stop(), tree, threads, collections
+
+    def keep_round(timings, memuse, counters, tree, threads, collections):
+        """
+        Keep the counters, process tree, thread usage and garbage collections of the run of the test function
+        reported by the metric.
+        """
+        setattr(pyfuncitem, "monitor_counters", counters)
+        setattr(pyfuncitem, "monitor_threads", threads)
+        if collections.count:
+            row = (*collections.generations, *collections[1:])
+            setattr(pyfuncitem, "monitor_details", {**pyfuncitem.monitor_details, "TEST_GARBAGE_COLLECTIONS": [row]})
+        if tree is not None:
+            monitor = pyfuncitem.session.pytest_monitor
+            user, kernel = timings.user + tree.user, timings.kernel + tree.kernel
+            row = (
+                tree.process_count,
+                user,
+                kernel,
+                (user + kernel) / timings.total if timings.total else 0.0,
+                max(tree.mem_usage, memuse) - monitor.mem_usage_base,
+                tree.max_process_mem_usage,
+            )
+            setattr(pyfuncitem, "monitor_details", {**pyfuncitem.monitor_details, "TEST_PROCESS_TREE": [row]})
+
+    def benchmark(function, rounds, warmup):
+        monitor = pyfuncitem.session.pytest_monitor
+        for _ in range(warmup):
+            outcome = wrapped_function()
+            if isinstance(outcome, BaseException):
+                raise outcome
+        results = []
+        for _ in range(rounds):
+            collection = monitor.gc_policy.collect()
+            results.append((collection, *measure_round(function)[1:]))
+        # The metric of the test is the one of its median round (by duration), the upper one of the two middle
+        # rounds if their number is even: unlike the interpolated TOTAL_TIME_MEDIAN, it is an actual round.
+        collection, timings, memuse, *usage = sorted(results, key=lambda result: result[1].total)[len(results) // 2]
+        setattr(pyfuncitem, "monitor_timings", timings)
+        setattr(pyfuncitem, "monitor_gc_policy", collection)
+        keep_round(timings, memuse, *usage)
+        memory = [mem - monitor.mem_usage_base for _, _, mem, *_ in results]
+        seconds = [times.seconds() for _, times, *_ in results]
+        details = {
+            "TEST_BENCHMARKS": [(rounds, warmup, *describe([total for total, _, _ in seconds]), *describe(memory))],
+            "BENCHMARK_ROUNDS": [(i, *times, mem) for i, (times, mem) in enumerate(zip(seconds, memory), 1)],
+        }
+        setattr(pyfuncitem, "monitor_details", {**pyfuncitem.monitor_details, **details})
+        return memuse
 
     def prof():
-        m = memory_profiler.memory_usage((wrapped_function, ()), max_iterations=1, max_usage=True, retval=True)
-        if isinstance(m[1], BaseException):  # Do we have any outcome?
-            raise m[1]
-        memuse = m[0][0] if type(m[0]) is list else m[0]
+        function = wrapped_function
+        if pyfuncitem.session.config.option.mtr_tracemalloc or getattr(pyfuncitem, "monitor_tracemalloc", False):
+            function = traced_function
+        rounds, warmup = benchmark_settings(pyfuncitem)
+        monitor = pyfuncitem.session.pytest_monitor
+        if rounds:
+            # Each round is preceded by its own garbage collection, the warmup runs by none.
+            stopwatch = Stopwatch()
+            memuse = benchmark(function, rounds, warmup)
+            start_ns, timings = stopwatch.start_time_ns, stopwatch.stop()
+        else:
+            # Only the test function is timed, not the garbage collection preceding it.
+            setattr(pyfuncitem, "monitor_gc_policy", monitor.gc_policy.collect())
+            start_ns, timings, memuse, *usage = measure_round(function)
+            keep_round(timings, memuse, *usage)
+        setattr(pyfuncitem, "test_timings", timings)
+        setattr(pyfuncitem, "test_effective_start_time", start_ns)
         setattr(pyfuncitem, "mem_usage", memuse)
         setattr(pyfuncitem, "monitor_results", True)
 
-    if not PYTEST_MONITORING_ENABLED:
-        wrapped_function()
-    else:
-        if not pyfuncitem.session.config.option.mtr_disable_gc:
-            gc.collect()
+    start = time.perf_counter_ns()
+    try:
         prof()
+    finally:
+        pyfuncitem.session.pytest_monitor.add_overhead(time.perf_counter_ns() - start - function_ns)
     return True
 
 
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef, request):
+    """
+    Measure the setup of fixtures, and start measuring their teardown when their own finalizers
+    are about to run (finalizers run in reverse order of registration).
+    """
+    if (
+        not PYTEST_MONITORING_ENABLED
+        or not request.config.option.mtr_fixtures
+        or getattr(fixturedef.func, "__module__", None) == __name__
+    ):
+        yield
+        return
+    monitor = request.session.pytest_monitor
+    rss = monitor.memory_backend.current()
+    stopwatch = Stopwatch()
+    yield
+    timings = stopwatch.stop()
+    start = time.perf_counter_ns()
+    if fixturedef.cached_result is None or fixturedef.cached_result[2] is not None:
+        return  # Failed setup
+    record = monitor.add_fixture_info(
+        fixturedef.argname,
+        getattr(fixturedef.func, "__module__", None),
+        fixturedef.scope,
+        str(request.param) if hasattr(request, "param") else None,
+        stopwatch.start_time_ns,
+        timings.total,
+        monitor.memory_backend.current() - rss,
+    )
+    fixturedef.addfinalizer(lambda: setattr(fixturedef, "monitor_teardown", (record, Stopwatch())))
+    monitor.observe_memory(monitor.memory_backend.current())
+    monitor.add_overhead(time.perf_counter_ns() - start)
+
+
+def pytest_fixture_post_finalizer(fixturedef, request):
+    teardown = getattr(fixturedef, "monitor_teardown", None)
+    if teardown is not None:
+        record, stopwatch = teardown
+        request.session.pytest_monitor.set_fixture_teardown(record, stopwatch.stop().total)
+        fixturedef.monitor_teardown = None
+
+
 def pytest_make_parametrize_id(config, val, argname):
     if config.option.mtr_want_explicit_ids:
         return f"{argname}={val}"
@@ -249,65 +745,60 @@ def pytest_sessionstart(session):
         else session.config.option.mtr_db_out
     )
     remote = None if session.config.option.mtr_none else session.config.option.mtr_remote
+    start = time.perf_counter_ns()
+    try:
+        memory_backend = make_memory_backend(
+            session.config.option.mtr_memory_backend,
+            session.config.option.mtr_memory_interval,
+            session.config.option.mtr_memory_timeline,
+            session.config.option.mtr_memory_timeline_max_samples,
+        )
+    except ValueError as e:
+        raise pytest.UsageError(str(e))
     session.pytest_monitor = PyTestMonitorSession(
-        db=db, remote=remote, component=component, scope=session.config.option.mtr_scope
+        db=db,
+        remote=remote,
+        component=component,
+        scope=session.config.option.mtr_scope,
+        db_batch_size=session.config.option.mtr_db_batch_size,
+        db_flush_interval=session.config.option.mtr_db_flush_interval,
+        db_writer_thread=session.config.option.mtr_db_writer_thread,
+        db_queue_size=session.config.option.mtr_db_queue_size,
+        db_busy_timeout=session.config.option.mtr_db_busy_timeout,
+        db_keep_sessions=session.config.option.mtr_db_keep_sessions,
+        db_keep_days=session.config.option.mtr_db_keep_days,
+        memory_backend=memory_backend,
+        process_tree=(
+            ProcessTreeTracer(session.config.option.mtr_process_tree_interval)
+            if session.config.option.mtr_process_tree
+            else None
+        ),
+        thread_tracer=ThreadTracer() if session.config.option.mtr_threads else None,
+        gc_policy=CollectionPolicy(
+            "off" if session.config.option.mtr_disable_gc else session.config.option.mtr_gc_policy,
+            session.config.option.mtr_gc_gen2_threshold,
+            session.config.option.mtr_gc_rss_threshold,
+            memory_backend,
+        ),
     )
+    session.monitor_scopes = {}
     global PYTEST_MONITORING_ENABLED
     PYTEST_MONITORING_ENABLED = not session.config.option.mtr_none
     session.pytest_monitor.compute_info(session.config.option.mtr_description, session.config.option.mtr_tags)
+    session.pytest_monitor.add_overhead(time.perf_counter_ns() - start)
     yield
 
 
-@pytest.fixture(autouse=True, scope="module")
-def _prf_module_tracer(request):
-    if not PYTEST_MONITORING_ENABLED:
-        yield
-    else:
-        t_a = time.time()
-        ptimes_a = request.session.pytest_monitor.process.cpu_times()
-        yield
-        ptimes_b = request.session.pytest_monitor.process.cpu_times()
-        t_z = time.time()
-        rss = request.session.pytest_monitor.process.memory_info().rss / 1024**2
-        component = getattr(request.module, "pytest_monitor_component", "")
-        item = request.node.name[:-3]
-        pypath = request.module.__name__[: -len(item) - 1]
-        request.session.pytest_monitor.add_test_info(
-            item,
-            pypath,
-            "",
-            request.node._nodeid,
-            "module",
-            component,
-            t_a,
-            t_z - t_a,
-            ptimes_b.user - ptimes_a.user,
-            ptimes_b.system - ptimes_a.system,
-            rss,
-        )
-
-
-@pytest.fixture(autouse=True)
-def _prf_tracer(request):
-    if not PYTEST_MONITORING_ENABLED:
-        yield
-    else:
-        ptimes_a = request.session.pytest_monitor.process.cpu_times()
-        yield
-        ptimes_b = request.session.pytest_monitor.process.cpu_times()
-        if not request.node.monitor_skip_test and getattr(request.node, "monitor_results", False):
-            item_name = request.node.originalname or request.node.name
-            item_loc = getattr(request.node, PYTEST_MONITOR_ITEM_LOC_MEMBER)[0]
-            request.session.pytest_monitor.add_test_info(
-                item_name,
-                request.module.__name__,
-                request.node.name,
-                item_loc,
-                "function",
-                request.node.monitor_component,
-                request.node.test_effective_start_time,
-                request.node.test_run_duration,
-                ptimes_b.user - ptimes_a.user,
-                ptimes_b.system - ptimes_a.system,
-                request.node.mem_usage,
-            )
+@pytest.hookimpl(trylast=True)
+def pytest_sessionfinish(session):
+    """
+    Flush pending metrics once every fixture has been finalized.
+    This hook is also called when the session is interrupted.
+    """
+    if hasattr(session, "pytest_monitor"):
+        if PYTEST_MONITORING_ENABLED:
+            # Modules and classes of an interrupted session are torn down after their last test.
+            for node in list(session.monitor_scopes):
+                close_scope(session, node)
+            session.pytest_monitor.add_session_info(session.name)
+        session.pytest_monitor.close()
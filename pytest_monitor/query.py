@@ -0,0 +1,185 @@
+"""
+Read API over a pytest-monitor database.
+
+Results are cached (LRU) by database path, modification times and query, so that querying
+the same unchanged database again does not hit the disk. Each function returns an iterator
+of tuples, or a NumPy structured array when `as_array` is set (this requires numpy).
+"""
+import functools
+import os
+
+from pytest_monitor.handler import connect_readonly
+from pytest_monitor.stats import RunningStats
+
+CACHE_SIZE = 128
+
+HISTORY_COLUMNS = (
+    "SESSION_H",
+    "ENV_H",
+    "ITEM_START_TIME",
+    "TOTAL_TIME",
+    "USER_TIME",
+    "KERNEL_TIME",
+    "CPU_USAGE",
+    "MEM_USAGE",
+)
+SESSION_COLUMNS = ("SESSION_H", "RUN_DATE", "SCM_ID", "RUN_DESCRIPTION", "TEST_COUNT", "TOTAL_TIME", "MEM_USAGE")
+TOP_COLUMNS = ("ITEM_PATH", "ITEM", "ITEM_VARIANT", "KIND", "ENV_H", "TOTAL_TIME", "MEM_USAGE")
+TOP_CRITERIA = {"time": "TOTAL_TIME", "memory": "MEM_USAGE"}
+FIXTURE_COLUMNS = ("FIXTURE_NAME", "FIXTURE_PATH", "SCOPE", "SETUP_COUNT", "TOTAL_TIME", "MEM_USAGE")
+
+
+def _signature(db_path):
+    """
+    Identify the state of a database: writes in WAL mode may only change the -wal file.
+    An empty -wal file (as left by readers) is the same as no -wal file at all.
+    """
+    st = os.stat(db_path)
+    signature = [st.st_mtime_ns, st.st_size]
+    wal = f"{db_path}-wal"
+    if os.path.exists(wal) and os.path.getsize(wal):
+        st = os.stat(wal)
+        signature += [st.st_mtime_ns, st.st_size]
+    return tuple(signature)
+
+
+def _connect(db_path):
+    """Databases written by older releases are not upgraded (the read API never writes): an error is raised."""
+    return connect_readonly(db_path)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _fetch(db_path, signature, what, bind_to):
+    cnx = _connect(db_path)
+    try:
+        return tuple(cnx.execute(what, bind_to).fetchall())
+    finally:
+        cnx.close()
+
+
+def _stream(db_path, what, bind_to):
+    cnx = _connect(db_path)
+    try:
+        yield from cnx.execute(what, bind_to)
+    finally:
+        cnx.close()
+
+
+def _run(db_path, what, bind_to, columns, as_array, cache):
+    db_path = os.path.abspath(db_path)
+    if cache:
+        rows = iter(_fetch(db_path, _signature(db_path), what, tuple(bind_to)))
+    else:
+        rows = _stream(db_path, what, tuple(bind_to))
+    if not as_array:
+        return rows
+    import numpy as np
+
+    rows = list(rows)
+    if not rows:
+        return np.empty(0, dtype=[(column, np.float64) for column in columns])
+    arrays = [np.array([np.nan if v is None else v for v in values]) for values in zip(*rows)]
+    return np.rec.fromarrays(arrays, names=list(columns)).view(np.ndarray)
+
+
+def clear_cache():
+    """Drop all cached results."""
+    _fetch.cache_clear()
+
+
+def history(db_path, item_path, item, item_variant, kind="function", env_h=None, as_array=False, cache=True):
+    """
+    Metrics of every run of a test, ordered by start time.
+    :param item_path: path of the item (ITEM_PATH, for instance 'tests.test_module').
+    :param item: name of the item (ITEM, for instance 'test_a').
+    :param item_variant: full name of the item, with its parametrization if any (ITEM_VARIANT).
+    :param kind: type of item (function, class, module...).
+    :param env_h: restrict the history to a given execution context.
+    :return: rows of HISTORY_COLUMNS.
+    """
+    what = (
+        f"SELECT {','.join(HISTORY_COLUMNS)} FROM TEST_METRICS"
+        " WHERE ITEM_PATH = ? AND ITEM = ? AND ITEM_VARIANT = ? AND KIND = ? AND (? IS NULL OR ENV_H = ?)"
+        " ORDER BY ITEM_START_TIME"
+    )
+    bind_to = (item_path, item, item_variant, kind, env_h, env_h)
+    return _run(db_path, what, bind_to, HISTORY_COLUMNS, as_array, cache)
+
+
+def sessions(db_path, kind="function", as_array=False, cache=True):
+    """
+    Summary of every session, ordered by date: number of monitored items, total time spent
+    in them and peak memory usage.
+    :param kind: type of the summarized items (function, class, module...), tests by default.
+    :return: rows of SESSION_COLUMNS.
+    """
+    what = (
+        "SELECT S.SESSION_H, S.RUN_DATE, S.SCM_ID, S.RUN_DESCRIPTION, COUNT(M.METRIC_ID), SUM(M.TOTAL_TIME),"
+        " MAX(M.MEM_USAGE) FROM TEST_SESSIONS S LEFT JOIN ITEM_METRICS M ON M.SESSION_ID = S.SESSION_ID"
+        " AND M.ITEM_ID IN (SELECT ITEM_ID FROM TEST_ITEMS WHERE KIND = ?)"
+        " GROUP BY S.SESSION_ID ORDER BY S.RUN_DATE"
+    )
+    return _run(db_path, what, (kind,), SESSION_COLUMNS, as_array, cache)
+
+
+def top(db_path, n=10, by="time", session_h=None, kind="function", as_array=False, cache=True):
+    """
+    Slowest (by='time') or most memory hungry (by='memory') items.
+    :param kind: type of the ranked items (function, class, module...), tests by default.
+    :param session_h: rank the items of a given session. By default, items are ranked over the whole
+                      history, using their mean values from TEST_STATS.
+    :return: rows of TOP_COLUMNS.
+    """
+    if by not in TOP_CRITERIA:
+        raise ValueError(f"pytest-monitor: unknown criterion {by}, expecting one of {', '.join(TOP_CRITERIA)}")
+    column = TOP_CRITERIA[by]
+    if session_h is None:
+        what = (
+            "SELECT I.ITEM_PATH, I.ITEM, I.ITEM_VARIANT, I.KIND, E.ENV_H, S.TOTAL_TIME_MEAN, S.MEM_USAGE_MEAN"
+            " FROM TEST_STATS S JOIN TEST_ITEMS I ON I.ITEM_ID = S.ITEM_ID"
+            " JOIN EXECUTION_CONTEXTS E ON E.ENV_ID = S.ENV_ID"
+            f" WHERE I.KIND = ? ORDER BY S.{column}_MEAN DESC LIMIT ?"
+        )
+        bind_to = (kind, n)
+    else:
+        what = (
+            f"SELECT {','.join(TOP_COLUMNS)} FROM TEST_METRICS WHERE SESSION_H = ? AND KIND = ?"
+            f" ORDER BY {column} DESC LIMIT ?"
+        )
+        bind_to = (session_h, kind, n)
+    return _run(db_path, what, bind_to, TOP_COLUMNS, as_array, cache)
+
+
+def top_fixtures(db_path, n=10, by="time", session_h=None, as_array=False, cache=True):
+    """
+    Fixtures costing the most time (by='time': total time spent setting them up and tearing them down,
+    in seconds) or memory (by='memory': largest memory growth of a setup, in megabytes).
+    :param session_h: rank the fixtures of a given session. By default, the whole history is accounted for.
+    :return: rows of FIXTURE_COLUMNS.
+    """
+    if by not in TOP_CRITERIA:
+        raise ValueError(f"pytest-monitor: unknown criterion {by}, expecting one of {', '.join(TOP_CRITERIA)}")
+    what = (
+        "SELECT F.FIXTURE_NAME, F.FIXTURE_PATH, F.SCOPE, COUNT(*) AS SETUP_COUNT,"
+        " SUM(F.SETUP_TIME_NS + COALESCE(F.TEARDOWN_TIME_NS, 0)) / 1e9 AS TOTAL_TIME, MAX(F.MEM_USAGE) AS MEM_USAGE"
+        " FROM FIXTURE_METRICS F JOIN TEST_SESSIONS S ON S.SESSION_ID = F.SESSION_ID WHERE ? IS NULL OR S.SESSION_H = ?"
+        f" GROUP BY F.FIXTURE_NAME, F.FIXTURE_PATH, F.SCOPE ORDER BY {TOP_CRITERIA[by]} DESC LIMIT ?"
+    )
+    return _run(db_path, what, (session_h, session_h, n), FIXTURE_COLUMNS, as_array, cache)
+
+
+def baseline(db_path, item_path, item, item_variant, env_h, kind="function"):
+    """
+    Statistics of a test over its whole history, read from TEST_STATS.
+    :return: a tuple of RunningStats (duration, memory usage), or None if the test is unknown.
+    """
+    what = (
+        "SELECT S.RUN_COUNT, S.TOTAL_TIME_MEAN, S.TOTAL_TIME_M2, S.TOTAL_TIME_MIN, S.TOTAL_TIME_MAX,"
+        " S.TOTAL_TIME_SKETCH, S.MEM_USAGE_MEAN, S.MEM_USAGE_M2, S.MEM_USAGE_MIN, S.MEM_USAGE_MAX, S.MEM_USAGE_SKETCH"
+        " FROM TEST_STATS S JOIN TEST_ITEMS I ON I.ITEM_ID = S.ITEM_ID JOIN EXECUTION_CONTEXTS E ON E.ENV_ID = S.ENV_ID"
+        " WHERE I.ITEM_PATH = ? AND I.ITEM = ? AND I.ITEM_VARIANT = ? AND I.KIND = ? AND E.ENV_H = ?"
+    )
+    row = next(_run(db_path, what, (item_path, item, item_variant, kind, env_h), (), False, True), None)
+    if row is None:
+        return None
+    return RunningStats(row[0], *row[1:6]), RunningStats(row[0], *row[6:])
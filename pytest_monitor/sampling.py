@@ -0,0 +1,79 @@
+"""
+Sampling of the current process while a measure window is open, shared by the memory sampler, the process
+tree tracer and the thread tracer.
+"""
+import abc
+import threading
+import time
+
+
+class WindowSampler(abc.ABC):
+    """
+    A single long-lived thread, started with the first window, calls `_sample` every `interval` seconds while
+    a window is open, and sleeps otherwise. Windows are opened by `start` and closed by `stop`, which call
+    `_open` and `_close`. `_open`, `_sample` and `_close` are always called with the same lock held: a sample
+    taken while a window closes is discarded.
+    """
+
+    def __init__(self, interval, thread_name):
+        """
+        :param interval: sampling interval, in seconds.
+        :param thread_name: name of the sampling thread, which must start with 'pytest-monitor'.
+        """
+        self.__interval = interval
+        self.__thread_name = thread_name
+        self.__lock = threading.Lock()
+        self.__active = threading.Event()
+        self.__window = 0
+        self.__closed = False
+        self.__thread = None
+
+    @abc.abstractmethod
+    def _open(self):
+        """Reset the measure and take its first sample."""
+
+    @abc.abstractmethod
+    def _sample(self):
+        """Take a sample."""
+
+    @abc.abstractmethod
+    def _close(self, *args):
+        """
+        Take the last sample.
+        :return: the measure of the window.
+        """
+
+    def __run(self):
+        while True:
+            self.__active.wait()
+            if self.__closed:
+                return
+            window = self.__window
+            with self.__lock:
+                if window == self.__window:
+                    self._sample()
+            time.sleep(self.__interval)
+
+    def start(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, name=self.__thread_name, daemon=True)
+            self.__thread.start()
+        with self.__lock:
+            self.__window += 1
+            self._open()
+        self.__active.set()
+
+    def stop(self, *args):
+        """:return: the measure of the window, the arguments being passed to `_close`."""
+        self.__active.clear()
+        with self.__lock:
+            self.__window += 1
+            return self._close(*args)
+
+    def close(self):
+        """Stop the sampling thread."""
+        if self.__thread is not None:
+            self.__closed = True
+            self.__active.set()
+            self.__thread.join()
+            self.__thread = None
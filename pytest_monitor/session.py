@@ -2,26 +2,55 @@ import datetime
 import hashlib
 import json
 import os
+import time
 import warnings
 from http import HTTPStatus
 
-import memory_profiler
 import psutil
 import requests
 
+from pytest_monitor.garbage import CollectionPolicy
 from pytest_monitor.handler import DBHandler
+from pytest_monitor.memory import make_memory_backend
 from pytest_monitor.sys_utils import (
     ExecutionContext,
     collect_ci_info,
     determine_scm_revision,
 )
+from pytest_monitor.timing import Stopwatch
 
 
 class PyTestMonitorSession:
-    def __init__(self, db=None, remote=None, component="", scope=None, tracing=True):
+    def __init__(
+        self,
+        db=None,
+        remote=None,
+        component="",
+        scope=None,
+        tracing=True,
+        db_batch_size=1,
+        db_flush_interval=None,
+        db_writer_thread=False,
+        db_queue_size=10000,
+        db_busy_timeout=30.0,
+        db_keep_sessions=None,
+        db_keep_days=None,
+        memory_backend=None,
+        process_tree=None,
+        thread_tracer=None,
+        gc_policy=None,
+    ):
         self.__db = None
         if db:
-            self.__db = DBHandler(db)
+            self.__db = DBHandler(
+                db,
+                batch_size=db_batch_size,
+                flush_interval=db_flush_interval,
+                background=db_writer_thread,
+                queue_size=db_queue_size,
+                busy_timeout=db_busy_timeout,
+            )
+        self.__retention = db_keep_sessions, db_keep_days
         self.__monitor_enabled = tracing
         self.__remote = remote
         self.__component = component
@@ -29,6 +58,17 @@ class PyTestMonitorSession:
         self.__scope = scope or []
         self.__eid = (None, None)
         self.__mem_usage_base = None
+        self.__fixtures = []
+        self.__stopwatch = Stopwatch()
+        self.__overhead_ns = 0
+        self.__test_count = 0
+        self.__test_time_ns = 0
+        self.__peaks = {}
+        self.__session_peak = None
+        self.__memory = memory_backend or make_memory_backend()
+        self.__process_tree = process_tree
+        self.__thread_tracer = thread_tracer
+        self.__gc_policy = gc_policy or CollectionPolicy()
         self.__process = psutil.Process(os.getpid())
 
     @property
@@ -43,10 +83,33 @@ class PyTestMonitorSession:
     def db_env_id(self):
         return self.__eid[0]
 
+    @property
+    def mem_usage_base(self):
+        return self.__mem_usage_base
+
+    @property
+    def memory_backend(self):
+        return self.__memory
+
     @property
     def process(self):
         return self.__process
 
+    @property
+    def process_tree(self):
+        """Tracer of the processes started by tests (see pytest_monitor.process_tree), if enabled."""
+        return self.__process_tree
+
+    @property
+    def thread_tracer(self):
+        """Tracer of the CPU time of threads (see pytest_monitor.threads), if enabled."""
+        return self.__thread_tracer
+
+    @property
+    def gc_policy(self):
+        """Garbage collection run before each test (see pytest_monitor.garbage)."""
+        return self.__gc_policy
+
     def get_env_id(self, env):
         db, remote = None, None
         if self.__db:
@@ -64,7 +127,8 @@ class PyTestMonitorSession:
         return db, remote
 
     def compute_info(self, description, tags):
-        run_date = datetime.datetime.now().isoformat()
+        run_date_ns = time.time_ns()
+        run_date = datetime.datetime.fromtimestamp(run_date_ns / 1e9).isoformat()
         scm = determine_scm_revision()
         h = hashlib.md5()
         h.update(scm.encode())
@@ -88,7 +152,7 @@ class PyTestMonitorSession:
         self.prepare()
         self.set_environment_info(ExecutionContext())
         if self.__db:
-            self.__db.insert_session(self.__session, run_date, scm, description)
+            self.__db.insert_session(self.__session, run_date_ns, scm, description)
         if self.__remote:
             r = requests.post(
                 f"{self.__remote}/sessions/",
@@ -120,12 +184,81 @@ class PyTestMonitorSession:
                 remote_id = json.loads(r.text)["h"]
         self.__eid = db_id, remote_id
 
+    def close(self):
+        """Make sure that every collected metric reaches the local storage."""
+        self.__memory.close()
+        for tracer in (self.__process_tree, self.__thread_tracer):
+            if tracer:
+                tracer.close()
+        if self.__db:
+            if self.db_env_id is not None:
+                self.__db.insert_fixture_metrics(self.__session, self.db_env_id, self.__fixtures)
+            self.__db.update_stats(self.__session)
+            self.__db.apply_retention(*self.__retention)
+            self.__db.close()
+
     def prepare(self):
-        def dummy():
-            return True
+        self.__mem_usage_base = self.__memory.current()
+        self.__session_peak = self.track_memory_peak()
+
+    def add_overhead(self, duration_ns):
+        """Account the given time (in nanoseconds) as spent by pytest-monitor itself."""
+        self.__overhead_ns += duration_ns
+
+    def track_memory_peak(self):
+        """
+        Start tracking the peak of the memory usages observed from now on (see `observe_memory`).
+        :return: a token to be given to `memory_peak`.
+        """
+        token = object()
+        self.__peaks[token] = self.__memory.current()
+        return token
+
+    def observe_memory(self, mem_usage):
+        """Account a memory usage (in MiB) measured by the plugin in the peaks being tracked."""
+        for token, peak in self.__peaks.items():
+            if mem_usage > peak:
+                self.__peaks[token] = mem_usage
+
+    def memory_peak(self, token):
+        """Stop tracking a peak: the largest memory usage (in MiB) observed since `track_memory_peak`."""
+        return max(self.__peaks.pop(token), self.__memory.current())
+
+    def add_session_info(self, name):
+        """
+        Record the metrics of the whole session, along with the number of monitored tests, the time
+        spent in them and the time spent by pytest-monitor itself.
+        """
+        timings = self.__stopwatch.stop()
+        self.add_test_info(
+            name,
+            "",
+            "",
+            "",
+            "session",
+            "",
+            self.__stopwatch.start_time_ns,
+            timings,
+            self.memory_peak(self.__session_peak),
+            details={"MONITOR_OVERHEAD": [(self.__test_count, self.__test_time_ns, self.__overhead_ns)]},
+        )
+
+    def monitors_scope(self, kind):
+        """Whether items of the given kind (function, class, module or session) are recorded."""
+        return kind in self.__scope
+
+    def add_fixture_info(self, name, path, scope, param, setup_start_ns, setup_time_ns, mem_usage):
+        """
+        Record the instantiation of a fixture (stored in the local database only, when the session ends).
+        :return: the record of the instantiation, to be given to `set_fixture_teardown`.
+        """
+        record = [name, path, scope, param, setup_start_ns, setup_time_ns, None, mem_usage]
+        if self.__db:
+            self.__fixtures.append(record)
+        return record
 
-        memuse = memory_profiler.memory_usage((dummy,), max_iterations=1, max_usage=True)
-        self.__mem_usage_base = memuse[0] if type(memuse) is list else memuse
+    def set_fixture_teardown(self, record, teardown_time_ns):
+        record[6] = teardown_time_ns
 
     def add_test_info(
         self,
@@ -135,17 +268,31 @@ class PyTestMonitorSession:
         item_loc,
         kind,
         component,
-        item_start_time,
-        total_time,
-        user_time,
-        kernel_time,
+        item_start_ns,
+        timings,
         mem_usage,
+        details=None,
+        counters=None,
+        threads=None,
+        gc_policy=None,
     ):
-        if kind not in self.__scope:
+        """
+        Record the metrics of an item.
+        :param item_start_ns: start time of the item, in nanoseconds since epoch.
+        :param timings: elapsed, user and kernel times of the item, in nanoseconds (see pytest_monitor.timing).
+        :param counters: I/O, context switch and page fault counters of the item (see pytest_monitor.counters).
+        :param threads: spread of the CPU time of the item across threads (see pytest_monitor.threads).
+        :param gc_policy: garbage collection run before the item (see pytest_monitor.garbage.CollectionPolicy).
+        """
+        if kind == "function":
+            self.__test_count += 1
+            self.__test_time_ns += timings.total
+        if not self.monitors_scope(kind):
             return
         mem_usage = float(mem_usage) - self.__mem_usage_base
-        cpu_usage = (user_time + kernel_time) / total_time
-        item_start_time = datetime.datetime.fromtimestamp(item_start_time).isoformat()
+        total_time, user_time, kernel_time = timings.seconds()
+        cpu_usage = (user_time + kernel_time) / total_time if total_time else 0.0
+        item_start_time = datetime.datetime.fromtimestamp(item_start_ns / 1e9).isoformat()
         final_component = self.__component.format(user_component=component)
         if final_component.endswith("."):
             final_component = final_component[:-1]
@@ -154,7 +301,7 @@ class PyTestMonitorSession:
             self.__db.insert_metric(
                 self.__session,
                 self.db_env_id,
-                item_start_time,
+                item_start_ns,
                 item,
                 item_path,
                 item_variant,
@@ -166,6 +313,11 @@ class PyTestMonitorSession:
                 kernel_time,
                 cpu_usage,
                 mem_usage,
+                details=details,
+                timings_ns=tuple(timings),
+                counters=counters,
+                threads=threads,
+                gc_policy=gc_policy,
             )
         if self.__remote and self.remote_env_id is not None:
             r = requests.post(
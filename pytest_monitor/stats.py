@@ -0,0 +1,130 @@
+import json
+import math
+
+
+def percentile(values, q):
+    """Linearly interpolated percentile of a sorted, non empty, list of values."""
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def describe(values):
+    """Minimum, median, mean, standard deviation and interquartile range of a non empty list of values."""
+    values = sorted(values)
+    mean = sum(values) / len(values)
+    stddev = math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1)) if len(values) > 1 else 0.0
+    return values[0], percentile(values, 50), mean, stddev, percentile(values, 75) - percentile(values, 25)
+
+
+class QuantileSketch:
+    """
+    Approximate quantiles of a series of values, with a bounded relative error.
+    Values are counted in logarithmic buckets (as in DDSketch): any quantile estimate
+    lies within `accuracy` (relative) of an actual value of the series.
+    """
+
+    def __init__(self, accuracy=0.01, positive=None, negative=None, zero=0):
+        self.__accuracy = accuracy
+        self.__gamma = (1 + accuracy) / (1 - accuracy)
+        self.__log_gamma = math.log(self.__gamma)
+        self.__positive = positive or {}
+        self.__negative = negative or {}
+        self.__zero = zero
+
+    @property
+    def count(self):
+        return self.__zero + sum(self.__positive.values()) + sum(self.__negative.values())
+
+    def __key(self, value):
+        return math.ceil(math.log(value) / self.__log_gamma)
+
+    def __value(self, key):
+        return 2 * self.__gamma**key / (self.__gamma + 1)
+
+    def add(self, value):
+        if abs(value) < 1e-12:
+            self.__zero += 1
+        else:
+            buckets = self.__positive if value > 0 else self.__negative
+            key = self.__key(abs(value))
+            buckets[key] = buckets.get(key, 0) + 1
+
+    def quantile(self, q):
+        """Estimate the q-th quantile (0 <= q <= 1), None if the sketch is empty."""
+        count = self.count
+        if not count:
+            return None
+        rank = q * (count - 1)
+        seen = 0
+        for key in sorted(self.__negative, reverse=True):
+            seen += self.__negative[key]
+            if seen > rank:
+                return -self.__value(key)
+        seen += self.__zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.__positive):
+            seen += self.__positive[key]
+            if seen > rank:
+                return self.__value(key)
+        return self.__value(max(self.__positive))
+
+    def to_json(self):
+        return json.dumps({"a": self.__accuracy, "p": self.__positive, "n": self.__negative, "z": self.__zero})
+
+    @classmethod
+    def from_json(cls, text):
+        d = json.loads(text)
+        positive = {int(k): v for k, v in d["p"].items()}
+        negative = {int(k): v for k, v in d["n"].items()}
+        return cls(d["a"], positive, negative, d["z"])
+
+
+class RunningStats:
+    """Count, mean and variance (Welford's algorithm), extrema and quantile sketch of a series of values."""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, minimum=None, maximum=None, sketch=None):
+        self.__count = count
+        self.__mean = mean
+        self.__m2 = m2
+        self.__min = minimum
+        self.__max = maximum
+        self.__sketch = QuantileSketch.from_json(sketch) if sketch else QuantileSketch()
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def mean(self):
+        return self.__mean
+
+    @property
+    def variance(self):
+        return self.__m2 / (self.__count - 1) if self.__count > 1 else 0.0
+
+    @property
+    def minimum(self):
+        return self.__min
+
+    @property
+    def maximum(self):
+        return self.__max
+
+    def quantile(self, q):
+        return self.__sketch.quantile(q)
+
+    def add(self, value):
+        self.__count += 1
+        delta = value - self.__mean
+        self.__mean += delta / self.__count
+        self.__m2 += delta * (value - self.__mean)
+        self.__min = value if self.__min is None else min(self.__min, value)
+        self.__max = value if self.__max is None else max(self.__max, value)
+        self.__sketch.add(value)
+
+    def to_row(self):
+        """Values stored in the database: mean, M2, min, max and serialized sketch."""
+        return self.__mean, self.__m2, self.__min, self.__max, self.__sketch.to_json()
@@ -0,0 +1,82 @@
+"""
+Per-thread CPU accounting of the monitored items, from psutil.Process.threads(): how the CPU time of a test is
+spread across its threads. The threads of pytest-monitor itself (memory, process tree and thread samplers) are
+left out. On Linux, per-thread CPU times have the resolution of the scheduler clock tick (usually 10 milliseconds).
+"""
+import collections
+import threading
+
+import psutil
+
+from pytest_monitor.sampling import WindowSampler
+from pytest_monitor.timing import NS
+
+
+class ThreadUsage(collections.namedtuple("ThreadUsage", ("thread_count", "busiest_thread_share", "parallelism"))):
+    """
+    How the CPU time of an item is spread across threads: number of threads which used CPU time, share of the
+    CPU time used by the busiest thread, and effective parallelism (CPU time over elapsed time). The share is
+    None when no CPU time was measured.
+    """
+
+    __slots__ = ()
+
+
+def own_thread_ids():
+    """Native ids of the threads of pytest-monitor."""
+    return {thread.native_id for thread in threading.enumerate() if thread.name.startswith("pytest-monitor")}
+
+
+def thread_times(process):
+    """:return: the CPU time of the process and the one of each of its threads by id, in nanoseconds."""
+    with process.oneshot():
+        times = process.cpu_times()
+        try:
+            threads = process.threads()
+        except psutil.AccessDenied:
+            threads = []
+    threads = {thread.id: round((thread.user_time + thread.system_time) * NS) for thread in threads}
+    return round((times.user + times.system) * NS), threads
+
+
+class ThreadTracer(WindowSampler):
+    """
+    Measure the CPU time of the threads of the current process between `start` and `stop`. A single long-lived
+    thread samples the CPU time of each thread every `interval` seconds while a window is open (see
+    WindowSampler), so that threads ending before `stop` (like the workers of a pool shut down by the test) are
+    accounted up to their last sample.
+    """
+
+    def __init__(self, interval=0.01):
+        """:param interval: sampling interval, in seconds."""
+        super().__init__(interval, "pytest-monitor-threads")
+        self.__process = psutil.Process()
+        self.__start = (0, {})
+        self.__last = {}
+
+    def _sample(self):
+        """Sample the CPU time of the threads."""
+        process, threads = thread_times(self.__process)
+        self.__last.update(threads)
+        return process
+
+    def _open(self):
+        self.__last = {}
+        self.__start = (self._sample(), dict(self.__last))
+
+    def _close(self, elapsed_ns):
+        """
+        :param elapsed_ns: elapsed time since the start, in nanoseconds.
+        :return: the ThreadUsage since the start.
+        """
+        process_end = self._sample()
+        process_start, threads_start = self.__start
+        deltas = {tid: cpu - threads_start.get(tid, 0) for tid, cpu in self.__last.items()}
+        own = sum(deltas.pop(tid, 0) for tid in own_thread_ids())
+        cpu = max(process_end - process_start - own, 0)
+        busiest = max(deltas.values(), default=0)
+        return ThreadUsage(
+            sum(1 for delta in deltas.values() if delta > 0),
+            min(busiest / cpu, 1.0) if cpu else None,
+            cpu / elapsed_ns if elapsed_ns else 0.0,
+        )
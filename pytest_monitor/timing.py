@@ -0,0 +1,57 @@
+"""
+Timing of the monitored items, from monotonic high resolution clocks: elapsed time is read from
+time.perf_counter_ns, which is not affected by system clock adjustments (NTP...), and CPU time from
+getrusage (microsecond resolution), split between user and kernel modes. Durations are integer nanoseconds.
+"""
+import collections
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import psutil
+
+NS = 1_000_000_000
+
+
+class Timings(collections.namedtuple("Timings", ("total", "user", "kernel"))):
+    """Elapsed, user and kernel times of an item, in nanoseconds."""
+
+    __slots__ = ()
+
+    def seconds(self):
+        """The same timings, in seconds."""
+        return tuple(duration / NS for duration in self)
+
+
+def cpu_times():
+    """User and kernel CPU times consumed by the current process, in nanoseconds."""
+    if resource is None:
+        times = psutil.Process().cpu_times()
+        return round(times.user * NS), round(times.system * NS)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return round(usage.ru_utime * NS), round(usage.ru_stime * NS)
+
+
+class Stopwatch:
+    """
+    Measure the time spent between its creation (or last `restart`) and `stop`.
+    `start_time_ns` is the wall clock time of the start, in nanoseconds since epoch, which only
+    dates the measure: durations never depend on the wall clock.
+    """
+
+    def __init__(self):
+        self.restart()
+
+    def restart(self):
+        self.start_time_ns = time.time_ns()
+        self.__user, self.__kernel = cpu_times()
+        self.__start = time.perf_counter_ns()
+
+    def stop(self):
+        """:return: the Timings elapsed since the start."""
+        end = time.perf_counter_ns()
+        user, kernel = cpu_times()
+        return Timings(end - self.__start, user - self.__user, kernel - self.__kernel)
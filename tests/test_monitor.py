@@ -406,3 +406,90 @@ def test_monitor_with_doctest(testdir):
     # make sure that that we get a '0' exit code for the testsuite
     result.assert_outcomes(passed=1)
     assert not pymon_path.exists()
+
+
+def test_monitor_class_and_session_scopes(testdir):
+    """Make sure that classes and the whole session are monitored when requested."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import time
+
+
+    class TestGroup:
+        def test_a(self):
+            time.sleep(0.05)
+
+        def test_b(self):
+            data = b"x" * 64 * 1024 ** 2
+            time.sleep(0.1)
+            assert data
+
+
+    def test_outside():
+        time.sleep(0.05)
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--restrict-scope-to", "function,class,session")
+    result.assert_outcomes(passed=3)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT KIND, ITEM, METRIC_ID, TOTAL_TIME, MEM_USAGE FROM TEST_METRICS WHERE KIND != 'function';")
+    rows = {kind: row for kind, *row in cursor.fetchall()}
+    assert set(rows) == {"class", "session"}
+    assert rows["class"][0] == "TestGroup"
+    assert 0.15 <= rows["class"][2] < rows["session"][2]
+    assert rows["class"][3] >= 60 and rows["session"][3] >= rows["class"][3]
+    cursor.execute(
+        "SELECT TEST_COUNT, TEST_TIME_NS, OVERHEAD_TIME_NS FROM MONITOR_OVERHEAD WHERE METRIC_ID = ?;",
+        (rows["session"][1],),
+    )
+    test_count, test_time_ns, overhead_ns = cursor.fetchone()
+    assert test_count == 3
+    assert 200_000_000 <= test_time_ns < rows["session"][2] * 1e9
+    assert 0 < overhead_ns < rows["session"][2] * 1e9 - test_time_ns
+
+
+def test_monitor_scopes_without_fixtures(testdir):
+    """Make sure that modules and classes are monitored without adding fixtures to the tests."""
+    # create temporary pytest test modules
+    testdir.makepyfile(
+        test_first="""
+    import pytest
+
+
+    class TestGroup:
+        def test_fixtures(self, request):
+            assert not [name for name in request.fixturenames if name.startswith("_prf")]
+
+
+    @pytest.mark.monitor_skip_test
+    def test_skipped():
+        pass
+""",
+        test_second="""
+    def test_failing():
+        assert False
+
+
+    def test_not_run():
+        pass
+""",
+    )
+
+    # run pytest with the following cmd args, stopping at the first failure
+    result = testdir.runpytest("-v", "-x", "--restrict-scope-to", "function,class,module")
+    result.assert_outcomes(passed=2, failed=1)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT KIND, ITEM, ITEM_PATH, ITEM_VARIANT FROM TEST_METRICS ORDER BY KIND, ITEM;")
+    assert cursor.fetchall() == [
+        ("class", "TestGroup", "test_first", ""),
+        ("function", "test_fixtures", "test_first", "test_fixtures"),
+        ("module", "test_first", "", ""),
+        ("module", "test_second", "", ""),
+    ]
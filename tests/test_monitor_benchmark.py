@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import pathlib
+import sqlite3
+
+import pytest
+
+from pytest_monitor.stats import describe
+
+
+def test_describe():
+    minimum, median, mean, stddev, iqr = describe([4.0, 1.0, 3.0, 2.0, 5.0])
+    assert (minimum, median, mean) == (1.0, 3.0, 3.0)
+    assert stddev == pytest.approx(2.5**0.5)
+    assert iqr == pytest.approx(2.0)
+    assert describe([1.5]) == (1.5, 1.5, 1.5, 0.0, 0.0)
+
+
+def test_monitor_benchmark_marker(testdir):
+    """Make sure that tests marked with monitor_benchmark are run the requested number of times."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import time
+
+    import pytest
+
+    CALLS = []
+
+
+    @pytest.mark.monitor_benchmark(rounds=4, warmup=2)
+    def test_benchmarked():
+        CALLS.append(None)
+        time.sleep(0.01)
+
+
+    def test_calls():
+        assert len(CALLS) == 6
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v")
+    result.assert_outcomes(passed=2)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM, METRIC_ID, TOTAL_TIME FROM TEST_METRICS ORDER BY ITEM;")
+    (item, metric_id, total_time), (other, _, _) = cursor.fetchall()
+    assert (item, other) == ("test_benchmarked", "test_calls")
+    cursor.execute(
+        "SELECT ROUNDS, WARMUP, TOTAL_TIME_MIN, TOTAL_TIME_MEDIAN, TOTAL_TIME_STDDEV FROM TEST_BENCHMARKS"
+        " WHERE METRIC_ID = ?;",
+        (metric_id,),
+    )
+    ((rounds, warmup, minimum, median, stddev),) = cursor.fetchall()
+    assert (rounds, warmup) == (4, 2)
+    assert 0.01 <= minimum <= median
+    assert stddev >= 0
+    cursor.execute("SELECT ROUND, TOTAL_TIME FROM BENCHMARK_ROUNDS WHERE METRIC_ID = ? ORDER BY ROUND;", (metric_id,))
+    rounds = cursor.fetchall()
+    assert [r for r, _ in rounds] == [1, 2, 3, 4]
+    assert min(t for _, t in rounds) == minimum
+    # The metric of the test is the one of its upper median round
+    assert sorted(t for _, t in rounds)[2] == total_time
+
+
+def test_monitor_benchmark_option(testdir):
+    """Make sure that every test is benchmarked with --monitor-benchmark-rounds."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import pytest
+
+
+    def test_a():
+        assert True
+
+
+    @pytest.mark.monitor_benchmark(rounds=2)
+    def test_b():
+        assert True
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--monitor-benchmark-rounds", "3", "--monitor-benchmark-warmup", "0")
+    result.assert_outcomes(passed=2)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT M.ITEM, B.ROUNDS, B.WARMUP, COUNT(R.ROUND) FROM TEST_METRICS M JOIN TEST_BENCHMARKS B USING (METRIC_ID)"
+        " JOIN BENCHMARK_ROUNDS R USING (METRIC_ID) GROUP BY M.ITEM ORDER BY M.ITEM;"
+    )
+    assert cursor.fetchall() == [("test_a", 3, 0, 3), ("test_b", 2, 0, 2)]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import os
+import pathlib
+import sqlite3
+import time
+
+import psutil
+
+from pytest_monitor.counters import Counters, CounterWatch
+
+
+def test_counter_watch(tmp_path):
+    watch = CounterWatch(psutil.Process(os.getpid()))
+    with open(tmp_path / "data", "wb", buffering=0) as f:
+        for _ in range(100):
+            f.write(b"x" * 1024)
+    data = bytearray(32 * 1024**2)
+    time.sleep(0.01)
+    counters = watch.stop()
+    assert data
+    assert all(value is None or value >= 0 for value in counters)
+    if counters.io_write_count is not None:
+        assert counters.io_write_count >= 100
+    if counters.minor_page_faults is not None:
+        assert counters.minor_page_faults > 0
+    assert counters.voluntary_ctx_switches >= 1
+    assert Counters(5, None, 3, 4, 5, 6, 7, 8) - Counters(1, 2, 3, None, 0, 0, 0, 0) == (4, None, 0, None, 5, 6, 7, 8)
+
+
+def test_monitor_resource_counters(testdir):
+    """Make sure that I/O, context switch and page fault counters are stored for each test."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import time
+
+
+    def test_io(tmp_path):
+        with open(tmp_path / "data", "wb", buffering=0) as f:
+            for _ in range(100):
+                f.write(b"x" * 1024)
+
+
+    def test_sleep():
+        for _ in range(10):
+            time.sleep(0.001)
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--restrict-scope-to", "function,module")
+    result.assert_outcomes(passed=2)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT ITEM, IO_WRITE_COUNT, VOLUNTARY_CTX_SWITCHES, INVOLUNTARY_CTX_SWITCHES, MINOR_PAGE_FAULTS,"
+        " MAJOR_PAGE_FAULTS FROM TEST_METRICS WHERE KIND = 'function';"
+    )
+    metrics = {item: row for item, *row in cursor.fetchall()}
+    assert set(metrics) == {"test_io", "test_sleep"}
+    assert all(value is None or value >= 0 for row in metrics.values() for value in row)
+    if metrics["test_io"][0] is not None:
+        assert metrics["test_io"][0] >= 100
+    assert metrics["test_sleep"][1] >= 10
+    cursor.execute("SELECT VOLUNTARY_CTX_SWITCHES FROM TEST_METRICS WHERE KIND = 'module';")
+    assert cursor.fetchone() == (None,)
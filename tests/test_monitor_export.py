@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import json
+import pathlib
+import sqlite3
+
+import pytest
+
+from pytest_monitor.cli import main
+from pytest_monitor.export import INT_NULL, export, iter_parts
+from pytest_monitor.handler import DBHandler
+
+np = pytest.importorskip("numpy")
+
+TEST_CONTENT = """
+import pytest
+
+
+@pytest.mark.parametrize("value", [1, 2, 3])
+def test_value(value):
+    assert value
+"""
+
+
+def test_monitor_export_incremental(testdir):
+    """Make sure that only sessions added since the last export are exported."""
+    # create a temporary pytest test module
+    testdir.makepyfile(TEST_CONTENT)
+    db_path = str(pathlib.Path(str(testdir)) / ".pymon")
+    out_dir = pathlib.Path(str(testdir)) / "export"
+
+    for _ in range(2):
+        result = testdir.runpytest("-v")
+        result.assert_outcomes(passed=3)
+    main(["--db", db_path, "export", str(out_dir), "--chunk-size", "4"])
+
+    parts = list(iter_parts(out_dir, "TEST_METRICS"))
+    assert [len(part["METRIC_ID"]) for part in parts] == [4, 2]
+    assert isinstance(parts[0]["TOTAL_TIME"], np.memmap)
+    assert parts[0]["TOTAL_TIME"].dtype == np.float64
+    assert parts[0]["ITEM_START_TIME"].dtype == np.int64
+    assert list(parts[0]["ITEM_VARIANT"][:3]) == ["test_value[1]", "test_value[2]", "test_value[3]"]
+
+    result = testdir.runpytest("-v")
+    result.assert_outcomes(passed=3)
+    main(["--db", db_path, "export", str(out_dir), "--chunk-size", "4"])
+
+    assert [len(part["METRIC_ID"]) for part in iter_parts(out_dir, "TEST_METRICS")] == [4, 2, 3]
+    assert [len(part["SESSION_H"]) for part in iter_parts(out_dir, "TEST_SESSIONS")] == [2, 1]
+    assert [len(part["ENV_H"]) for part in iter_parts(out_dir, "EXECUTION_CONTEXTS")] == [1]
+    manifest = json.loads((out_dir / "manifest.json").read_text())
+    assert manifest["tables"]["TEST_METRICS"] == {"last_id": 9, "parts": 3}
+
+    main(["--db", db_path, "export", str(out_dir), "--full"])
+    assert [len(part["METRIC_ID"]) for part in iter_parts(out_dir, "TEST_METRICS")] == [9]
+
+
+def test_monitor_export_column_types(tmp_path):
+    """Make sure that columns keep the type of the schema in every part, whatever the missing values."""
+    db_path = str(tmp_path / ".pymon")
+    handler = DBHandler(db_path)
+    handler.query("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')", ())
+    handler.insert_session("session", None, None, "{}")
+    for i, mem_usage in enumerate((None, 12.0, None)):
+        handler.insert_metric(
+            "session",
+            "env",
+            i,
+            "test_a",
+            "pkg",
+            f"test_a[{'é' * i}]",
+            "pkg/test.py",
+            "function",
+            None,
+            1,
+            0,
+            0,
+            0,
+            mem_usage,
+        )
+    handler.close()
+    with sqlite3.connect(db_path) as db:
+        db.execute("UPDATE ITEM_METRICS SET ITEM_START_TIME = NULL WHERE METRIC_ID = 1")
+
+    export(db_path, tmp_path / "export", chunk_size=1)
+
+    parts = list(iter_parts(tmp_path / "export", "TEST_METRICS"))
+    assert [part["MEM_USAGE"].dtype for part in parts] == [np.float64] * 3
+    assert [part["ITEM_START_TIME"].dtype for part in parts] == [np.int64] * 3
+    assert [part["ITEM_START_TIME"][0] for part in parts] == [INT_NULL, 1, 2]
+    assert [bool(np.isnan(part["MEM_USAGE"][0])) for part in parts] == [True, False, True]
+    assert parts[1]["MEM_USAGE"][0] == 12.0
+    assert [part["ITEM_VARIANT"][0] for part in parts] == ["test_a[]", "test_a[é]", "test_a[éé]"]
+    assert [list(part["COMPONENT"]) for part in parts] == [[""]] * 3
+    (session,) = iter_parts(tmp_path / "export", "TEST_SESSIONS")
+    assert session["RUN_DATE"].dtype == np.int64
+    assert session["RUN_DATE"][0] == INT_NULL
+
+
+def test_monitor_export_read_only(tmp_path):
+    """Make sure that exporting neither modifies the database nor misses metrics added to exported sessions."""
+    db_path = str(tmp_path / ".pymon")
+    handler = DBHandler(db_path)
+    handler.query("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')", ())
+    handler.insert_session("session", 0, "", "{}")
+
+    def add_metric(i):
+        handler.insert_metric(
+            "session", "env", i, f"test_{i}", "pkg", f"test_{i}", "pkg/test.py", "function", "", 1, 0, 0, 0, 1
+        )
+        handler.flush()
+
+    add_metric(0)
+    export(db_path, tmp_path / "export")
+    add_metric(1)
+    handler.close()
+
+    content = pathlib.Path(db_path).read_bytes()
+    export(db_path, tmp_path / "export")
+    assert pathlib.Path(db_path).read_bytes() == content
+    parts = iter_parts(tmp_path / "export", "TEST_METRICS")
+    assert [list(part["ITEM"]) for part in parts] == [["test_0"], ["test_1"]]
+
+    with sqlite3.connect(str(tmp_path / "legacy.db")) as db:
+        db.execute("CREATE TABLE TEST_METRICS (SESSION_H varchar(64))")
+    with pytest.raises(sqlite3.DatabaseError, match="upgrade"):
+        export(str(tmp_path / "legacy.db"), tmp_path / "legacy")
+
+
+def test_monitor_export_after_retention(tmp_path):
+    """Make sure that metrics added once the latest exported ones were deleted are exported."""
+    db_path = str(tmp_path / ".pymon")
+    handler = DBHandler(db_path)
+    handler.query("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')", ())
+
+    def run_session(session_h, run_date):
+        handler.insert_session(session_h, run_date, "", "{}")
+        for i in range(3):
+            handler.insert_metric(
+                session_h,
+                "env",
+                run_date,
+                f"test_{i}",
+                "pkg",
+                f"test_{i}",
+                "pkg/test.py",
+                "function",
+                "",
+                1,
+                0,
+                0,
+                0,
+                1,
+            )
+        handler.flush()
+
+    run_session("first", 1)
+    export(db_path, tmp_path / "export")
+    assert handler.apply_retention(keep_sessions=0) == (1, 3)
+    run_session("second", 2)
+    handler.close()
+
+    assert export(db_path, tmp_path / "export")["TEST_METRICS"] == 3
+    parts = iter_parts(tmp_path / "export", "TEST_METRICS")
+    assert [list(part["METRIC_ID"]) for part in parts] == [[1, 2, 3], [4, 5, 6]]
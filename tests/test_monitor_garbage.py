@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import gc
+import pathlib
+import sqlite3
+
+import pytest
+
+from pytest_monitor.garbage import CollectionPolicy, CollectionWatch
+
+
+def make_cycles(count):
+    for _ in range(count):
+        node = []
+        node.append(node)
+
+
+def test_collection_watch():
+    watch = CollectionWatch()
+    make_cycles(1000)
+    gc.collect(0)
+    make_cycles(1000)
+    gc.collect()
+    collections = watch.stop()
+    assert watch._CollectionWatch__callback not in gc.callbacks
+    assert collections.generations[0] >= 1 and collections.generations[2] >= 1
+    assert collections.count == sum(collections.generations)
+    assert collections.collected >= 2000
+    assert collections.uncollectable == 0
+    assert 0 < collections.max_pause <= collections.total_pause
+
+
+def test_monitor_garbage_collections(testdir):
+    """Make sure that the garbage collections run by each test are recorded."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import gc
+
+
+    def test_cycles():
+        for _ in range(1000):
+            node = []
+            node.append(node)
+        del node
+        gc.collect()
+
+
+    def test_nothing():
+        assert True
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v")
+    result.assert_outcomes(passed=2)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT M.ITEM, G.GEN2_COLLECTIONS, G.COLLECTED, G.TOTAL_PAUSE_NS, G.MAX_PAUSE_NS"
+        " FROM TEST_METRICS M JOIN TEST_GARBAGE_COLLECTIONS G USING (METRIC_ID);"
+    )
+    rows = {item: row for item, *row in cursor.fetchall()}
+    assert "test_cycles" in rows
+    full_collections, collected, total_pause, max_pause = rows["test_cycles"]
+    assert full_collections >= 1 and collected >= 1000
+    assert 0 < max_pause <= total_pause
+
+
+class FixedMemory:
+    """Memory backend whose resident memory is set by the test."""
+
+    rss = 100.0
+
+    def current(self):
+        return self.rss
+
+
+def test_collection_policy():
+    for name in ("full", "young", "off"):
+        assert CollectionPolicy(name).collect() == name
+    with pytest.raises(ValueError):
+        CollectionPolicy("sometimes")
+
+    memory = FixedMemory()
+    policy = CollectionPolicy("adaptive", gen2_threshold=1000, rss_threshold=10.0, memory_backend=memory)
+    assert policy.name == "adaptive"
+    # The first collection is always a full one
+    assert policy.collect() == "adaptive/full"
+    assert policy.collect() == "adaptive/young"
+    memory.rss += 5
+    assert policy.collect() == "adaptive/young"
+    memory.rss += 5
+    assert policy.collect() == "adaptive/full"
+    assert policy.collect() == "adaptive/young"
+    # Full collection once the interpreter ran enough collections of the middle generation since the last one,
+    # the young collections run by the policy itself not being counted
+    policy = CollectionPolicy("adaptive", gen2_threshold=2, rss_threshold=10.0, memory_backend=memory)
+    assert policy.collect() == "adaptive/full"
+    assert [policy.collect() for _ in range(5)] == ["adaptive/young"] * 5
+    gc.collect(1)
+    assert policy.collect() == "adaptive/young"
+    gc.collect(1)
+    assert policy.collect() == "adaptive/full"
+
+
+@pytest.mark.parametrize(
+    "args, policies",
+    [
+        ((), {"full"}),
+        (("--no-gc",), {"off"}),
+        (("--monitor-gc", "young"), {"young"}),
+        (("--monitor-gc", "adaptive", "--monitor-gc-rss-threshold", "1000"), {"adaptive/full", "adaptive/young"}),
+    ],
+)
+def test_monitor_gc_policy(testdir, args, policies):
+    """Make sure that the garbage collection run before each test is recorded."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import pytest
+
+
+    @pytest.mark.parametrize("i", range(3))
+    def test_ok(i):
+        assert True
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--restrict-scope-to", "function,module", *args)
+    result.assert_outcomes(passed=3)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT GC_POLICY FROM TEST_METRICS WHERE KIND = 'module';")
+    assert cursor.fetchall() == [(None,)]
+    cursor.execute("SELECT GC_POLICY FROM TEST_METRICS WHERE KIND = 'function';")
+    assert {policy for policy, in cursor.fetchall()} == policies
+
+
+def test_monitor_gc_policy_benchmark(testdir):
+    """Make sure that each round of a benchmark is preceded by a single collection, and the warmup by none."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import gc
+
+    import pytest
+
+    FULL_COLLECTIONS = []
+
+
+    @pytest.fixture
+    def setup_done():
+        FULL_COLLECTIONS.append(gc.get_stats()[2]["collections"])
+
+
+    @pytest.mark.monitor_benchmark(rounds=3, warmup=1)
+    def test_benchmarked(setup_done):
+        FULL_COLLECTIONS.append(gc.get_stats()[2]["collections"])
+
+
+    def test_collections():
+        start = FULL_COLLECTIONS[0]
+        assert FULL_COLLECTIONS == [start, start, start + 1, start + 2, start + 3]
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v")
+    result.assert_outcomes(passed=2)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT GC_POLICY FROM TEST_METRICS WHERE ITEM = 'test_benchmarked';")
+    assert cursor.fetchall() == [("full",)]
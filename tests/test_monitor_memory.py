@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+import pathlib
+import sqlite3
+import sys
+import time
+
+import mock
+import pytest
+
+from pytest_monitor.memory import (
+    MEMORY_BACKENDS,
+    AllocationTracer,
+    HighWaterMarkBackend,
+    MemoryBackend,
+    MemoryTimeline,
+    SamplerBackend,
+    decode_series,
+    encode_series,
+    make_memory_backend,
+)
+
+ALLOCATION = 64 * 1024**2
+
+
+def allocate():
+    data = b"x" * ALLOCATION
+    time.sleep(0.05)
+    return len(data)
+
+
+def test_sampler_backend_peak():
+    """Make sure that the sampler sees memory allocated then released within a window."""
+    backend = SamplerBackend(interval=0.001)
+    try:
+        base = backend.current()
+        peak, result = backend.profile(allocate)
+        assert result == ALLOCATION
+        assert peak - base >= 0.9 * ALLOCATION / 1024**2
+        # The thread is reused by the following windows
+        backend.start()
+        assert backend.stop() < peak
+    finally:
+        backend.close()
+
+
+def test_sampler_backend_reraise():
+    """Make sure that the window is closed when the measured function raises."""
+    backend = SamplerBackend()
+
+    def fail():
+        raise ValueError()
+
+    try:
+        with pytest.raises(ValueError):
+            backend.profile(fail)
+        assert backend.profile(lambda: 1)[1] == 1
+    finally:
+        backend.close()
+
+
+@pytest.mark.parametrize("backend", sorted(MEMORY_BACKENDS))
+def test_monitor_memory_backend(testdir, backend):
+    """Make sure that each memory backend records the memory allocated by tests."""
+    if backend == HighWaterMarkBackend.name and not HighWaterMarkBackend.available():
+        pytest.skip("RSS high-water mark cannot be reset on this system")
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import time
+
+
+    def test_small():
+        assert True
+
+
+    def test_large():
+        data = b"x" * 64 * 1024 ** 2
+        time.sleep(0.2)
+        assert data
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--memory-backend", backend)
+    result.assert_outcomes(passed=2)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM, MEM_USAGE FROM TEST_METRICS WHERE KIND = 'function' ORDER BY ITEM;")
+    (_, large), (_, small) = cursor.fetchall()
+    assert large - small >= 60
+
+
+def test_hwm_backend_short_spike():
+    """Make sure that the high-water mark sees a spike no sampler would catch."""
+    if not HighWaterMarkBackend.available():
+        pytest.skip("RSS high-water mark cannot be reset on this system")
+    backend = HighWaterMarkBackend()
+    try:
+        base = backend.current()
+        peak, result = backend.profile(lambda: len(b"x" * ALLOCATION))
+        assert result == ALLOCATION
+        assert peak - base >= 0.9 * ALLOCATION / 1024**2
+        # The mark is reset at the start of each window
+        backend.start()
+        assert backend.stop() < peak
+    finally:
+        backend.close()
+    backend.close()
+
+
+def test_make_memory_backend():
+    backend = make_memory_backend("memory_profiler")
+    assert backend.name == "memory_profiler"
+    assert backend.current() > 0
+
+    with mock.patch("os.open", side_effect=PermissionError()):
+        assert not HighWaterMarkBackend.available()
+        backend = make_memory_backend("auto")
+        with pytest.raises(ValueError, match="not available"):
+            make_memory_backend("hwm")
+    assert backend.name == "sampler"
+    backend.close()
+    # The high-water mark files can be opened, but not reset
+    with mock.patch("os.pwrite", side_effect=PermissionError()):
+        with pytest.raises(ValueError, match="not available"):
+            make_memory_backend("hwm")
+
+
+def test_monitor_unavailable_memory_backend(testdir):
+    """Make sure that requesting a memory backend which cannot be used is a usage error."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    def test_ok():
+        assert True
+"""
+    )
+
+    # run pytest with the following cmd args
+    with mock.patch.object(HighWaterMarkBackend, "available", return_value=False):
+        result = testdir.runpytest("-v", "--memory-backend", "hwm")
+    assert result.ret == pytest.ExitCode.USAGE_ERROR
+    result.stderr.fnmatch_lines(["*the hwm memory backend is not available*"])
+
+
+def test_incomplete_memory_backend():
+    class Incomplete(MemoryBackend):
+        name = "incomplete"
+
+        def start(self):
+            pass
+
+    with pytest.raises(TypeError, match="stop"):
+        Incomplete()
+
+
+def test_monitor_tracemalloc_marker(testdir):
+    """Make sure that allocation sites are recorded for tests marked with monitor_tracemalloc only."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import pytest
+
+    KEPT = []
+
+
+    @pytest.mark.monitor_tracemalloc
+    def test_traced():
+        KEPT.append(bytearray(8 * 1024 ** 2))
+
+
+    def test_untraced():
+        assert True
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--tracemalloc-top", "3")
+    result.assert_outcomes(passed=2)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT M.ITEM, T.TRACED_PEAK, T.FRAME_DEPTH FROM TEST_TRACEMALLOC T JOIN TEST_METRICS M USING (METRIC_ID);"
+    )
+    ((item, peak, depth),) = cursor.fetchall()
+    assert (item, depth) == ("test_traced", 1)
+    assert peak >= 8 * 1024**2
+    cursor.execute("SELECT SITE_RANK, TRACEBACK, SIZE FROM TEST_ALLOCATIONS ORDER BY SITE_RANK;")
+    sites = cursor.fetchall()
+    assert 1 <= len(sites) <= 3
+    rank, traceback, size = sites[0]
+    assert rank == 1
+    assert traceback.endswith("test_monitor_tracemalloc_marker.py:8")
+    assert size >= 8 * 1024**2
+
+
+def test_monitor_tracemalloc_depth(testdir):
+    """Make sure that allocation tracebacks hold the requested number of frames."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    KEPT = []
+
+
+    def allocate():
+        return bytearray(8 * 1024 ** 2)
+
+
+    def test_traced():
+        KEPT.append(allocate())
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--monitor-tracemalloc", "--tracemalloc-depth", "2")
+    result.assert_outcomes(passed=1)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    traceback = cursor.execute("SELECT TRACEBACK FROM TEST_ALLOCATIONS WHERE SITE_RANK = 1;").fetchone()[0]
+    assert [line.rsplit(":", 1)[1] for line in traceback.split("\n")] == ["5", "9"]
+
+
+def test_allocation_tracer_no_global_hook():
+    """Make sure that tracing allocations does not install a global trace or profile function."""
+    hooks = []
+
+    def function():
+        data = bytearray(8 * 1024**2)
+        hooks.append((sys.gettrace(), sys.getprofile()))
+        return data is not None
+
+    details, result = AllocationTracer(1, 3).profile(function, function.__code__)
+    assert result is True
+    assert hooks == [(None, None)]
+    assert details["TEST_TRACEMALLOC"][0][0] >= 8 * 1024**2
+    if sys.version_info >= (3, 12):  # Local variables are included when the sites are collected before returning
+        assert details["TEST_ALLOCATIONS"][0][2] >= 8 * 1024**2
+
+
+def test_memory_series_encoding():
+    samples = [(0, 1024), (1000, 2048), (2500, 1536), (4000, 1536)]
+    assert decode_series(encode_series(samples)) == [(0, 1), (0.001, 2), (0.0025, 1.5), (0.004, 1.5)]
+
+
+def test_memory_timeline_downsampling():
+    """Make sure that long series are downsampled without losing their peak."""
+    timeline = MemoryTimeline(max_samples=10)
+    for i in range(100):
+        timeline.add(1024**2 * (1000 if i == 42 else i), last=i == 99)
+    stride, count, blob = timeline.to_row()
+    samples = decode_series(blob)
+    assert stride == 16
+    assert count == len(samples) <= 10
+    assert max(memory for _, memory in samples) == 1000
+    assert samples[-1][1] == 99
+    assert [offset for offset, _ in samples] == sorted(offset for offset, _ in samples)
+
+
+def test_monitor_memory_timeline(testdir):
+    """Make sure that the memory series of each test is stored when requested."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import time
+
+
+    def test_growing():
+        data = []
+        for _ in range(8):
+            data.append(b"x" * 8 * 1024 ** 2)
+            time.sleep(0.02)
+        assert data
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--memory-timeline", "--memory-timeline-max-samples", "50")
+    result.assert_outcomes(passed=1)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT SAMPLE_COUNT, SAMPLES FROM TEST_MEMORY_SERIES JOIN TEST_METRICS USING (METRIC_ID);")
+    ((count, blob),) = cursor.fetchall()
+    samples = decode_series(blob)
+    assert count == len(samples) <= 50
+    assert max(memory for _, memory in samples) - samples[0][1] >= 40
+
+
+def test_monitor_memory_timeline_requires_sampler(testdir):
+    testdir.makepyfile(
+        """
+    def test_a():
+        assert True
+"""
+    )
+    result = testdir.runpytest("--memory-timeline", "--memory-backend", "memory_profiler")
+    result.stderr.fnmatch_lines(["*memory timelines require the sampler memory backend*"])
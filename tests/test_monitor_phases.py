@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import pathlib
+import sqlite3
+
+from pytest_monitor import query
+from pytest_monitor.cli import main
+
+
+def test_monitor_phase_metrics(testdir):
+    """Make sure that setup, call and teardown phases of tests are measured separately."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import time
+
+    import pytest
+
+
+    @pytest.fixture
+    def expensive():
+        data = b"x" * 64 * 1024 ** 2
+        time.sleep(0.1)
+        yield data
+        time.sleep(0.05)
+
+
+    def test_with_fixture(expensive):
+        assert expensive
+
+
+    def test_cheap():
+        assert True
+
+
+    @pytest.mark.monitor_skip_test
+    def test_skipped(expensive):
+        assert expensive
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v")
+    result.assert_outcomes(passed=3)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT M.ITEM, P.PHASE, P.TOTAL_TIME_NS, P.MEM_USAGE, M.TOTAL_TIME_NS FROM TEST_PHASE_METRICS P"
+        " JOIN TEST_METRICS M USING (METRIC_ID) ORDER BY P.PHASE_START_TIME;"
+    )
+    phases = {(item, phase): row for item, phase, *row in cursor.fetchall()}
+    assert sorted(phases) == sorted(
+        (item, phase) for item in ("test_cheap", "test_with_fixture") for phase in ("setup", "call", "teardown")
+    )
+    setup_ns, setup_memory, test_ns = phases[("test_with_fixture", "setup")]
+    assert setup_ns >= 100_000_000 > test_ns
+    assert setup_memory >= 60
+    assert phases[("test_with_fixture", "teardown")][0] >= 50_000_000
+    assert phases[("test_cheap", "setup")][0] < 50_000_000
+    # The call phase includes the test function
+    assert phases[("test_cheap", "call")][0] >= phases[("test_cheap", "call")][2]
+
+
+def test_monitor_fixture_metrics(testdir, capsys):
+    """Make sure that each fixture instantiation is measured, with its scope."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import time
+
+    import pytest
+
+
+    @pytest.fixture(scope="session")
+    def database():
+        data = b"x" * 64 * 1024 ** 2
+        time.sleep(0.1)
+        yield data
+        time.sleep(0.05)
+
+
+    @pytest.fixture(params=[1, 2])
+    def value(request):
+        return request.param
+
+
+    def test_a(database, value):
+        assert database and value
+
+
+    def test_b(database):
+        assert database
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--monitor-fixtures")
+    result.assert_outcomes(passed=3)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT FIXTURE_NAME, SCOPE, PARAM, SETUP_TIME_NS, TEARDOWN_TIME_NS, MEM_USAGE FROM FIXTURE_METRICS"
+        " ORDER BY SETUP_START_TIME;"
+    )
+    rows = cursor.fetchall()
+    assert [row[:3] for row in rows] == [
+        ("database", "session", None),
+        ("value", "function", "1"),
+        ("value", "function", "2"),
+    ]
+    _, _, _, setup_ns, teardown_ns, memory = rows[0]
+    assert setup_ns >= 100_000_000 and teardown_ns >= 50_000_000
+    assert memory >= 60
+    assert all(row[4] is not None for row in rows)
+
+    top = list(query.top_fixtures(str(pymon_path), by="time"))
+    assert [(name, scope, count) for name, _, scope, count, _, _ in top] == [
+        ("database", "session", 1),
+        ("value", "function", 2),
+    ]
+    capsys.readouterr()
+    main(["--db", str(pymon_path), "fixtures", "--by", "memory", "-n", "1"])
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2 and "database" in lines[1]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import pathlib
+import sqlite3
+import subprocess
+import sys
+import time
+
+from pytest_monitor.process_tree import ProcessTreeTracer
+
+CHILD = """
+import time
+
+data = bytearray(128 * 1024 ** 2)
+start = time.process_time()
+while time.process_time() - start < 0.2:
+    pass
+time.sleep({sleep})
+"""
+
+
+def test_process_tree_tracer():
+    tracer = ProcessTreeTracer(0.005)
+    try:
+        # A descendant which has exited by the end of the window
+        tracer.start()
+        subprocess.run([sys.executable, "-c", CHILD.format(sleep=0.05)], check=True)
+        tree = tracer.stop()
+        assert tree.process_count == 1
+        assert tree.user + tree.kernel >= 200_000_000
+        assert tree.max_process_mem_usage >= 128
+        assert tree.mem_usage >= tree.max_process_mem_usage
+
+        # A descendant still running at the end of the window is accounted from its samples
+        child = subprocess.Popen([sys.executable, "-c", CHILD.format(sleep=10)])
+        try:
+            tracer.start()
+            time.sleep(0.5)
+            tree = tracer.stop()
+        finally:
+            child.kill()
+            child.wait()
+        assert tree.process_count == 1
+        assert tree.user + tree.kernel >= 50_000_000
+        assert tree.max_process_mem_usage >= 128
+
+        # A descendant running before the window and waited for during it is only accounted from the window start
+        child = subprocess.Popen([sys.executable, "-c", CHILD.format(sleep=10)])
+        try:
+            time.sleep(1)
+            tracer.start()
+            time.sleep(0.05)
+        finally:
+            child.kill()
+            child.wait()
+        tree = tracer.stop()
+        assert tree.process_count == 1
+        assert tree.user + tree.kernel < 100_000_000
+
+        # Nothing started
+        tracer.start()
+        tree = tracer.stop()
+        assert tree.process_count == 0 and tree.user == tree.kernel == 0 and tree.max_process_mem_usage == 0
+    finally:
+        tracer.close()
+
+
+def test_monitor_process_tree_option(testdir):
+    """Make sure that the processes started by tests are accounted when requested."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        f"""
+    import subprocess
+    import sys
+
+    CHILD = {CHILD.format(sleep=0)!r}
+
+
+    def test_subprocess():
+        subprocess.run([sys.executable, "-c", CHILD], check=True)
+
+
+    def test_alone():
+        assert True
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--monitor-process-tree")
+    result.assert_outcomes(passed=2)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT M.ITEM, M.USER_TIME_NS + M.KERNEL_TIME_NS, T.PROCESS_COUNT, T.USER_TIME_NS + T.KERNEL_TIME_NS,"
+        " T.CPU_USAGE, T.MEM_USAGE, T.MAX_PROCESS_MEM_USAGE"
+        " FROM TEST_METRICS M JOIN TEST_PROCESS_TREE T ON T.METRIC_ID = M.METRIC_ID;"
+    )
+    metrics = {item: row for item, *row in cursor.fetchall()}
+    assert set(metrics) == {"test_subprocess", "test_alone"}
+    cpu, count, tree_cpu, cpu_usage, mem_usage, max_process_mem_usage = metrics["test_subprocess"]
+    assert count == 1
+    assert tree_cpu >= cpu + 200_000_000
+    assert cpu_usage > 0
+    assert max_process_mem_usage >= 128 and mem_usage >= 128
+    cpu, count, tree_cpu, _, _, max_process_mem_usage = metrics["test_alone"]
+    assert count == 0 and tree_cpu == cpu and max_process_mem_usage == 0
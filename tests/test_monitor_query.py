@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+from pytest_monitor import query
+from pytest_monitor.handler import DBHandler
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / ".pymon")
+    handler = DBHandler(path)
+    handler.query("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')", ())
+    for i in range(3):
+        handler.insert_session(f"session_{i}", i, "", "{}")
+        for name, duration, memory in (("test_a", 1 + i, 10), ("test_b", 5, 20 + i)):
+            handler.insert_metric(
+                f"session_{i}", "env", i, name, "pkg", name, "pkg/test.py", "function", "", duration, 0, 0, 0, memory
+            )
+        # Other items are not accounted as tests, top-level modules only differ by their name
+        for name, duration in (("mod_a.py", 100), ("mod_b.py", 200)):
+            handler.insert_metric(f"session_{i}", "env", i, name, "", "", name, "module", "", duration, 0, 0, 0, 1)
+        handler.insert_metric(f"session_{i}", "env", i, "session", "", "", "", "session", "", 1000, 0, 0, 0, 1)
+        handler.update_stats(f"session_{i}")
+    handler.close()
+    query.clear_cache()
+    return path
+
+
+def test_query_history(db_path):
+    rows = list(query.history(db_path, "pkg", "test_a", "test_a"))
+    assert [(r[0], r[3]) for r in rows] == [("session_0", 1), ("session_1", 2), ("session_2", 3)]
+    assert list(query.history(db_path, "pkg", "test_a", "test_a", env_h="other")) == []
+    rows = list(query.history(db_path, "", "mod_a.py", "", kind="module"))
+    assert [r[3] for r in rows] == [100, 100, 100]
+
+
+def test_query_sessions(db_path):
+    rows = list(query.sessions(db_path))
+    assert [(r[0], r[4], r[5], r[6]) for r in rows] == [
+        ("session_0", 2, 6, 20),
+        ("session_1", 2, 7, 21),
+        ("session_2", 2, 8, 22),
+    ]
+    assert [(r[4], r[5]) for r in query.sessions(db_path, kind="module")] == [(2, 300)] * 3
+
+
+def test_query_top(db_path):
+    assert [r[1] for r in query.top(db_path, n=1, by="memory", session_h="session_0")] == ["test_b"]
+    assert [(r[1], r[5]) for r in query.top(db_path, by="time")] == [("test_b", 5), ("test_a", 2)]
+    assert [r[1] for r in query.top(db_path, by="time", kind="module")] == ["mod_b.py", "mod_a.py"]
+    assert [r[1] for r in query.top(db_path, session_h="session_1", kind="module")] == ["mod_b.py", "mod_a.py"]
+    with pytest.raises(ValueError):
+        query.top(db_path, by="size")
+
+
+def test_query_baseline(db_path):
+    duration, memory = query.baseline(db_path, "pkg", "test_a", "test_a", "env")
+    assert (duration.count, duration.mean, duration.minimum, duration.maximum) == (3, 2, 1, 3)
+    assert memory.variance == 0
+    assert query.baseline(db_path, "pkg", "test_z", "test_z", "env") is None
+
+
+def test_query_cache_invalidated_on_write(db_path):
+    assert len(list(query.history(db_path, "pkg", "test_a", "test_a"))) == 3
+    assert query._fetch.cache_info().currsize == 1
+    list(query.history(db_path, "pkg", "test_a", "test_a"))
+    assert query._fetch.cache_info().hits == 1
+
+    handler = DBHandler(db_path)
+    handler.insert_session("session_3", 3, "", "{}")
+    handler.insert_metric(
+        "session_3", "env", 3, "test_a", "pkg", "test_a", "pkg/test.py", "function", "", 4, 0, 0, 0, 1
+    )
+    handler.close()
+    assert len(list(query.history(db_path, "pkg", "test_a", "test_a"))) == 4
+
+
+def test_query_as_array(db_path):
+    np = pytest.importorskip("numpy")
+    array = query.history(db_path, "pkg", "test_a", "test_a", as_array=True)
+    assert array.dtype.names == query.HISTORY_COLUMNS
+    np.testing.assert_array_equal(array["TOTAL_TIME"], [1, 2, 3])
+    assert len(query.history(db_path, "pkg", "test_z", "test_z", as_array=True, cache=False)) == 0
+
+
+def test_query_outdated_db(tmp_path):
+    path = tmp_path / ".pymon"
+    with sqlite3.connect(str(path)) as db:
+        db.execute("CREATE TABLE TEST_METRICS (SESSION_H varchar(64))")
+    content = path.read_bytes()
+    with pytest.raises(sqlite3.DatabaseError, match="upgrade"):
+        list(query.sessions(str(path)))
+    assert path.read_bytes() == content
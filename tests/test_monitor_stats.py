@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import random
+import statistics
+
+import pytest
+
+from pytest_monitor.stats import QuantileSketch, RunningStats
+
+
+def test_running_stats():
+    """Make sure that running statistics match the ones computed on the whole series."""
+    rnd = random.Random(42)
+    values = [rnd.lognormvariate(0, 1) for _ in range(1000)]
+    stats = RunningStats()
+    for value in values[:500]:
+        stats.add(value)
+    # Statistics are stored and reloaded between sessions
+    stats = RunningStats(stats.count, *stats.to_row())
+    for value in values[500:]:
+        stats.add(value)
+
+    assert stats.count == 1000
+    assert stats.mean == pytest.approx(statistics.mean(values))
+    assert stats.variance == pytest.approx(statistics.variance(values))
+    assert (stats.minimum, stats.maximum) == (min(values), max(values))
+    for q in (0.5, 0.95):
+        expected = sorted(values)[int(q * (len(values) - 1))]
+        assert stats.quantile(q) == pytest.approx(expected, rel=0.01)
+
+
+def test_quantile_sketch_signed_values():
+    """Make sure that the sketch handles negative and null values."""
+    sketch = QuantileSketch()
+    for value in (-10, -1, 0, 0, 1, 10, 100):
+        sketch.add(value)
+    sketch = QuantileSketch.from_json(sketch.to_json())
+
+    assert sketch.count == 7
+    assert sketch.quantile(0) == pytest.approx(-10, rel=0.01)
+    assert sketch.quantile(0.5) == 0
+    assert sketch.quantile(1) == pytest.approx(100, rel=0.01)
+    assert QuantileSketch().quantile(0.5) is None
@@ -0,0 +1,501 @@
+# -*- coding: utf-8 -*-
+import datetime
+import pathlib
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from pytest_monitor.cli import main
+from pytest_monitor.handler import (
+    SCHEMA_VERSION,
+    DBHandler,
+    MetricWriter,
+    retry_on_busy,
+)
+from pytest_monitor.stats import QuantileSketch
+
+TEST_CONTENT = """
+def test_a():
+    assert True
+
+
+def test_b():
+    assert True
+
+
+def test_c():
+    assert True
+"""
+
+LEGACY_SCHEMA = """
+CREATE TABLE TEST_SESSIONS(
+    SESSION_H varchar(64) primary key not null unique,
+    RUN_DATE varchar(64),
+    SCM_ID varchar(128),
+    RUN_DESCRIPTION json
+);
+CREATE TABLE EXECUTION_CONTEXTS (
+   ENV_H varchar(64) primary key not null unique,
+   CPU_COUNT integer,
+   CPU_FREQUENCY_MHZ integer,
+   CPU_TYPE varchar(64),
+   CPU_VENDOR varchar(256),
+   RAM_TOTAL_MB integer,
+   MACHINE_NODE varchar(512),
+   MACHINE_TYPE varchar(32),
+   MACHINE_ARCH varchar(16),
+   SYSTEM_INFO varchar(256),
+   PYTHON_INFO varchar(512)
+);
+CREATE TABLE TEST_METRICS (
+    SESSION_H varchar(64),
+    ENV_H varchar(64),
+    ITEM_START_TIME varchar(64),
+    ITEM_PATH varchar(4096),
+    ITEM varchar(2048),
+    ITEM_VARIANT varchar(2048),
+    ITEM_FS_LOC varchar(2048),
+    KIND varchar(64),
+    COMPONENT varchar(512) NULL,
+    TOTAL_TIME float,
+    USER_TIME float,
+    KERNEL_TIME float,
+    CPU_USAGE float,
+    MEM_USAGE float
+);"""
+
+
+def get_nb_metrics(path):
+    db = sqlite3.connect(str(pathlib.Path(str(path)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM FROM TEST_METRICS;")
+    return len(cursor.fetchall())
+
+
+def test_monitor_batched_writes(testdir):
+    """Make sure that buffered metrics are all written at the end of the session."""
+    # create a temporary pytest test module
+    testdir.makepyfile(TEST_CONTENT)
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--db-batch-size", "2", "--db-flush-interval", "60")
+
+    # make sure that that we get a '0' exit code for the testsuite
+    result.assert_outcomes(passed=3)
+    assert get_nb_metrics(testdir) == 3
+
+
+def test_monitor_flush_interval(tmp_path):
+    """Make sure that buffered metrics are written once the oldest one waited for the flush interval."""
+    db_path = str(tmp_path / ".pymon")
+    handler = DBHandler(db_path, batch_size=100, flush_interval=0.1)
+    handler.query("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')", ())
+    handler.insert_session("session", 0, "", "{}")
+
+    def insert_metric():
+        handler.insert_metric(
+            "session", "env", 0, "test_a", "pkg", "test_a", "pkg/test.py", "function", "", 1, 0, 0, 0, 1
+        )
+        with sqlite3.connect(db_path) as db:
+            return db.execute("SELECT COUNT(*) FROM ITEM_METRICS").fetchone()[0]
+
+    assert insert_metric() == 0
+    time.sleep(0.2)
+    assert insert_metric() == 2
+    # The delay is counted from the oldest buffered metric, not from the last flush
+    time.sleep(0.2)
+    assert insert_metric() == 2
+    handler.close()
+    assert get_nb_metrics(tmp_path) == 3
+
+
+def test_monitor_batched_writes_on_interrupt(testdir):
+    """Make sure that buffered metrics are written even if the session is interrupted."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    def test_a():
+        assert True
+
+
+    def test_b():
+        assert True
+
+
+    def test_interrupt():
+        raise KeyboardInterrupt()
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest_subprocess("-v", "--db-batch-size", "100")
+
+    result.stdout.fnmatch_lines(["*KeyboardInterrupt*"])
+    assert get_nb_metrics(testdir) == 2
+
+
+def test_monitor_writer_thread(testdir):
+    """Make sure that metrics written by the writer thread are all stored in a WAL database."""
+    # create a temporary pytest test module
+    testdir.makepyfile(TEST_CONTENT)
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--db-writer-thread", "--db-queue-size", "1")
+
+    # make sure that that we get a '0' exit code for the testsuite
+    result.assert_outcomes(passed=3)
+    assert get_nb_metrics(testdir) == 3
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    assert db.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+
+
+def test_monitor_writer_thread_unavailable_db(tmp_path):
+    """Make sure that a writer thread unable to open the database does not hang the session."""
+    writer = MetricWriter(str(tmp_path))  # A directory cannot be opened as a database
+    with pytest.warns(UserWarning, match="unable to open"):
+        writer.start()
+        for _ in range(3):
+            writer.put(((), (), {}))
+        writer.flush()
+        writer.stop()
+    assert not writer.is_alive()
+
+
+def test_monitor_writer_thread_full_queue(tmp_path):
+    """Make sure that metrics are dropped, not waited for, when the writer thread queue is full."""
+    writer = MetricWriter(str(tmp_path), queue_size=2)
+    for i in range(5):
+        writer.put(((), (), {}))
+    assert writer.dropped == 3
+    with pytest.warns(UserWarning) as record:
+        writer.start()
+        writer.stop()
+    assert any("3 metrics dropped" in str(warning.message) for warning in record)
+
+
+def test_monitor_indexes_on_existing_db(testdir):
+    """Make sure that indexes are added to databases created without them."""
+    # create a temporary pytest test module
+    testdir.makepyfile(TEST_CONTENT)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    db.executescript(LEGACY_SCHEMA)
+    db.commit()
+    db.close()
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v")
+    result.assert_outcomes(passed=3)
+
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'ITEM_METRICS';")
+    assert {row[0] for row in cursor.fetchall()} == {
+        "ITEM_METRICS_ITEM_IDX",
+        "ITEM_METRICS_SESSION_IDX",
+        "ITEM_METRICS_ENV_IDX",
+        "ITEM_METRICS_START_IDX",
+    }
+
+
+def test_monitor_migrate_legacy_db(testdir):
+    """Make sure that databases created before schema versioning are upgraded in place."""
+    # create a temporary pytest test module
+    testdir.makepyfile(TEST_CONTENT)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    db.executescript(LEGACY_SCHEMA)
+    db.execute("INSERT INTO TEST_SESSIONS VALUES ('old', '2023-05-06T10:11:12.131415', '', '{}');")
+    db.execute(
+        "INSERT INTO TEST_METRICS VALUES ('old', 'env', '2023-05-06T10:11:13.000001', 'pkg', 'test_old', 'test_old',"
+        " 'pkg/test.py', 'function', '', 1.0, 0.5, 0.5, 1.0, 12.0);"
+    )
+    db.commit()
+    db.close()
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v")
+    result.assert_outcomes(passed=3)
+
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    assert cursor.execute("SELECT MAX(VERSION) FROM SCHEMA_VERSION;").fetchone()[0] == SCHEMA_VERSION
+    expected = datetime.datetime(2023, 5, 6, 10, 11, 13, 1).timestamp()
+    start = cursor.execute("SELECT ITEM_START_TIME FROM TEST_METRICS WHERE SESSION_H = 'old';").fetchone()[0]
+    assert start == round(expected * 1e6) * 1000
+    cursor.execute("SELECT RUN_DATE FROM TEST_SESSIONS_V1 WHERE SESSION_H = 'old';")
+    assert cursor.fetchone()[0] == "2023-05-06T10:11:12.131415"
+    cursor.execute("SELECT ITEM_START_TIME FROM TEST_METRICS_V1 WHERE SESSION_H = 'old';")
+    assert cursor.fetchone()[0] == "2023-05-06T10:11:13.000001"
+    cursor.execute("SELECT COUNT(*) FROM TEST_METRICS WHERE typeof(ITEM_START_TIME) = 'integer';")
+    assert cursor.fetchone()[0] == 4
+    cursor.execute("SELECT RUN_COUNT, TOTAL_TIME_MEAN, MEM_USAGE_MAX FROM TEST_STATS ORDER BY ITEM_ID;")
+    assert cursor.fetchall()[0] == (1, 1.0, 12.0)
+    cursor.execute("SELECT TOTAL_TIME_NS, USER_TIME_NS, KERNEL_TIME_NS FROM TEST_METRICS WHERE SESSION_H = 'old';")
+    assert cursor.fetchone() == (1_000_000_000, 500_000_000, 500_000_000)
+
+
+def test_monitor_migrate_null_components(tmp_path):
+    """Make sure that metrics of tests without component are linked to a single test identity once migrated."""
+    db_path = str(tmp_path / ".pymon")
+    db = sqlite3.connect(db_path)
+    db.executescript(LEGACY_SCHEMA)
+    db.execute("INSERT INTO TEST_SESSIONS VALUES ('old', '2023-05-06T10:11:12.131415', '', '{}');")
+    for component in (None, None, None, ""):
+        db.execute(
+            "INSERT INTO TEST_METRICS VALUES ('old', 'env', '2023-05-06T10:11:13.000001', 'pkg', 'test_old',"
+            " 'test_old', 'pkg/test.py', 'function', ?, 1.0, 0.5, 0.5, 1.0, 12.0);",
+            (component,),
+        )
+    db.commit()
+    db.close()
+
+    DBHandler(db_path).close()
+
+    db = sqlite3.connect(db_path)
+    cursor = db.cursor()
+    assert cursor.execute("SELECT COUNT(*) FROM TEST_ITEMS;").fetchone()[0] == 1
+    assert cursor.execute("SELECT COUNT(*) FROM ITEM_METRICS;").fetchone()[0] == 4
+    assert cursor.execute("SELECT COUNT(*) FROM TEST_METRICS;").fetchone()[0] == 4
+
+
+def test_monitor_null_component_identity(tmp_path):
+    """Make sure that a test without component is stored once whatever the number of sessions."""
+    db_path = str(tmp_path / ".pymon")
+    DBHandler(db_path).close()
+    with sqlite3.connect(db_path) as db:
+        db.execute("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')")
+    for i in range(3):
+        handler = DBHandler(db_path)
+        handler.insert_session(f"session_{i}", i, "", "{}")
+        handler.insert_metric(
+            f"session_{i}", "env", i, "test_a", "pkg", "test_a", "pkg/test.py", "function", None, 1, 0, 0, 0, 1
+        )
+        handler.close()
+
+    db = sqlite3.connect(db_path)
+    assert db.execute("SELECT COUNT(*) FROM TEST_ITEMS;").fetchone()[0] == 1
+    assert db.execute("SELECT COUNT(DISTINCT ITEM_ID), COUNT(*) FROM ITEM_METRICS;").fetchone() == (1, 3)
+
+
+def test_monitor_interned_test_items(testdir):
+    """Make sure that test identities are stored once whatever the number of sessions."""
+    # create a temporary pytest test module
+    testdir.makepyfile(TEST_CONTENT)
+
+    # run pytest twice with the following cmd args
+    for _ in range(2):
+        result = testdir.runpytest("-v", "--db-batch-size", "2")
+        result.assert_outcomes(passed=3)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    assert cursor.execute("SELECT COUNT(*) FROM TEST_ITEMS;").fetchone()[0] == 3
+    assert cursor.execute("SELECT COUNT(*) FROM ITEM_METRICS;").fetchone()[0] == 6
+    cursor.execute("SELECT ITEM, ITEM_PATH, KIND, COUNT(DISTINCT SESSION_H) FROM TEST_METRICS GROUP BY ITEM;")
+    assert cursor.fetchall() == [
+        ("test_a", "test_monitor_interned_test_items", "function", 2),
+        ("test_b", "test_monitor_interned_test_items", "function", 2),
+        ("test_c", "test_monitor_interned_test_items", "function", 2),
+    ]
+
+
+def test_monitor_retention_at_session_end(testdir):
+    """Make sure that raw metrics of old sessions are rolled up at the end of the session."""
+    # create a temporary pytest test module
+    testdir.makepyfile(TEST_CONTENT)
+
+    # run pytest three times with the following cmd args
+    for _ in range(3):
+        result = testdir.runpytest("-v", "--db-keep-sessions", "1")
+        result.assert_outcomes(passed=3)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    assert cursor.execute("SELECT COUNT(DISTINCT SESSION_H), COUNT(*) FROM TEST_METRICS;").fetchone() == (1, 3)
+    assert cursor.execute("SELECT COUNT(*), SUM(RUN_COUNT), SUM(SESSION_COUNT) FROM ITEM_ROLLUPS;").fetchone() == (
+        3,
+        6,
+        6,
+    )
+    assert cursor.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2
+
+
+def test_monitor_retention_cli(tmp_path):
+    """Make sure that the retention command summarizes the rolled up metrics."""
+    db_path = str(tmp_path / ".pymon")
+    handler = DBHandler(db_path)
+    handler.query("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')", ())
+    for i in range(11):
+        handler.insert_session(f"session_{i}", i, "", "{}")
+        handler.insert_metric(
+            f"session_{i}", "env", i, "test_a", "pkg", "test_a", "pkg/test.py", "function", "", i, 0, 0, 0, 10 * i
+        )
+    handler.close()
+
+    main(["--db", db_path, "retention", "--keep-sessions", "1"])
+
+    db = sqlite3.connect(db_path)
+    cursor = db.cursor()
+    assert cursor.execute("SELECT SESSION_H FROM TEST_METRICS;").fetchall() == [("session_10",)]
+    cursor.execute(
+        "SELECT FIRST_START_TIME, LAST_START_TIME, SESSION_COUNT, RUN_COUNT, TOTAL_TIME_MEAN, TOTAL_TIME_MIN,"
+        " TOTAL_TIME_MAX, TOTAL_TIME_P50, TOTAL_TIME_P95, MEM_USAGE_P50 FROM ITEM_ROLLUPS;"
+    )
+    (first, last, sessions, runs, mean, minimum, maximum, p50, p95, memory_p50) = cursor.fetchone()
+    assert (first, last, sessions, runs, mean, minimum, maximum) == (0, 9, 10, 10, 4.5, 0, 9)
+    # Quantiles are estimated from sketches, which can be merged with the ones of later roll ups.
+    assert (p50, p95, memory_p50) == pytest.approx((4, 8, 40), rel=0.01)
+
+
+@pytest.mark.parametrize("command", [["retention", "--keep-sessions", "1"], ["compact"], ["upgrade"]])
+def test_monitor_cli_missing_db(tmp_path, command):
+    """Make sure that maintenance commands do not create a database at a mistyped path."""
+    db_path = tmp_path / "missing.pymon"
+    with pytest.raises(SystemExit, match="no database found"):
+        main(["--db", str(db_path), *command])
+    assert not db_path.exists()
+
+
+def test_monitor_retention_merged_rollups(tmp_path):
+    """Make sure that successive roll ups are merged into a single summary per test."""
+    db_path = str(tmp_path / ".pymon")
+    handler = DBHandler(db_path)
+    handler.query("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')", ())
+    for i in range(4):
+        handler.insert_session(f"session_{i}", i, "", "{}")
+        handler.insert_metric(
+            f"session_{i}", "env", i, "test_a", "pkg", "test_a", "pkg/test.py", "function", "", i, 0, 0, 0, 10 * i
+        )
+        handler.flush()
+        # Sessions rolled up by previous calls are not counted again.
+        assert handler.apply_retention(keep_sessions=2) == ((1, 1) if i >= 2 else (0, 0))
+    handler.close()
+
+    db = sqlite3.connect(db_path)
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT FIRST_START_TIME, LAST_START_TIME, SESSION_COUNT, RUN_COUNT, TOTAL_TIME_MEAN, TOTAL_TIME_M2,"
+        " TOTAL_TIME_MAX FROM ITEM_ROLLUPS;"
+    )
+    assert cursor.fetchall() == [(0, 1, 2, 2, 0.5, 0.5, 1)]
+
+
+def test_monitor_stats_updated_at_session_end(testdir):
+    """Make sure that per test statistics account for each session once."""
+    # create a temporary pytest test module
+    testdir.makepyfile(TEST_CONTENT)
+
+    # run pytest twice with the following cmd args
+    for _ in range(2):
+        result = testdir.runpytest("-v", "--db-keep-sessions", "1")
+        result.assert_outcomes(passed=3)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    assert cursor.execute("SELECT COUNT(*) FROM STATS_SESSIONS;").fetchone()[0] == 2
+    cursor.execute("SELECT RUN_COUNT, TOTAL_TIME_MIN, TOTAL_TIME_MAX, MEM_USAGE_SKETCH FROM TEST_STATS;")
+    stats = cursor.fetchall()
+    assert len(stats) == 3
+    for count, time_min, time_max, sketch in stats:
+        assert count == 2
+        assert time_min <= time_max
+        assert QuantileSketch.from_json(sketch).count == 2
+
+
+def test_monitor_concurrent_writers(tmp_path):
+    """Make sure that handlers sharing a database do not lose metrics."""
+    db_path = str(tmp_path / ".pymon")
+    DBHandler(db_path).close()
+    with sqlite3.connect(db_path) as db:
+        db.execute("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')")
+
+    def write(writer):
+        handler = DBHandler(db_path, batch_size=5)
+        handler.insert_session(f"session_{writer}", writer, "", "{}")
+        for i in range(50):
+            handler.insert_metric(
+                f"session_{writer}",
+                "env",
+                i,
+                f"test_{i}",
+                "pkg",
+                f"test_{i}",
+                "pkg/test.py",
+                "function",
+                "",
+                1,
+                0,
+                0,
+                0,
+                1,
+            )
+        handler.close()
+
+    writers = [threading.Thread(target=write, args=(writer,)) for writer in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    db = sqlite3.connect(db_path)
+    assert db.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+    assert db.execute("SELECT COUNT(*), COUNT(DISTINCT ITEM_ID) FROM ITEM_METRICS;").fetchone() == (200, 50)
+
+
+def test_monitor_retry_on_busy():
+    """Make sure that operations failing on a locked database are retried, other errors being raised."""
+    errors = [sqlite3.OperationalError("database is locked")] * 2
+
+    @retry_on_busy
+    def operation():
+        if errors:
+            raise errors.pop()
+        return "done"
+
+    assert operation() == "done"
+
+    errors = [sqlite3.OperationalError("no such table: TEST_METRICS")]
+    with pytest.raises(sqlite3.OperationalError, match="no such table"):
+        operation()
+
+
+def test_monitor_metric_details_retention(tmp_path):
+    """Make sure that details of a metric are linked to it and rolled up along with it."""
+    db_path = str(tmp_path / ".pymon")
+    handler = DBHandler(db_path)
+    handler.query("INSERT INTO EXECUTION_CONTEXTS(ENV_H) VALUES ('env')", ())
+    for i in range(2):
+        handler.insert_session(f"session_{i}", i, "", "{}")
+        handler.insert_metric(
+            f"session_{i}",
+            "env",
+            i,
+            "test_a",
+            "pkg",
+            "test_a",
+            "pkg/test.py",
+            "function",
+            "",
+            1,
+            0,
+            0,
+            0,
+            1,
+            details={"TEST_TRACEMALLOC": [(100 + i, 10, 1)], "TEST_ALLOCATIONS": [(1, "test.py:1", 10, 1)]},
+        )
+    handler.close()
+
+    db = sqlite3.connect(db_path)
+    cursor = db.cursor()
+    cursor.execute("SELECT M.SESSION_H, T.TRACED_PEAK FROM TEST_METRICS M JOIN TEST_TRACEMALLOC T USING (METRIC_ID);")
+    assert cursor.fetchall() == [("session_0", 100), ("session_1", 101)]
+
+    main(["--db", db_path, "retention", "--keep-sessions", "1"])
+    assert cursor.execute("SELECT TRACED_PEAK FROM TEST_TRACEMALLOC;").fetchall() == [(101,)]
+    assert cursor.execute("SELECT COUNT(*) FROM TEST_ALLOCATIONS;").fetchone()[0] == 1
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import pathlib
+import sqlite3
+import threading
+import time
+
+from pytest_monitor.threads import ThreadTracer
+
+
+def burn(seconds):
+    start = time.thread_time()
+    while time.thread_time() - start < seconds:
+        pass
+
+
+def test_thread_tracer():
+    tracer = ThreadTracer(0.005)
+    try:
+        tracer.start()
+        start = time.perf_counter_ns()
+        workers = [threading.Thread(target=burn, args=(0.2,)) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        burn(0.1)
+        # Workers ending before the stop are accounted from their last sample
+        for worker in workers:
+            worker.join()
+        threads = tracer.stop(time.perf_counter_ns() - start)
+
+        tracer.start()
+        burn(0.1)
+        single = tracer.stop(100_000_000)
+
+        # Per-thread CPU times have the resolution of the clock tick: only assert relations which do not depend on it
+        assert threads.thread_count >= 3 and single.thread_count >= 1
+        assert threads.busiest_thread_share < single.busiest_thread_share
+        assert threads.parallelism > 0 and single.parallelism > 0
+    finally:
+        tracer.close()
+
+
+def test_monitor_threads_option(testdir):
+    """Make sure that the spread of the CPU time across threads is recorded when requested."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import threading
+    import time
+
+
+    def burn(seconds):
+        start = time.thread_time()
+        while time.thread_time() - start < seconds:
+            pass
+
+
+    def test_threads():
+        workers = [threading.Thread(target=burn, args=(0.2,)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        time.sleep(0.1)
+        for worker in workers:
+            worker.join()
+
+
+    def test_single():
+        burn(0.2)
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--monitor-threads")
+    result.assert_outcomes(passed=2)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM, THREAD_COUNT, BUSIEST_THREAD_SHARE, EFFECTIVE_PARALLELISM FROM TEST_METRICS;")
+    metrics = {item: row for item, *row in cursor.fetchall()}
+    assert set(metrics) == {"test_threads", "test_single"}
+    single_count, single_share, single_parallelism = metrics["test_single"]
+    thread_count, busiest_share, parallelism = metrics["test_threads"]
+    assert thread_count >= 4 and single_count >= 1
+    assert busiest_share < single_share
+    assert parallelism > 0 and single_parallelism > 0
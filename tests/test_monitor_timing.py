@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import pathlib
+import sqlite3
+import time
+
+from pytest_monitor.timing import Stopwatch, Timings
+
+
+def test_stopwatch():
+    stopwatch = Stopwatch()
+    start = time.process_time()
+    while time.process_time() - start < 0.05:
+        pass
+    timings = stopwatch.stop()
+    assert all(type(duration) is int for duration in timings)
+    assert timings.total >= 50_000_000
+    assert timings.user + timings.kernel >= 40_000_000
+    assert abs(stopwatch.start_time_ns - time.time_ns()) < 10**9
+    assert Timings(1_500_000, 1_000_000, 0).seconds() == (0.0015, 0.001, 0.0)
+
+
+def test_monitor_durations_in_ns(testdir):
+    """Make sure that durations are stored as integer nanoseconds, sub-millisecond tests included."""
+    # create a temporary pytest test module
+    testdir.makepyfile(
+        """
+    import time
+
+
+    def test_short():
+        assert True
+
+
+    def test_sleep():
+        time.sleep(0.05)
+"""
+    )
+
+    # run pytest with the following cmd args
+    result = testdir.runpytest("-v", "--restrict-scope-to", "function,module")
+    result.assert_outcomes(passed=2)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM, KIND, TOTAL_TIME, TOTAL_TIME_NS, USER_TIME_NS, KERNEL_TIME_NS FROM TEST_METRICS;")
+    metrics = {item: row for item, *row in cursor.fetchall()}
+    assert set(metrics) == {"test_short", "test_sleep", "test_monitor_durations_in_ns"}
+    for kind, total_time, total_ns, user_ns, kernel_ns in metrics.values():
+        assert all(type(duration) is int for duration in (total_ns, user_ns, kernel_ns))
+        assert 0 < total_ns and total_time == total_ns / 1e9
+    assert metrics["test_short"][2] < 1_000_000
+    assert 50_000_000 <= metrics["test_sleep"][2] < metrics["test_monitor_durations_in_ns"][2]